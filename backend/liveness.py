@@ -0,0 +1,69 @@
+"""
+Heartbeat-based liveness for active alerts.
+
+While an alert is active the requester's app sends a heartbeat every few
+seconds. Heartbeats only touch memory: they are coalesced per alert by a
+TelemetryWriter and flushed as one unordered, unacknowledged bulk write per
+interval. AlertSweeper periodically flushes what is pending (acknowledged,
+and not sweeping at all if that fails) and closes, with a single update,
+every active alert whose last heartbeat is older than the timeout, so an
+alert whose requester went away does not stay active forever.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from metrics import ALERTS_AUTO_CLOSED
+from write_behind import TelemetryWriter
+
+logger = logging.getLogger(__name__)
+
+
+class AlertSweeper:
+    def __init__(self, repository: Callable, heartbeats: TelemetryWriter, timeout: float = 60, interval: float = 15):
+        # repository() returns the alert repository (resolved per sweep, the repositories can be swapped)
+        self.repository = repository
+        self.heartbeats = heartbeats
+        self.timeout = timeout
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        """Start sweeping on the running loop"""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Alert sweep failed: {e}")
+
+    async def sweep(self, now: datetime = None) -> int:
+        """Close the alerts that missed their heartbeats; returns how many were closed"""
+        repository = self.repository()
+        # Heartbeats still in memory must count, or a live alert could be closed: write them
+        # acknowledged (the writer's own flushes are not), so they land before the update below
+        failed = await self.heartbeats.flush(lambda heartbeats: repository.record_heartbeats(heartbeats, acknowledged=True))
+        if failed:
+            logger.warning(f"Skipping the alert sweep: {failed} heartbeats could not be written")
+            return 0
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=self.timeout)
+        closed = await repository.close_stale(cutoff.isoformat(), now.isoformat())
+        if closed:
+            ALERTS_AUTO_CLOSED.inc(closed)
+            logger.info(f"Closed {closed} alerts without a heartbeat since {cutoff.isoformat()}")
+        return closed
@@ -0,0 +1,114 @@
+"""
+Event-loop lag watchdog.
+
+A heartbeat task sleeps for a short interval and records how late it wakes
+up: that lateness is the scheduling lag every request on the loop sees. A
+separate thread watches the heartbeat; when it stops beating for longer than
+the threshold, something is blocking the loop (a bcrypt call made inline,
+validating a huge list, a long strftime loop...) and the thread snapshots the
+loop thread's stack while it is still stuck. The route is read from the ASGI
+scope found on that stack.
+
+Each stall is exported as metrics and logged as one JSON line once the loop
+recovers.
+"""
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+STACK_DEPTH = 20
+
+
+def route_on_stack(frame) -> Optional[str]:
+    """Route template (or raw path) of the ASGI request whose frames are on the stack"""
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            route = scope.get("route")
+            if route is not None:
+                return f"{scope.get('method')} {route.path}"
+            return f"{scope.get('method')} {scope.get('path')}"
+        frame = frame.f_back
+    return None
+
+
+class EventLoopWatchdog:
+    def __init__(self, interval: float = 0.02, threshold: float = 0.1, history: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls = deque(maxlen=history)
+        self._loop_thread_id = None
+        self._last_beat = time.perf_counter()
+        self._capture = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start monitoring the running loop (call from inside it)"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+            self._last_beat = now
+            EVENT_LOOP_LAG.observe(lag)
+            capture, self._capture = self._capture, None
+            if lag >= self.threshold:
+                self._report(lag, capture)
+
+    def _watch(self):
+        """Runs in its own thread: snapshot the loop thread's stack while it is blocked"""
+        while not self._stopped.wait(self.interval):
+            stalled = time.perf_counter() - self._last_beat - self.interval
+            if stalled < self.threshold or self._capture is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._capture = {
+                "route": route_on_stack(frame),
+                "stack": [line.rstrip() for line in traceback.format_stack(frame, limit=STACK_DEPTH)],
+            }
+
+    def _report(self, lag: float, capture: Optional[dict]):
+        capture = capture or {}
+        route = capture.get("route") or "unknown"
+        EVENT_LOOP_STALLS.labels(route).inc()
+        record = {
+            "event": "event_loop_blocked",
+            "lag_ms": round(lag * 1000, 1),
+            "route": route,
+            "stack": capture.get("stack", []),
+        }
+        self.stalls.append(record)
+        logger.warning(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,236 @@
+"""
+Prometheus metrics for the SafeZone API, served at /metrics.
+
+Metric objects live on the default registry so every module can import and
+record them. MongoCommandMetrics and MongoPoolMetrics are PyMongo listeners
+passed to create_mongo_client; the HTTP histogram is recorded by the middleware in
+server.py.
+"""
+import threading
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+# Latency buckets in seconds, from a sub-millisecond point lookup to a slow bulk import batch
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "safezone_http_request_duration_seconds",
+    "Time to produce a response, by route template and status code",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "safezone_http_requests_in_progress",
+    "Requests currently being handled",
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "safezone_mongo_command_duration_seconds",
+    "MongoDB command round trip as seen by the driver",
+    ["collection", "command", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+BCRYPT_QUEUE_SECONDS = Histogram(
+    "safezone_bcrypt_queue_seconds",
+    "Time a hash or verify waited for a free bcrypt pool thread",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+BCRYPT_SECONDS = Histogram(
+    "safezone_bcrypt_seconds",
+    "Time spent hashing or verifying on the bcrypt pool",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+ALERT_FANOUT = Histogram(
+    "safezone_alert_fanout_recipients",
+    "Neighbors notified per alert",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    "safezone_mongo_pool_checkout_wait_seconds",
+    "Time an operation waited for a pooled connection",
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "safezone_mongo_pool_checkout_failures_total",
+    "Connection checkouts that failed, by reason (timeout = pool exhausted)",
+    ["reason"],
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "safezone_mongo_pool_connections",
+    "Open pooled connections, by server",
+    ["address"],
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "safezone_mongo_pool_checked_out_connections",
+    "Pooled connections currently in use, by server",
+    ["address"],
+)
+EVENT_LOOP_LAG = Histogram(
+    "safezone_event_loop_lag_seconds",
+    "How late the loop watchdog's heartbeat woke up",
+    buckets=LATENCY_BUCKETS,
+)
+EVENT_LOOP_STALLS = Counter(
+    "safezone_event_loop_stalls_total",
+    "Times the event loop was blocked beyond the watchdog threshold, by the route running at the time",
+    ["route"],
+)
+ALERTS_AUTO_CLOSED = Counter(
+    "safezone_alerts_auto_closed_total",
+    "Active alerts closed because their requester stopped sending heartbeats",
+)
+ALERT_CREATE_SECONDS = Histogram(
+    "safezone_alert_create_seconds",
+    "Time from receiving a new alert to having it stored, as seen by the requester",
+    buckets=LATENCY_BUCKETS,
+)
+OUTBOX_PENDING = Gauge(
+    "safezone_notification_outbox_pending",
+    "Outbox entries not yet dispatched (due or waiting for a retry)",
+)
+OUTBOX_LAG = Histogram(
+    "safezone_notification_outbox_lag_seconds",
+    "Time from an alert being committed to its outbox entry being dispatched",
+    buckets=LATENCY_BUCKETS + (30, 60, 300),
+)
+OUTBOX_DELIVERIES = Counter(
+    "safezone_notification_outbox_deliveries_total",
+    "Outbox dispatch attempts by outcome (delivered, retried, failed)",
+    ["outcome"],
+)
+NOTIFY_MESSAGES = Counter(
+    "safezone_notify_messages_total",
+    "Outbound alert messages by provider and outcome (sent, retried, rejected, failed)",
+    ["provider", "outcome"],
+)
+NOTIFY_QUEUED = Gauge(
+    "safezone_notify_queued_events",
+    "Alert events waiting for a notification worker",
+)
+NOTIFY_BATCH_SECONDS = Histogram(
+    "safezone_notify_batch_seconds",
+    "Time for one provider call, by provider",
+    ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+TELEMETRY_UPDATES = Counter(
+    "safezone_telemetry_updates_total",
+    "Write-behind updates by writer and outcome (queued, coalesced, dropped, written, failed)",
+    ["writer", "outcome"],
+)
+TELEMETRY_PENDING = Gauge(
+    "safezone_telemetry_pending_keys",
+    "Keys (users, alerts) with updates waiting for the writer's next flush",
+    ["writer"],
+)
+TELEMETRY_FLUSH_SIZE = Histogram(
+    "safezone_telemetry_flush_keys",
+    "Keys written per write-behind bulk write",
+    ["writer"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+TELEMETRY_FLUSH_SECONDS = Histogram(
+    "safezone_telemetry_flush_seconds",
+    "Time to write one write-behind bulk write",
+    ["writer"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Connection housekeeping that would only add noise
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._collections.pop(event.request_id, None)
+        if collection is None:
+            return
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool health: checkout wait, exhaustion and connection counts"""
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).set(0)
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).set(0)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+        MONGO_POOL_CHECKOUT_WAIT.observe(event.duration)
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKOUT_WAIT.observe(event.duration)
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+
+def timed_on_pool(operation: str, func):
+    """Wrap func for run_in_executor so pool queue time and run time are recorded"""
+    submitted = time.perf_counter()
+
+    def run(*args):
+        started = time.perf_counter()
+        BCRYPT_QUEUE_SECONDS.labels(operation).observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            BCRYPT_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    return run
+
+
+def render_latest():
+    """(body, content type) for the /metrics response"""
+    return generate_latest(), CONTENT_TYPE_LATEST
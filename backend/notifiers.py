@@ -0,0 +1,360 @@
+"""
+Outbound alert notifications: web push, SMS and webhooks.
+
+NotificationDispatcher subscribes to the outbox's push events and queues
+them, so the outbox handler returns as soon as the inbox is written;
+workers then send each alert to the street's residents through provider
+adapters. A full queue fails the event and the outbox retries it later;
+events still queued at shutdown are lost (the inbox already has them).
+Every
+provider has its own concurrency limit and batch size (1 when the channel
+has no batch API). A failed batch is retried with exponential backoff;
+what still fails after max_attempts is counted and logged instead of
+failing the event, because a redelivered event would be sent to everyone
+again. Redelivered events are skipped by event id.
+
+Residents opt in per channel with PUT /api/notification-channels; the
+webhook gets every target user id. FakeProvider records what it is asked
+to send, for tests.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import NOTIFY_BATCH_SECONDS, NOTIFY_MESSAGES, NOTIFY_QUEUED
+from outbox import Deduplicator
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentFailure(Exception):
+    """The provider rejected the batch for good (expired subscription, invalid number): do not retry"""
+
+
+def alert_text(event: dict) -> str:
+    return f"SafeZone: alerta de {event['alert_type']}! {event['requester_name']} - {event['requester_address']}"
+
+
+def alert_payload(event: dict) -> dict:
+    """The event without its recipient list"""
+    return {key: value for key, value in event.items() if key != "target_users"}
+
+
+class Provider:
+    """Adapter for one outbound channel; subclasses implement send()"""
+
+    name = "provider"
+    # Key in the user's notification_channels holding the address; None sends to every target user id
+    channel: Optional[str] = None
+
+    def __init__(self, concurrency: int = 10, max_batch: int = 1, max_attempts: int = 3, base_backoff: float = 0.2):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+
+    async def send(self, event: dict, messages: List[dict]) -> List[dict]:
+        """Send one batch of {"user_id", "address"} messages; returns the ones that failed and may be retried"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class HttpProvider(Provider):
+    """A provider talking to an HTTP API through one pooled client"""
+
+    def __init__(self, timeout: float = 5, **options):
+        super().__init__(**options)
+        self.timeout = timeout
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def post(self, url: str, **kwargs):
+        response = await self.client().post(url, **kwargs)
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentFailure(f"{self.name} rejected the request: HTTP {response.status_code}")
+        response.raise_for_status()
+        return response
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class WebPushProvider(Provider):
+    """Web Push with VAPID (pywebpush); the address is the browser's subscription info"""
+
+    name = "web_push"
+    channel = "web_push"
+
+    def __init__(self, vapid_private_key: str, vapid_subject: str, **options):
+        super().__init__(**options)
+        # Optional dependency, only needed once web push is configured
+        from pywebpush import WebPushException, webpush
+        self._webpush = webpush
+        self._error = WebPushException
+        self.vapid_private_key = vapid_private_key
+        self.vapid_subject = vapid_subject
+
+    async def send(self, event: dict, messages: List[dict]) -> List[dict]:
+        # pywebpush is synchronous: one request per subscription on the default thread pool
+        data = json.dumps(alert_payload(event), ensure_ascii=False)
+        loop = asyncio.get_running_loop()
+        for message in messages:
+            request = functools.partial(
+                self._webpush, subscription_info=message["address"], data=data, timeout=5,
+                vapid_private_key=self.vapid_private_key, vapid_claims={"sub": self.vapid_subject}
+            )
+            try:
+                await loop.run_in_executor(None, request)
+            except self._error as e:
+                # 404/410: the browser dropped the subscription
+                if e.response is not None and e.response.status_code in (404, 410):
+                    raise PermanentFailure(f"Web push subscription gone for user {message['user_id']}")
+                raise
+        return []
+
+
+class SmsProvider(HttpProvider):
+    """SMS through an HTTP gateway: POST {"to", "body"} with a bearer token, one message per request"""
+
+    name = "sms"
+    channel = "sms"
+
+    def __init__(self, gateway_url: str, token: str, **options):
+        super().__init__(**options)
+        self.gateway_url = gateway_url
+        self.token = token
+
+    async def send(self, event: dict, messages: List[dict]) -> List[dict]:
+        body = alert_text(event)
+        for message in messages:
+            await self.post(
+                self.gateway_url, json={"to": message["address"], "body": body},
+                headers={"Authorization": f"Bearer {self.token}"}
+            )
+        return []
+
+
+class WebhookProvider(HttpProvider):
+    """POSTs the alert with a batch of recipient user ids to a configured URL"""
+
+    name = "webhook"
+
+    def __init__(self, url: str, **options):
+        super().__init__(**options)
+        self.url = url
+
+    async def send(self, event: dict, messages: List[dict]) -> List[dict]:
+        await self.post(self.url, json={
+            "event": alert_payload(event),
+            "recipients": [message["user_id"] for message in messages]
+        })
+        return []
+
+
+class FakeProvider(Provider):
+    """Records every batch it is asked to send; latency and failures can be injected"""
+
+    def __init__(self, name: str = "fake", channel: Optional[str] = None, latency: float = 0.0,
+                 fail_first: int = 0, **options):
+        super().__init__(**options)
+        self.name = name
+        self.channel = channel
+        self.latency = latency
+        # The first fail_first calls raise, as a flaky provider would
+        self.fail_first = fail_first
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.sent = []
+
+    async def send(self, event: dict, messages: List[dict]) -> List[dict]:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.calls <= self.fail_first:
+                raise ConnectionError("fake provider unavailable")
+            self.sent.append((event["id"], [message["user_id"] for message in messages]))
+            return []
+        finally:
+            self.in_flight -= 1
+
+
+class NotificationDispatcher:
+    def __init__(self, providers: List[Provider], channels: Callable[[List[str]], Awaitable[Dict[str, dict]]],
+                 workers: int = 4, max_queued: int = 10000, max_attempts: int = 3, base_backoff: float = 0.5):
+        # channels(user_ids) returns {user_id: notification_channels} for the users that have any
+        self.providers = providers
+        self.channels = channels
+        self.seen = Deduplicator()
+        self.workers = workers
+        self.max_queued = max_queued
+        # For dispatch() itself failing, i.e. the channel lookup; provider batches retry on their own
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.queue = None
+        self._tasks = []
+
+    def start(self):
+        """Start the delivery workers on the running loop; until then events are dispatched inline"""
+        self.queue = asyncio.Queue(self.max_queued)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run()) for _ in range(self.workers)]
+
+    async def on_event(self, event: dict):
+        """PushEventBus subscriber"""
+        if event.get("type") != "emergency_alert" or not self.providers:
+            return
+        if not self.seen.first_time(event["id"]):
+            return
+        if self.queue is None:
+            try:
+                await self.dispatch(event)
+            except Exception:
+                # Nothing was sent (the channel lookup failed): the outbox retry must not be skipped
+                self.seen.forget(event["id"])
+                raise
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.seen.forget(event["id"])
+            raise RuntimeError(f"Notification queue full ({self.max_queued} events), event {event['id']} left to the outbox retry")
+        NOTIFY_QUEUED.set(self.queue.qsize())
+
+    async def drain(self):
+        """Wait until every queued event has been handled"""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def _run(self):
+        while True:
+            event = await self.queue.get()
+            try:
+                await self._deliver(event)
+            finally:
+                self.queue.task_done()
+                NOTIFY_QUEUED.set(self.queue.qsize())
+
+    async def _deliver(self, event: dict):
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.dispatch(event)
+                return
+            except Exception as e:
+                error = e
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self.base_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1))
+        # Nothing was sent: a redelivery of the event may try again
+        self.seen.forget(event["id"])
+        logger.error(f"Giving up on notifying event {event['id']} after {self.max_attempts} attempts: {error}")
+
+    async def dispatch(self, event: dict) -> Dict[str, int]:
+        """Send event to its target users through every provider; returns messages delivered per provider"""
+        targets = event["target_users"]
+        channels = await self.channels(targets) if any(p.channel for p in self.providers) and targets else {}
+        delivered = await asyncio.gather(*(
+            self._send_all(provider, event, self._messages(provider, targets, channels))
+            for provider in self.providers
+        ))
+        return {provider.name: count for provider, count in zip(self.providers, delivered)}
+
+    @staticmethod
+    def _messages(provider: Provider, targets: List[str], channels: Dict[str, dict]) -> List[dict]:
+        if provider.channel is None:
+            return [{"user_id": user_id, "address": None} for user_id in targets]
+        return [
+            {"user_id": user_id, "address": channels[user_id][provider.channel]}
+            for user_id in targets if channels.get(user_id, {}).get(provider.channel)
+        ]
+
+    async def _send_all(self, provider: Provider, event: dict, messages: List[dict]) -> int:
+        batches = [messages[start:start + provider.max_batch] for start in range(0, len(messages), provider.max_batch)]
+        return sum(await asyncio.gather(*(self._send_batch(provider, event, batch) for batch in batches)))
+
+    async def _send_batch(self, provider: Provider, event: dict, batch: List[dict]) -> int:
+        """Send with retries; returns how many messages of the batch were delivered"""
+        pending = batch
+        for attempt in range(1, provider.max_attempts + 1):
+            error = None
+            async with provider.semaphore:
+                started = time.perf_counter()
+                try:
+                    failed = await provider.send(event, pending)
+                except PermanentFailure as e:
+                    NOTIFY_MESSAGES.labels(provider.name, "rejected").inc(len(pending))
+                    logger.warning(f"{provider.name}: {e}")
+                    return len(batch) - len(pending)
+                except Exception as e:
+                    failed, error = pending, e
+                NOTIFY_BATCH_SECONDS.labels(provider.name).observe(time.perf_counter() - started)
+
+            NOTIFY_MESSAGES.labels(provider.name, "sent").inc(len(pending) - len(failed))
+            if not failed:
+                return len(batch)
+            pending = failed
+            if attempt < provider.max_attempts:
+                NOTIFY_MESSAGES.labels(provider.name, "retried").inc(len(pending))
+                # The semaphore is released while backing off, other batches keep going
+                await asyncio.sleep(provider.base_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1))
+
+        NOTIFY_MESSAGES.labels(provider.name, "failed").inc(len(pending))
+        logger.error(f"{provider.name}: {len(pending)} messages for event {event['id']} failed after "
+                     f"{provider.max_attempts} attempts: {error or 'reported as failed by the provider'}")
+        return len(batch) - len(pending)
+
+    async def close(self, timeout: float = 10):
+        """Give queued events timeout seconds to go out, then stop the workers and close the providers"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self.queue.qsize()} notification events dropped at shutdown")
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+            self.queue = None
+        for provider in self.providers:
+            await provider.close()
+
+
+def providers_from_env(environ=None) -> List[Provider]:
+    """Providers configured by the environment; none means alerts are only shown in the app"""
+    environ = os.environ if environ is None else environ
+    providers = []
+    if environ.get("WEBPUSH_VAPID_PRIVATE_KEY"):
+        providers.append(WebPushProvider(
+            environ["WEBPUSH_VAPID_PRIVATE_KEY"],
+            environ.get("WEBPUSH_VAPID_SUBJECT", "mailto:suporte@safezone.app"),
+            concurrency=int(environ.get("WEBPUSH_CONCURRENCY", 50))
+        ))
+    if environ.get("SMS_GATEWAY_URL"):
+        providers.append(SmsProvider(
+            environ["SMS_GATEWAY_URL"],
+            environ.get("SMS_GATEWAY_TOKEN", ""),
+            concurrency=int(environ.get("SMS_CONCURRENCY", 10))
+        ))
+    if environ.get("NOTIFY_WEBHOOK_URL"):
+        providers.append(WebhookProvider(
+            environ["NOTIFY_WEBHOOK_URL"],
+            concurrency=int(environ.get("NOTIFY_WEBHOOK_CONCURRENCY", 4)),
+            max_batch=int(environ.get("NOTIFY_WEBHOOK_BATCH_SIZE", 500))
+        ))
+    return providers
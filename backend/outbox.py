@@ -0,0 +1,169 @@
+"""
+Transactional outbox for the side effects of a new alert.
+
+create_alert stores the alert and an outbox entry in the same transaction
+and returns; OutboxDispatcher drains due entries in batches in the
+background. Each entry is claimed with a lease, handed to the handler and
+marked done; a handler failure schedules a retry with exponential backoff
+until max_attempts, after which the entry is marked failed and kept for
+inspection. A dispatcher that dies mid-batch leaves its claims to expire,
+so every entry is handled at least once and possibly more than once:
+handlers and event subscribers must be idempotent (see Deduplicator).
+"""
+import asyncio
+import logging
+import random
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from metrics import OUTBOX_DELIVERIES, OUTBOX_LAG, OUTBOX_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+def aware(value: datetime) -> datetime:
+    """Dates come back from MongoDB naive (in UTC)"""
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class OutboxDispatcher:
+    def __init__(self, repository: Callable, handle: Callable[[dict], Awaitable], batch_size: int = 100,
+                 poll_interval: float = 1.0, lease_seconds: float = 30, max_attempts: int = 8,
+                 base_backoff: float = 0.5, max_backoff: float = 300):
+        # repository() returns the outbox repository (resolved per batch, the repositories can be swapped)
+        self.repository = repository
+        self.handle = handle
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = asyncio.Lock()
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        """Start draining on the running loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.drain()
+        except Exception as e:
+            logger.warning(f"Outbox entries left for the next start: {e}")
+
+    def wake(self):
+        """Dispatch now instead of at the next poll (a new entry was committed)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self):
+        """Dispatch until no entry is due"""
+        while await self.dispatch_once():
+            pass
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.drain()
+                OUTBOX_PENDING.set(await self.repository().count_pending())
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+
+    async def dispatch_once(self) -> int:
+        """Claim and handle one batch of due entries; returns how many were claimed"""
+        async with self._lock:
+            repository = self.repository()
+            now = datetime.now(timezone.utc)
+            entries = await repository.claim_due(now, self.lease_seconds, self.batch_size)
+            if not entries:
+                return 0
+
+            outcomes = await asyncio.gather(*(self._attempt(entry) for entry in entries))
+            delivered = [entry for entry, error in zip(entries, outcomes) if error is None]
+            finished = datetime.now(timezone.utc)
+            if delivered:
+                await repository.complete([entry["id"] for entry in delivered], finished)
+                for entry in delivered:
+                    OUTBOX_LAG.observe((finished - aware(entry["created_at"])).total_seconds())
+                OUTBOX_DELIVERIES.labels("delivered").inc(len(delivered))
+
+            for entry, error in zip(entries, outcomes):
+                if error is not None:
+                    await self._reschedule(repository, entry, error, finished)
+            return len(entries)
+
+    async def _attempt(self, entry: dict):
+        """None on success, else the error"""
+        try:
+            await self.handle(entry)
+        except Exception as e:
+            return e
+        return None
+
+    async def _reschedule(self, repository, entry: dict, error: Exception, now: datetime):
+        attempts = entry.get("attempts", 0) + 1
+        if attempts >= self.max_attempts:
+            OUTBOX_DELIVERIES.labels("failed").inc()
+            logger.error(f"Giving up on outbox entry {entry['id']} after {attempts} attempts: {error}")
+            await repository.retry(entry["id"], attempts, None, str(error))
+            return
+        # Full jitter keeps entries that failed together from retrying together
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+        OUTBOX_DELIVERIES.labels("retried").inc()
+        logger.warning(f"Outbox entry {entry['id']} failed (attempt {attempts}), retrying in {backoff:.1f}s: {error}")
+        await repository.retry(entry["id"], attempts, now + timedelta(seconds=backoff), str(error))
+
+
+class PushEventBus:
+    """
+    Fans dispatched events out to subscribers. An event is published again
+    when its outbox entry is retried, so subscribers deduplicate on
+    event["id"]; a subscriber that raises makes the entry retry.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, callback: Callable[[dict], Awaitable]):
+        self.subscribers.append(callback)
+
+    async def publish(self, event: dict):
+        await asyncio.gather(*(callback(event) for callback in self.subscribers))
+
+
+class Deduplicator:
+    """The last capacity event ids seen, for consumers of at-least-once events"""
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.seen = OrderedDict()
+
+    def first_time(self, event_id: str) -> bool:
+        if event_id in self.seen:
+            self.seen.move_to_end(event_id)
+            return False
+        self.seen[event_id] = True
+        while len(self.seen) > self.capacity:
+            self.seen.popitem(last=False)
+        return True
+
+    def forget(self, event_id: str):
+        """Let event_id through again (its handling failed and it will be redelivered)"""
+        self.seen.pop(event_id, None)
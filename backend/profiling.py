@@ -0,0 +1,53 @@
+"""
+On-demand request profiling for admins.
+
+An admin sends "X-Profile: html" (or "speedscope") to get the sampling
+profile of the handler back instead of its response, or "X-Profile: store"
+to get the normal response plus an X-Profile-Id header; stored profiles are
+served at /api/admin/debug/profiles/{id}. Without the header nothing is
+imported or sampled, so there is no cost when profiling is off.
+"""
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODES = ("html", "speedscope", "store")
+# Sampling interval in seconds
+PROFILE_INTERVAL = 0.001
+MAX_STORED_PROFILES = 20
+
+
+def start_profiler():
+    from pyinstrument import Profiler
+
+    # async_mode follows the request across awaits instead of sampling the idle loop
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def render_profile(profiler, mode: str):
+    """(body, media type) of a stopped profiler"""
+    if mode == "speedscope":
+        from pyinstrument.renderers import SpeedscopeRenderer
+        return profiler.output(renderer=SpeedscopeRenderer()), "application/json"
+    return profiler.output_html(), "text/html"
+
+
+class ProfileStore:
+    """The most recent stored profiles, by id"""
+
+    def __init__(self, capacity: int = MAX_STORED_PROFILES):
+        self.capacity = capacity
+        self.profiles = OrderedDict()
+
+    def add(self, route: str, html: str) -> str:
+        profile_id = str(uuid.uuid4())
+        self.profiles[profile_id] = {"route": route, "html": html}
+        while len(self.profiles) > self.capacity:
+            self.profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return self.profiles.get(profile_id)
@@ -0,0 +1,1213 @@
+"""
+Data access layer for the SafeZone API.
+
+Every collection has a repository with the queries the handlers need.
+MongoRepositories runs them against a Motor/PyMongo database and
+InMemoryRepositories keeps plain dicts in process, so the whole API can be
+tested and benchmarked without a database (DATA_BACKEND=memory).
+
+Documents are exchanged in their stored shape (the output of
+prepare_for_mongo), so both backends hand the handlers identical dicts.
+"""
+import importlib.util
+import inspect
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany, UpdateOne, WriteConcern
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Write concern per operation class. Alerts, their notifications and payments must survive a
+# primary failover; telemetry such as last_login is best effort and never waits for the server.
+DURABLE_WRITE_CONCERN = WriteConcern(w="majority", j=True)
+TELEMETRY_WRITE_CONCERN = WriteConcern(w=0)
+
+# Reads that tolerate bounded staleness (admin lists and stats, the alert feed, analytics) may be
+# served by secondaries; auth, subscriptions and read-then-write paths always read the primary.
+# 90s is the smallest maxStalenessSeconds the server accepts.
+STALE_READS_DEFAULT_MAX_STALENESS_S = 90
+STALE_READS_MIN_MAX_STALENESS_S = 90
+
+# Server error code for multi-document transactions on a standalone server
+ILLEGAL_OPERATION = 20
+# Delivered outbox entries are kept this long for inspection
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 3600
+# Acknowledged inbox items are kept this long
+INBOX_RETENTION_SECONDS = 30 * 24 * 3600
+
+OPEN_SUBSCRIPTION_FILTER = {"$nin": ["cancelled", "expired"]}
+CLOSED_SUBSCRIPTION_STATUSES = ("cancelled", "expired")
+
+# Users counted by the admin dashboard: complete profile, no test
+# accounts, logged in at least once
+REAL_USER_NAME_PATTERN = "^(test|teste|admin|usuario|user)$"
+REAL_USER_EMAIL_PATTERN = "@test\\.com$"
+REAL_USERS_FILTER = {
+    "name": {"$exists": True, "$ne": "", "$not": {"$regex": REAL_USER_NAME_PATTERN, "$options": "i"}},
+    "email": {"$exists": True, "$not": {"$regex": REAL_USER_EMAIL_PATTERN, "$options": "i"}},
+    "country_code": {"$exists": True, "$ne": ""},
+    "last_login": {"$exists": True, "$ne": None}
+}
+
+# Rollup sources: metric -> [(collection, date field, key, needs owner lookup)]
+# Logins are only reconstructable from each user's last_login, and the
+# transition to overdue leaves no timestamp behind, so overdue buckets are
+# never rebuilt.
+ROLLUP_SOURCES = {
+    "registrations": [("users", "created_at", "", False)],
+    "logins": [("users", "last_login", "", False)],
+    "alerts": [("alerts", "timestamp", "$type", True)],
+    "subscriptions": [
+        ("subscriptions", "created_at", "trial", True),
+        ("subscriptions", "last_payment_date", "active", True),
+        ("subscriptions", "blocked_at", "blocked", True),
+        ("subscriptions", "cancelled_at", "cancelled", True),
+    ],
+}
+
+
+# MongoDB client helpers
+
+# Environment variable -> MongoClient option. Unset variables keep the driver defaults.
+MONGO_CLIENT_ENV_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    # Client-side timeout for a whole operation, retries included
+    "MONGO_TIMEOUT_MS": ("timeoutMS", int),
+    # e.g. "zstd,snappy" (zstandard / python-snappy packages, see COMPRESSOR_MODULES; the server picks the first it supports)
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_ZLIB_COMPRESSION_LEVEL": ("zlibCompressionLevel", int),
+}
+
+# Wire compressor -> module it needs. PyMongo only warns and drops a compressor whose module is missing.
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def client_options_from_env(environ=None) -> dict:
+    """Pool, compression and timeout options for create_mongo_client from MONGO_* variables"""
+    environ = os.environ if environ is None else environ
+    options = {}
+    for variable, (option, cast) in MONGO_CLIENT_ENV_OPTIONS.items():
+        value = environ.get(variable, "").strip()
+        if value:
+            try:
+                options[option] = cast(value)
+            except ValueError:
+                raise ValueError(f"{variable} must be {cast.__name__}, got {value!r}")
+    for compressor in filter(None, (name.strip() for name in options.get("compressors", "").split(","))):
+        module = COMPRESSOR_MODULES.get(compressor)
+        if module is None:
+            raise ValueError(f"MONGO_COMPRESSORS: unknown compressor {compressor!r} (use {', '.join(COMPRESSOR_MODULES)})")
+        if importlib.util.find_spec(module) is None:
+            raise ValueError(f"MONGO_COMPRESSORS: {compressor} needs the {module} module, which is not installed")
+    return options
+
+
+def stale_read_preference_from_env(environ=None):
+    """Read preference for stale-tolerant reads from MONGO_STALE_READS_MAX_STALENESS_S (0 keeps them on the primary)"""
+    environ = os.environ if environ is None else environ
+    value = environ.get("MONGO_STALE_READS_MAX_STALENESS_S", "").strip()
+    try:
+        max_staleness = int(value) if value else STALE_READS_DEFAULT_MAX_STALENESS_S
+    except ValueError:
+        raise ValueError(f"MONGO_STALE_READS_MAX_STALENESS_S must be int, got {value!r}")
+    if max_staleness == 0:
+        return Primary()
+    if max_staleness < STALE_READS_MIN_MAX_STALENESS_S:
+        raise ValueError(f"MONGO_STALE_READS_MAX_STALENESS_S must be 0 or at least {STALE_READS_MIN_MAX_STALENESS_S}")
+    return SecondaryPreferred(max_staleness=max_staleness)
+
+
+def create_mongo_client(url: str, driver: Optional[str] = None, **options):
+    """Create the async MongoDB client selected by MONGO_DRIVER.
+
+    "motor" (default) runs each operation on Motor's thread pool, "pymongo"
+    uses PyMongo's native asyncio client (pymongo>=4.10). Both expose the
+    same collection API; the differences are bridged by aggregate_to_list
+    and close_mongo_client. Extra options go to the client constructor.
+    """
+    driver = (driver or os.environ.get('MONGO_DRIVER', 'motor')).lower()
+    if driver == "pymongo":
+        from pymongo import AsyncMongoClient
+        return AsyncMongoClient(url, **options)
+    if driver != "motor":
+        raise ValueError(f"Unknown MONGO_DRIVER: {driver}")
+    return AsyncIOMotorClient(url, **options)
+
+
+async def aggregate_to_list(collection, pipeline: list) -> list:
+    """Run an aggregation on either driver (PyMongo's async aggregate must be awaited, Motor's must not)"""
+    cursor = collection.aggregate(pipeline)
+    if inspect.isawaitable(cursor):
+        cursor = await cursor
+    return await cursor.to_list(length=None)
+
+
+async def start_session(mongo_client):
+    """Start a client session on either driver (Motor's start_session must be awaited)"""
+    session = mongo_client.start_session()
+    if inspect.isawaitable(session):
+        session = await session
+    return session
+
+
+async def close_mongo_client(mongo_client):
+    """Close either driver's client (PyMongo's async close is a coroutine)"""
+    result = mongo_client.close()
+    if inspect.isawaitable(result):
+        await result
+
+
+def rollup_id(day: str, metric: str, country: str, state: str, key: str) -> str:
+    """Deterministic _id of a daily rollup bucket, shared by live updates and rebuilds"""
+    return "|".join([day, metric, country, state, key])
+
+
+def rollup_day_expr(field: str) -> dict:
+    """Aggregation expression for the UTC day of a field stored as ISO string or BSON date"""
+    return {
+        "$cond": [
+            {"$eq": [{"$type": field}, "date"]},
+            {"$dateToString": {"format": "%Y-%m-%d", "date": field}},
+            {"$substrCP": [field, 0, 10]}
+        ]
+    }
+
+
+def rollup_pipeline(metric: str, date_field: str, key, country_field: str = "$country_code", state_field: str = "$state",
+                    prefix: list = None, into: str = "daily_rollups") -> list:
+    """Pipeline grouping raw documents into daily rollup buckets and merging them into the into collection"""
+    stages = list(prefix or [])
+    stages += [
+        {"$match": {date_field[1:]: {"$exists": True, "$nin": [None, ""]}}},
+        {"$group": {
+            "_id": {
+                "day": rollup_day_expr(date_field),
+                "country": {"$ifNull": [country_field, "BRA"]},
+                "state": {"$ifNull": [state_field, "SP"]},
+                "key": key
+            },
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.day", "|", metric, "|", "$_id.country", "|", "$_id.state", "|", "$_id.key"]},
+            "day": "$_id.day",
+            "metric": metric,
+            "country": "$_id.country",
+            "state": "$_id.state",
+            "key": "$_id.key",
+            "count": 1
+        }},
+        {"$merge": {
+            "into": into,
+            "on": "_id",
+            "whenMatched": [{"$set": {"count": {"$add": ["$count", "$$new.count"]}}}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+    return stages
+
+
+def bulk_write_errors(error: BulkWriteError) -> Dict[int, Tuple[int, str]]:
+    """Map operation index -> (code, message) from a BulkWriteError"""
+    return {
+        item["index"]: (item.get("code"), item.get("errmsg", "Erro de escrita"))
+        for item in error.details.get("writeErrors", [])
+    }
+
+
+# MongoDB implementation
+class MongoUserRepository:
+    def __init__(self, collection, stale_reads=Primary()):
+        self.collection = collection
+        self.telemetry = collection.with_options(write_concern=TELEMETRY_WRITE_CONCERN)
+        self.stale_reads = collection.with_options(read_preference=stale_reads)
+
+    async def ensure_indexes(self):
+        try:
+            # Registration and bulk import rely on this for email dedup
+            await self.collection.create_index("email", unique=True)
+        except (DuplicateKeyError, OperationFailure) as e:
+            logger.error(f"Could not create unique users.email index, duplicate emails exist: {e}")
+        # get_current_user looks the token's user up by id on every authenticated request
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("state", 1), ("city", 1), ("neighborhood", 1), ("street", 1)])
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id})
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def insert(self, user_dict: dict):
+        """Insert a user, raising DuplicateKeyError if the email is taken"""
+        await self.collection.insert_one(user_dict)
+
+    async def insert_many(self, user_dicts: List[dict]) -> Dict[int, Tuple[int, str]]:
+        """Unordered insert; returns failures by index (code 11000 = duplicate email)"""
+        try:
+            await self.collection.insert_many(user_dicts, ordered=False)
+        except BulkWriteError as e:
+            return bulk_write_errors(e)
+        return {}
+
+    async def update_by_email(self, email: str, fields: dict) -> int:
+        result = await self.collection.update_one({"email": email}, {"$set": fields})
+        return result.matched_count
+
+    async def set_telemetry(self, updates: Dict[str, dict]):
+        """Unordered, unacknowledged bulk_write of $set updates by user id"""
+        operations = [UpdateOne({"id": user_id}, {"$set": fields}) for user_id, fields in updates.items()]
+        if operations:
+            await self.telemetry.bulk_write(operations, ordered=False)
+
+    async def bulk_update_by_email(self, updates: List[Tuple[str, dict]]) -> Dict[int, Tuple[int, str]]:
+        """Unordered bulk_write of $set updates; returns failures by index"""
+        operations = [UpdateOne({"email": email}, {"$set": fields}) for email, fields in updates]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return bulk_write_errors(e)
+        return {}
+
+    async def existing_emails(self, emails: List[str]) -> set:
+        found = set()
+        async for user in self.collection.find({"email": {"$in": emails}}, {"_id": 0, "email": 1}):
+            found.add(user["email"])
+        return found
+
+    async def list_street_neighbor_ids(self, state: str, city: str, neighborhood: str, street: str, exclude_id: str) -> List[str]:
+        neighbor_ids = []
+        users_cursor = self.collection.find({
+            "state": state,
+            "city": city,
+            "neighborhood": neighborhood,
+            "street": street,
+            "id": {"$ne": exclude_id}
+        })
+        async for user in users_cursor:
+            neighbor_ids.append(user["id"])
+        return neighbor_ids
+
+    async def get_notification_channels(self, user_ids: List[str]) -> Dict[str, dict]:
+        """notification_channels of the given users that registered any, by user id"""
+        cursor = self.collection.find(
+            {"id": {"$in": user_ids}, "notification_channels": {"$exists": True}},
+            {"_id": 0, "id": 1, "notification_channels": 1}
+        )
+        return {doc["id"]: doc["notification_channels"] for doc in await cursor.to_list(length=None)}
+
+    async def count_street_neighbors(self, state: str, city: str, neighborhood: str, street: str, exclude_id: str) -> int:
+        return await self.collection.count_documents({
+            "state": state,
+            "city": city,
+            "neighborhood": neighborhood,
+            "street": street,
+            "id": {"$ne": exclude_id}
+        })
+
+    async def count_real_users(self) -> int:
+        return await self.stale_reads.count_documents(REAL_USERS_FILTER)
+
+    async def list_all(self) -> List[dict]:
+        """All users, newest first"""
+        return await self.stale_reads.find({}).sort("created_at", -1).to_list(length=None)
+
+
+class MongoSubscriptionRepository:
+    def __init__(self, collection, stale_reads=Primary()):
+        self.collection = collection
+        self.stale_reads = collection.with_options(read_preference=stale_reads)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("user_id", 1), ("status", 1)])
+        await self.collection.create_index("status")
+
+    async def get_open_for_user(self, user_id: str) -> Optional[dict]:
+        """The user's subscription that is not cancelled or expired"""
+        return await self.collection.find_one({"user_id": user_id, "status": OPEN_SUBSCRIPTION_FILTER})
+
+    async def get_for_user(self, subscription_id: str, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": subscription_id, "user_id": user_id})
+
+    async def insert(self, subscription_dict: dict):
+        await self.collection.insert_one(subscription_dict)
+
+    async def update(self, subscription_id: str, fields: dict) -> int:
+        result = await self.collection.update_one({"id": subscription_id}, {"$set": fields})
+        return result.modified_count
+
+    async def count(self, status: Optional[str] = None) -> int:
+        # Admin dashboard only
+        if status is None:
+            return await self.stale_reads.estimated_document_count()
+        return await self.stale_reads.count_documents({"status": status})
+
+
+class MongoAlertRepository:
+    def __init__(self, collection, outbox_collection, stale_reads=Primary()):
+        self.collection = collection
+        self.outbox = outbox_collection
+        self.stale_reads = collection.with_options(read_preference=stale_reads)
+        # Heartbeats are liveness telemetry: a lost one only brings the auto-close closer
+        self.heartbeats = collection.with_options(write_concern=TELEMETRY_WRITE_CONCERN)
+        # Cleared on the first standalone server that refuses a transaction
+        self.transactions = True
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([
+            ("state", 1), ("city", 1), ("neighborhood", 1), ("street", 1), ("is_active", 1), ("timestamp", -1)
+        ])
+        await self.collection.create_index([("is_active", 1), ("last_heartbeat", 1)])
+
+    async def insert(self, alert_dict: dict):
+        await self.collection.insert_one(alert_dict)
+
+    async def insert_with_outbox(self, alert_dict: dict, outbox_entry: dict):
+        """Insert an alert and its outbox entry in one transaction, so neither is stored without the other"""
+        if self.transactions:
+            async def write(session):
+                await self.collection.insert_one(alert_dict, session=session)
+                await self.outbox.insert_one(outbox_entry, session=session)
+
+            try:
+                async with await start_session(self.collection.database.client) as session:
+                    await session.with_transaction(write, write_concern=DURABLE_WRITE_CONCERN)
+                return
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION:
+                    raise
+                logger.warning("MongoDB is not a replica set: alerts and their outbox entries are written without a transaction")
+                self.transactions = False
+        await self.collection.insert_one(alert_dict)
+        await self.outbox.insert_one(outbox_entry)
+
+    async def list_active_for_street(self, state: str, city: str, neighborhood: str, street: str, limit: int) -> List[dict]:
+        """Active alerts on a street, newest first"""
+        alerts_cursor = self.stale_reads.find({
+            "state": state,
+            "city": city,
+            "neighborhood": neighborhood,
+            "street": street,
+            "is_active": True
+        }).sort("timestamp", -1).limit(limit)
+        return await alerts_cursor.to_list(length=None)
+
+    async def active_ids(self, alert_ids: List[str]) -> set:
+        """The subset of alert_ids that are still active, in one query"""
+        cursor = self.collection.find({"id": {"$in": alert_ids}, "is_active": True}, {"_id": 0, "id": 1})
+        return {doc["id"] for doc in await cursor.to_list(length=None)}
+
+    async def get_owned_state(self, alert_id: str, user_id: str) -> Optional[dict]:
+        """is_active (and closed_reason) of an alert owned by user_id; None if there is no such alert"""
+        return await self.collection.find_one(
+            {"id": alert_id, "user_id": user_id}, {"_id": 0, "is_active": 1, "closed_reason": 1}
+        )
+
+    async def stop(self, alert_id: str, user_id: str) -> int:
+        """Deactivate an alert owned by user_id"""
+        result = await self.collection.update_one(
+            {"id": alert_id, "user_id": user_id},
+            {"$set": {"is_active": False}}
+        )
+        return result.modified_count
+
+    async def record_heartbeats(self, heartbeats: Dict[Tuple[str, str], dict], acknowledged: bool = False):
+        """Unordered bulk_write of {(alert_id, owner id): {"last_heartbeat"}}; closed alerts are left alone.
+
+        Unacknowledged unless acknowledged is set, as it must be before close_stale relies on the heartbeats.
+        """
+        operations = [
+            UpdateOne({"id": alert_id, "user_id": user_id, "is_active": True}, {"$set": fields})
+            for (alert_id, user_id), fields in heartbeats.items()
+        ]
+        if operations:
+            await (self.collection if acknowledged else self.heartbeats).bulk_write(operations, ordered=False)
+
+    async def close_stale(self, cutoff: str, now: str) -> int:
+        """Deactivate, in one update, every active alert whose last heartbeat is older than cutoff"""
+        result = await self.collection.update_many(
+            {"is_active": True, "$or": [
+                {"last_heartbeat": {"$lt": cutoff}},
+                # Alerts created before heartbeats existed
+                {"last_heartbeat": {"$exists": False}, "timestamp": {"$lt": cutoff}}
+            ]},
+            {"$set": {"is_active": False, "closed_reason": "heartbeat_timeout", "closed_at": now}}
+        )
+        return result.modified_count
+
+    async def count(self) -> int:
+        # Collection metadata instead of a full scan; exact enough for the admin dashboard
+        return await self.stale_reads.estimated_document_count()
+
+
+class MongoHelpMessageRepository:
+    def __init__(self, collection, stale_reads=Primary()):
+        self.collection = collection
+        self.stale_reads = collection.with_options(read_preference=stale_reads)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("created_at", -1), ("id", -1)])
+        await self.collection.create_index([("created_at", -1), ("id", -1)])
+        await self.collection.create_index("id", unique=True)
+
+    async def insert(self, help_dict: dict):
+        await self.collection.insert_one(help_dict)
+
+    async def list_page(self, status: Optional[str], created_from: Optional[str], created_to: Optional[str],
+                        after: Optional[Tuple[str, str]], limit: int) -> List[dict]:
+        """Messages newest first, keyset-paginated on (created_at, id) after the given position"""
+        query = {}
+        if status:
+            query["status"] = status
+
+        created_range = {}
+        if created_from:
+            created_range["$gte"] = created_from
+        if created_to:
+            created_range["$lt"] = created_to
+        if created_range:
+            query["created_at"] = created_range
+
+        if after:
+            after_created_at, after_id = after
+            query["$or"] = [
+                {"created_at": {"$lt": after_created_at}},
+                {"created_at": after_created_at, "id": {"$lt": after_id}}
+            ]
+
+        messages_cursor = self.stale_reads.find(query).sort([("created_at", -1), ("id", -1)]).limit(limit)
+        return await messages_cursor.to_list(length=limit)
+
+    async def resolve(self, message_id: str, admin_response: str, resolved_at: str) -> Optional[str]:
+        """Mark a message resolved; returns its previous status, or None if it does not exist"""
+        previous = await self.collection.find_one_and_update(
+            {"id": message_id},
+            {"$set": {
+                "admin_response": admin_response,
+                "status": "resolved",
+                "resolved_at": resolved_at
+            }},
+            projection={"status": 1}
+        )
+        return previous.get("status") if previous is not None else None
+
+    async def count_by_status(self, status: str) -> int:
+        return await self.collection.count_documents({"status": status})
+
+
+class MongoEmergencyNotificationRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        try:
+            # One notification per alert: redelivered outbox entries are deduplicated here
+            await self.collection.create_index("alert_id", unique=True)
+        except (DuplicateKeyError, OperationFailure) as e:
+            logger.error(f"Could not create unique emergency_notifications.alert_id index: {e}")
+
+    async def insert(self, notification_dict: dict):
+        await self.collection.insert_one(notification_dict)
+
+    async def insert_once(self, notification_dict: dict) -> bool:
+        """Insert unless a notification for the same alert exists; False if it did"""
+        try:
+            await self.collection.insert_one(notification_dict)
+        except DuplicateKeyError:
+            return False
+        return True
+
+
+class MongoInboxRepository:
+    """One item per (user, alert) with its delivery state: delivered once a poll returned it, then acknowledged"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        # Also deduplicates items written again by a redelivered outbox entry
+        await self.collection.create_index([("user_id", 1), ("alert_id", 1)], unique=True)
+        # Polls only look at unacknowledged items: the partial index stays small as acknowledgements pile up
+        await self.collection.create_index(
+            [("user_id", 1), ("created_at", -1)],
+            partialFilterExpression={"acknowledged": False}
+        )
+        await self.collection.create_index("acknowledged_at", expireAfterSeconds=INBOX_RETENTION_SECONDS)
+
+    async def add(self, items: List[dict]):
+        """Unordered insert; items already in the inbox are skipped"""
+        try:
+            await self.collection.insert_many(items, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+
+    async def list_unacknowledged(self, user_id: str, limit: int) -> List[dict]:
+        """Newest unacknowledged items of user_id"""
+        cursor = self.collection.find({"user_id": user_id, "acknowledged": False}).sort("created_at", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def update_delivery(self, user_id: str, delivered: List[str], closed: List[str], now: datetime):
+        """Mark items as delivered, and acknowledge those whose alert has ended, in one bulk write"""
+        operations = []
+        if delivered:
+            operations.append(UpdateMany(
+                {"user_id": user_id, "alert_id": {"$in": delivered}, "delivered_at": None},
+                {"$set": {"delivered_at": now}}
+            ))
+        if closed:
+            operations.append(UpdateMany(
+                {"user_id": user_id, "alert_id": {"$in": closed}, "acknowledged": False},
+                {"$set": {"acknowledged": True, "acknowledged_at": now, "closed": True}}
+            ))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def acknowledge(self, user_id: str, alert_ids: List[str], now: datetime) -> int:
+        result = await self.collection.update_many(
+            {"user_id": user_id, "alert_id": {"$in": alert_ids}, "acknowledged": False},
+            {"$set": {"acknowledged": True, "acknowledged_at": now}}
+        )
+        return result.modified_count
+
+
+class MongoOutboxRepository:
+    """Pending side effects of committed writes, drained by the outbox dispatcher"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("id", unique=True)
+        await self.collection.create_index([("status", 1), ("next_attempt_at", 1)])
+        await self.collection.create_index("completed_at", expireAfterSeconds=OUTBOX_RETENTION_SECONDS)
+
+    async def claim_due(self, now: datetime, lease_seconds: float, limit: int) -> List[dict]:
+        """Claim up to limit due entries for lease_seconds; an unfinished claim becomes due again when it expires"""
+        due = {"status": "pending", "next_attempt_at": {"$lte": now}}
+        candidates = await self.collection.find(due, {"_id": 0, "id": 1}).sort("next_attempt_at", 1).limit(limit).to_list(length=limit)
+        if not candidates:
+            return []
+        ids = [entry["id"] for entry in candidates]
+        claim = os.urandom(8).hex()
+        await self.collection.update_many(
+            {**due, "id": {"$in": ids}},
+            {"$set": {"claim": claim, "next_attempt_at": now + timedelta(seconds=lease_seconds)}}
+        )
+        return await self.collection.find({"id": {"$in": ids}, "claim": claim}).to_list(length=limit)
+
+    async def complete(self, entry_ids: List[str], now: datetime):
+        await self.collection.update_many(
+            {"id": {"$in": entry_ids}},
+            {"$set": {"status": "done", "completed_at": now}, "$unset": {"claim": ""}}
+        )
+
+    async def retry(self, entry_id: str, attempts: int, next_attempt_at: Optional[datetime], error: str):
+        """Record a failed attempt; with no next_attempt_at the entry is given up"""
+        fields = {"attempts": attempts, "last_error": error}
+        if next_attempt_at is None:
+            fields["status"] = "failed"
+        else:
+            fields["next_attempt_at"] = next_attempt_at
+        await self.collection.update_one({"id": entry_id}, {"$set": fields, "$unset": {"claim": ""}})
+
+    async def count_pending(self) -> int:
+        return await self.collection.count_documents({"status": "pending"})
+
+
+class MongoCounterRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get(self, counter_id: str) -> Optional[int]:
+        counter = await self.collection.find_one({"_id": counter_id})
+        return None if counter is None else counter.get("value", 0)
+
+    async def seed(self, counter_id: str, value: int):
+        """Create the counter with value unless it already exists"""
+        await self.collection.update_one({"_id": counter_id}, {"$setOnInsert": {"value": value}}, upsert=True)
+
+    async def increment(self, counter_id: str, amount: int):
+        await self.collection.update_one({"_id": counter_id}, {"$inc": {"value": amount}}, upsert=True)
+
+
+class MongoRollupRepository:
+    def __init__(self, db, stale_reads=Primary()):
+        self.db = db
+        self.collection = db.daily_rollups
+        self.stale_reads = self.collection.with_options(read_preference=stale_reads)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("metric", 1), ("day", 1)])
+
+    async def increment(self, day: str, metric: str, country: str, state: str, key: str, amount: int):
+        await self.collection.update_one(
+            {"_id": rollup_id(day, metric, country, state, key)},
+            {
+                "$inc": {"count": amount},
+                "$setOnInsert": {
+                    "day": day,
+                    "metric": metric,
+                    "country": country,
+                    "state": state,
+                    "key": key
+                }
+            },
+            upsert=True
+        )
+
+    async def increment_many(self, buckets: Dict[Tuple[str, str, str, str, str], dict]):
+        """Unordered bulk_write of increment() for {(day, metric, country, state, key): {"count": amount}}"""
+        operations = [
+            UpdateOne(
+                {"_id": rollup_id(day, metric, country, state, key)},
+                {
+                    "$inc": {"count": fields["count"]},
+                    "$setOnInsert": {"day": day, "metric": metric, "country": country, "state": state, "key": key}
+                },
+                upsert=True
+            )
+            for (day, metric, country, state, key), fields in buckets.items()
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def find_range(self, metric: str, start_day: str, end_day: str,
+                         country: Optional[str] = None, state: Optional[str] = None) -> List[dict]:
+        query = {"metric": metric, "day": {"$gte": start_day, "$lte": end_day}}
+        if country:
+            query["country"] = country
+        if state:
+            query["state"] = state
+        return await self.stale_reads.find(
+            query, {"_id": 0, "day": 1, "country": 1, "state": 1, "key": 1, "count": 1}
+        ).to_list(length=None)
+
+    async def rebuild(self, metrics: List[str]):
+        """Recompute rollup buckets for metrics from the raw collections with $group + $merge.
+
+        Each metric is built into a staging collection, then swapped in:
+        its buckets replace the live ones and live buckets it no longer has
+        are deleted. Live increments are never counted twice; those landing
+        while a metric is being rebuilt may be lost (the raw document was
+        not yet there when the staging counts were taken). The logins and
+        subscriptions metrics must not be rebuilt on a live database: users
+        only keep their last login, and subscriptions their last payment
+        and block, so their history would be lost.
+        """
+        # Alerts and subscriptions take their state/country from the owning user
+        owner_lookup = [
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "id", "as": "owner"}},
+            {"$set": {"owner": {"$arrayElemAt": ["$owner", 0]}}}
+        ]
+
+        for metric in metrics:
+            staging = self.db[f"daily_rollups_rebuild_{metric}_{os.urandom(4).hex()}"]
+            try:
+                for collection_name, date_field, key, owned in ROLLUP_SOURCES[metric]:
+                    if owned:
+                        pipeline = rollup_pipeline(
+                            metric, f"${date_field}", key,
+                            country_field="$owner.country_code",
+                            state_field="$state" if collection_name == "alerts" else "$owner.state",
+                            prefix=owner_lookup, into=staging.name
+                        )
+                    else:
+                        pipeline = rollup_pipeline(metric, f"${date_field}", key, into=staging.name)
+                    await aggregate_to_list(self.db[collection_name], pipeline)
+
+                await aggregate_to_list(staging, [
+                    {"$merge": {"into": self.collection.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+                ])
+                # Overdue transitions leave no timestamp behind, so their buckets are never rebuilt
+                stale = {"metric": metric, "_id": {"$nin": await staging.distinct("_id")}}
+                if metric == "subscriptions":
+                    stale["key"] = {"$ne": "overdue"}
+                await self.collection.delete_many(stale)
+            finally:
+                await staging.drop()
+
+
+class MongoRepositories:
+    """Repositories backed by a Motor or PyMongo async database"""
+
+    def __init__(self, db, stale_reads=Primary()):
+        """stale_reads: read preference for the reads that tolerate staleness (see stale_read_preference_from_env)"""
+        self.db = db
+        self.users = MongoUserRepository(db.users, stale_reads)
+        self.subscriptions = MongoSubscriptionRepository(
+            db.subscriptions.with_options(write_concern=DURABLE_WRITE_CONCERN), stale_reads
+        )
+        self.alerts = MongoAlertRepository(
+            db.alerts.with_options(write_concern=DURABLE_WRITE_CONCERN),
+            db.notification_outbox.with_options(write_concern=DURABLE_WRITE_CONCERN),
+            stale_reads
+        )
+        self.help_messages = MongoHelpMessageRepository(db.help_messages, stale_reads)
+        self.emergency_notifications = MongoEmergencyNotificationRepository(
+            db.emergency_notifications.with_options(write_concern=DURABLE_WRITE_CONCERN)
+        )
+        self.notification_outbox = MongoOutboxRepository(db.notification_outbox.with_options(write_concern=DURABLE_WRITE_CONCERN))
+        self.notification_inbox = MongoInboxRepository(db.notification_inbox.with_options(write_concern=DURABLE_WRITE_CONCERN))
+        self.counters = MongoCounterRepository(db.counters)
+        self.daily_rollups = MongoRollupRepository(db, stale_reads)
+
+    def all(self):
+        return [
+            self.users, self.subscriptions, self.alerts, self.help_messages,
+            self.emergency_notifications, self.notification_outbox, self.notification_inbox,
+            self.counters, self.daily_rollups
+        ]
+
+    async def ensure_indexes(self):
+        for repository in self.all():
+            await repository.ensure_indexes()
+
+
+# In-memory implementation
+def stored_day(value) -> Optional[str]:
+    """UTC day of a stored date (ISO string or datetime), mirroring rollup_day_expr"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+class InMemoryUserRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.by_email: Dict[str, dict] = {}
+        self.by_street: Dict[tuple, Dict[str, dict]] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    def _street_key(self, doc: dict) -> tuple:
+        return (doc.get("state"), doc.get("city"), doc.get("neighborhood"), doc.get("street"))
+
+    def _store(self, user_dict: dict):
+        if user_dict["email"] in self.by_email:
+            raise DuplicateKeyError(f"E11000 duplicate key error dup key: {{ email: \"{user_dict['email']}\" }}", 11000)
+        doc = dict(user_dict)
+        self.by_id[doc["id"]] = doc
+        self.by_email[doc["email"]] = doc
+        self.by_street.setdefault(self._street_key(doc), {})[doc["id"]] = doc
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        doc = self.by_id.get(user_id)
+        return dict(doc) if doc is not None else None
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        doc = self.by_email.get(email)
+        return dict(doc) if doc is not None else None
+
+    async def insert(self, user_dict: dict):
+        self._store(user_dict)
+
+    async def insert_many(self, user_dicts: List[dict]) -> Dict[int, Tuple[int, str]]:
+        failures = {}
+        for index, user_dict in enumerate(user_dicts):
+            try:
+                self._store(user_dict)
+            except DuplicateKeyError as e:
+                failures[index] = (11000, str(e))
+        return failures
+
+    async def update_by_email(self, email: str, fields: dict) -> int:
+        doc = self.by_email.get(email)
+        if doc is None:
+            return 0
+        doc.update(fields)
+        return 1
+
+    async def set_telemetry(self, updates: Dict[str, dict]):
+        for user_id, fields in updates.items():
+            doc = self.by_id.get(user_id)
+            if doc is not None:
+                doc.update(fields)
+
+    async def bulk_update_by_email(self, updates: List[Tuple[str, dict]]) -> Dict[int, Tuple[int, str]]:
+        for email, fields in updates:
+            await self.update_by_email(email, fields)
+        return {}
+
+    async def existing_emails(self, emails: List[str]) -> set:
+        return {email for email in emails if email in self.by_email}
+
+    async def list_street_neighbor_ids(self, state: str, city: str, neighborhood: str, street: str, exclude_id: str) -> List[str]:
+        residents = self.by_street.get((state, city, neighborhood, street), {})
+        return [user_id for user_id in residents if user_id != exclude_id]
+
+    async def get_notification_channels(self, user_ids: List[str]) -> Dict[str, dict]:
+        return {
+            user_id: dict(self.by_id[user_id]["notification_channels"])
+            for user_id in user_ids
+            if user_id in self.by_id and "notification_channels" in self.by_id[user_id]
+        }
+
+    async def count_street_neighbors(self, state: str, city: str, neighborhood: str, street: str, exclude_id: str) -> int:
+        residents = self.by_street.get((state, city, neighborhood, street), {})
+        return len(residents) - (exclude_id in residents)
+
+    async def count_real_users(self) -> int:
+        name_pattern = re.compile(REAL_USER_NAME_PATTERN, re.IGNORECASE)
+        email_pattern = re.compile(REAL_USER_EMAIL_PATTERN, re.IGNORECASE)
+        total = 0
+        for doc in self.by_id.values():
+            name = doc.get("name")
+            email = doc.get("email")
+            if name is None or name == "" or (isinstance(name, str) and name_pattern.search(name)):
+                continue
+            if email is None or (isinstance(email, str) and email_pattern.search(email)):
+                continue
+            if "country_code" not in doc or doc["country_code"] == "":
+                continue
+            if doc.get("last_login") is None:
+                continue
+            total += 1
+        return total
+
+    async def list_all(self) -> List[dict]:
+        return [dict(doc) for doc in sorted(self.by_id.values(), key=lambda doc: doc.get("created_at") or "", reverse=True)]
+
+
+class InMemorySubscriptionRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get_open_for_user(self, user_id: str) -> Optional[dict]:
+        for doc in self.by_id.values():
+            if doc.get("user_id") == user_id and doc.get("status") not in CLOSED_SUBSCRIPTION_STATUSES:
+                return dict(doc)
+        return None
+
+    async def get_for_user(self, subscription_id: str, user_id: str) -> Optional[dict]:
+        doc = self.by_id.get(subscription_id)
+        if doc is None or doc.get("user_id") != user_id:
+            return None
+        return dict(doc)
+
+    async def insert(self, subscription_dict: dict):
+        self.by_id[subscription_dict["id"]] = dict(subscription_dict)
+
+    async def update(self, subscription_id: str, fields: dict) -> int:
+        doc = self.by_id.get(subscription_id)
+        if doc is None:
+            return 0
+        changed = any(doc.get(key, object()) != value for key, value in fields.items())
+        doc.update(fields)
+        return 1 if changed else 0
+
+    async def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return len(self.by_id)
+        return sum(1 for doc in self.by_id.values() if doc.get("status") == status)
+
+
+class InMemoryAlertRepository:
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.by_id: Dict[str, dict] = {}
+        self.by_street: Dict[tuple, List[dict]] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, alert_dict: dict):
+        doc = dict(alert_dict)
+        self.by_id[doc["id"]] = doc
+        key = (doc.get("state"), doc.get("city"), doc.get("neighborhood"), doc.get("street"))
+        self.by_street.setdefault(key, []).append(doc)
+
+    async def insert_with_outbox(self, alert_dict: dict, outbox_entry: dict):
+        await self.insert(alert_dict)
+        self.outbox.by_id[outbox_entry["id"]] = dict(outbox_entry)
+
+    async def list_active_for_street(self, state: str, city: str, neighborhood: str, street: str, limit: int) -> List[dict]:
+        alerts = [doc for doc in self.by_street.get((state, city, neighborhood, street), []) if doc.get("is_active") is True]
+        alerts.sort(key=lambda doc: doc.get("timestamp") or "", reverse=True)
+        return [dict(doc) for doc in alerts[:limit]]
+
+    async def active_ids(self, alert_ids: List[str]) -> set:
+        return {
+            alert_id for alert_id in alert_ids
+            if self.by_id.get(alert_id, {}).get("is_active") is True
+        }
+
+    async def get_owned_state(self, alert_id: str, user_id: str) -> Optional[dict]:
+        doc = self.by_id.get(alert_id)
+        if doc is None or doc.get("user_id") != user_id:
+            return None
+        return {key: doc[key] for key in ("is_active", "closed_reason") if key in doc}
+
+    async def stop(self, alert_id: str, user_id: str) -> int:
+        doc = self.by_id.get(alert_id)
+        if doc is None or doc.get("user_id") != user_id or doc.get("is_active") is False:
+            return 0
+        doc["is_active"] = False
+        return 1
+
+    async def record_heartbeats(self, heartbeats: Dict[Tuple[str, str], dict], acknowledged: bool = False):
+        for (alert_id, user_id), fields in heartbeats.items():
+            doc = self.by_id.get(alert_id)
+            if doc is not None and doc.get("user_id") == user_id and doc.get("is_active") is True:
+                doc.update(fields)
+
+    async def close_stale(self, cutoff: str, now: str) -> int:
+        closed = 0
+        for doc in self.by_id.values():
+            if doc.get("is_active") is True and (doc.get("last_heartbeat") or doc.get("timestamp") or "") < cutoff:
+                doc.update(is_active=False, closed_reason="heartbeat_timeout", closed_at=now)
+                closed += 1
+        return closed
+
+    async def count(self) -> int:
+        return len(self.by_id)
+
+
+class InMemoryHelpMessageRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, help_dict: dict):
+        self.by_id[help_dict["id"]] = dict(help_dict)
+
+    async def list_page(self, status: Optional[str], created_from: Optional[str], created_to: Optional[str],
+                        after: Optional[Tuple[str, str]], limit: int) -> List[dict]:
+        matches = []
+        for doc in self.by_id.values():
+            created_at = doc.get("created_at", "")
+            if status and doc.get("status") != status:
+                continue
+            if created_from and created_at < created_from:
+                continue
+            if created_to and created_at >= created_to:
+                continue
+            if after and (created_at, doc["id"]) >= after:
+                continue
+            matches.append(doc)
+        matches.sort(key=lambda doc: (doc.get("created_at", ""), doc["id"]), reverse=True)
+        return [dict(doc) for doc in matches[:limit]]
+
+    async def resolve(self, message_id: str, admin_response: str, resolved_at: str) -> Optional[str]:
+        doc = self.by_id.get(message_id)
+        if doc is None:
+            return None
+        previous_status = doc.get("status")
+        doc.update({"admin_response": admin_response, "status": "resolved", "resolved_at": resolved_at})
+        return previous_status
+
+    async def count_by_status(self, status: str) -> int:
+        return sum(1 for doc in self.by_id.values() if doc.get("status") == status)
+
+
+class InMemoryEmergencyNotificationRepository:
+    def __init__(self):
+        self.by_alert_id: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, notification_dict: dict):
+        doc = dict(notification_dict)
+        self.by_alert_id[doc.get("alert_id")] = doc
+
+    async def insert_once(self, notification_dict: dict) -> bool:
+        if notification_dict.get("alert_id") in self.by_alert_id:
+            return False
+        await self.insert(notification_dict)
+        return True
+
+
+class InMemoryInboxRepository:
+    def __init__(self):
+        # user_id -> alert_id -> item
+        self.by_user: Dict[str, Dict[str, dict]] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def add(self, items: List[dict]):
+        for item in items:
+            self.by_user.setdefault(item["user_id"], {}).setdefault(item["alert_id"], dict(item))
+
+    async def list_unacknowledged(self, user_id: str, limit: int) -> List[dict]:
+        items = [item for item in self.by_user.get(user_id, {}).values() if item["acknowledged"] is False]
+        items.sort(key=lambda item: item["created_at"], reverse=True)
+        return [dict(item) for item in items[:limit]]
+
+    async def update_delivery(self, user_id: str, delivered: List[str], closed: List[str], now: datetime):
+        items = self.by_user.get(user_id, {})
+        for alert_id in delivered:
+            if alert_id in items and items[alert_id].get("delivered_at") is None:
+                items[alert_id]["delivered_at"] = now
+        for alert_id in closed:
+            if alert_id in items and items[alert_id]["acknowledged"] is False:
+                items[alert_id].update({"acknowledged": True, "acknowledged_at": now, "closed": True})
+
+    async def acknowledge(self, user_id: str, alert_ids: List[str], now: datetime) -> int:
+        items = self.by_user.get(user_id, {})
+        modified = 0
+        for alert_id in alert_ids:
+            if alert_id in items and items[alert_id]["acknowledged"] is False:
+                items[alert_id].update({"acknowledged": True, "acknowledged_at": now})
+                modified += 1
+        return modified
+
+
+class InMemoryOutboxRepository:
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def claim_due(self, now: datetime, lease_seconds: float, limit: int) -> List[dict]:
+        due = [doc for doc in self.by_id.values() if doc["status"] == "pending" and doc["next_attempt_at"] <= now]
+        due.sort(key=lambda doc: doc["next_attempt_at"])
+        for doc in due[:limit]:
+            doc["next_attempt_at"] = now + timedelta(seconds=lease_seconds)
+        return [dict(doc) for doc in due[:limit]]
+
+    async def complete(self, entry_ids: List[str], now: datetime):
+        for entry_id in entry_ids:
+            self.by_id.pop(entry_id, None)
+
+    async def retry(self, entry_id: str, attempts: int, next_attempt_at: Optional[datetime], error: str):
+        doc = self.by_id.get(entry_id)
+        if doc is None:
+            return
+        doc.update({"attempts": attempts, "last_error": error})
+        if next_attempt_at is None:
+            doc["status"] = "failed"
+        else:
+            doc["next_attempt_at"] = next_attempt_at
+
+    async def count_pending(self) -> int:
+        return sum(1 for doc in self.by_id.values() if doc["status"] == "pending")
+
+
+class InMemoryCounterRepository:
+    def __init__(self):
+        self.values: Dict[str, int] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get(self, counter_id: str) -> Optional[int]:
+        return self.values.get(counter_id)
+
+    async def seed(self, counter_id: str, value: int):
+        self.values.setdefault(counter_id, value)
+
+    async def increment(self, counter_id: str, amount: int):
+        self.values[counter_id] = self.values.get(counter_id, 0) + amount
+
+
+class InMemoryRollupRepository:
+    def __init__(self, repositories):
+        self.repositories = repositories
+        self.buckets: Dict[str, dict] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def increment(self, day: str, metric: str, country: str, state: str, key: str, amount: int):
+        bucket_id = rollup_id(day, metric, country, state, key)
+        bucket = self.buckets.setdefault(bucket_id, {
+            "day": day, "metric": metric, "country": country, "state": state, "key": key, "count": 0
+        })
+        bucket["count"] += amount
+
+    async def increment_many(self, buckets: Dict[Tuple[str, str, str, str, str], dict]):
+        for (day, metric, country, state, key), fields in buckets.items():
+            await self.increment(day, metric, country, state, key, fields["count"])
+
+    async def find_range(self, metric: str, start_day: str, end_day: str,
+                         country: Optional[str] = None, state: Optional[str] = None) -> List[dict]:
+        return [
+            dict(bucket) for bucket in self.buckets.values()
+            if bucket["metric"] == metric and start_day <= bucket["day"] <= end_day
+            and (not country or bucket["country"] == country)
+            and (not state or bucket["state"] == state)
+        ]
+
+    def _documents(self, collection_name: str) -> List[dict]:
+        if collection_name == "users":
+            return list(self.repositories.users.by_id.values())
+        if collection_name == "alerts":
+            return list(self.repositories.alerts.by_id.values())
+        return list(self.repositories.subscriptions.by_id.values())
+
+    async def rebuild(self, metrics: List[str]):
+        users = self.repositories.users.by_id
+        for metric in metrics:
+            # Built aside, then swapped in, like the Mongo staging collection
+            staging = InMemoryRollupRepository(self.repositories)
+            for collection_name, date_field, key, owned in ROLLUP_SOURCES[metric]:
+                for doc in self._documents(collection_name):
+                    day = stored_day(doc.get(date_field))
+                    if day is None:
+                        continue
+                    owner = users.get(doc.get("user_id"), {}) if owned else doc
+                    state_source = doc if collection_name == "alerts" else owner
+                    await staging.increment(
+                        day, metric,
+                        owner.get("country_code") or "BRA",
+                        state_source.get("state") or "SP",
+                        doc.get(key[1:], "") if key.startswith("$") else key,
+                        1
+                    )
+            self.buckets = {
+                bucket_id: bucket for bucket_id, bucket in self.buckets.items()
+                if bucket["metric"] != metric or (metric == "subscriptions" and bucket["key"] == "overdue")
+            }
+            self.buckets.update(staging.buckets)
+
+
+class InMemoryRepositories:
+    """Repositories kept in process memory, for tests and benchmarks"""
+
+    def __init__(self):
+        self.users = InMemoryUserRepository()
+        self.subscriptions = InMemorySubscriptionRepository()
+        self.notification_outbox = InMemoryOutboxRepository()
+        self.alerts = InMemoryAlertRepository(self.notification_outbox)
+        self.help_messages = InMemoryHelpMessageRepository()
+        self.emergency_notifications = InMemoryEmergencyNotificationRepository()
+        self.notification_inbox = InMemoryInboxRepository()
+        self.counters = InMemoryCounterRepository()
+        self.daily_rollups = InMemoryRollupRepository(self)
+
+    async def ensure_indexes(self):
+        pass
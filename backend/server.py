@@ -1,26 +1,71 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, date, timezone, timedelta
 import hashlib
+import re
+import base64
+import csv
+import io
+import json
+import time
+import shutil
+import tempfile
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import jwt
 from passlib.context import CryptContext
+from repositories import (
+    MongoRepositories, InMemoryRepositories, client_options_from_env, create_mongo_client, close_mongo_client,
+    stale_read_preference_from_env
+)
+from loop_monitor import EventLoopWatchdog
+from slow_queries import SlowQueryLog, current_request_scope
+from write_behind import TelemetryWriter
+from liveness import AlertSweeper
+from outbox import OutboxDispatcher, PushEventBus
+from notifiers import NotificationDispatcher, providers_from_env
+from profiling import PROFILE_HEADER, PROFILE_MODES, ProfileStore, render_profile, start_profiler
+from metrics import (
+    ALERT_CREATE_SECONDS, ALERT_FANOUT, HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS, MongoCommandMetrics, MongoPoolMetrics,
+    render_latest, timed_on_pool
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Commands slower than SLOW_QUERY_MS are logged; a sampled fraction is explained
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    explain_sample_rate=float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE', 0.1))
+)
+
+# Data access: MongoDB by default, DATA_BACKEND=memory keeps everything in process
+DATA_BACKEND = os.environ.get('DATA_BACKEND', 'mongo').lower()
+if DATA_BACKEND == "memory":
+    client = None
+    db = None
+    repos = InMemoryRepositories()
+else:
+    mongo_url = os.environ['MONGO_URL']
+    # Pool size, compression and timeouts come from MONGO_* variables (see client_options_from_env)
+    client = create_mongo_client(
+        mongo_url,
+        event_listeners=[MongoCommandMetrics(), MongoPoolMetrics(), slow_query_log],
+        **client_options_from_env()
+    )
+    db = client[os.environ['DB_NAME']]
+    # Admin lists/stats, the alert feed and analytics may read from secondaries (MONGO_STALE_READS_MAX_STALENESS_S)
+    repos = MongoRepositories(db, stale_reads=stale_read_preference_from_env())
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -32,8 +77,109 @@ api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = "safezone-secret-key-change-in-production"
+# bcrypt releases the GIL, so a thread pool hashes in parallel off the event loop
+password_hash_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BCRYPT_POOL_SIZE', os.cpu_count() or 4)),
+    thread_name_prefix="bcrypt"
+)
 ALGORITHM = "HS256"
 
+# Help messages admin listing
+HELP_MESSAGES_PAGE_SIZE = 50
+HELP_MESSAGES_MAX_PAGE_SIZE = 200
+HELP_UNREAD_COUNTER_ID = "help_messages_unread"
+
+# Emergency notification inbox
+INBOX_PAGE_SIZE = 20
+INBOX_ACK_MAX_IDS = 100
+
+# Daily analytics rollups
+ROLLUP_METRICS = ["registrations", "logins", "alerts", "subscriptions"]
+REBUILDABLE_ROLLUP_METRICS = ["registrations", "alerts"]
+# Metrics whose raw data only keeps the latest event: a rebuild would wipe their history
+UNREBUILDABLE_ROLLUP_METRICS = {
+    "logins": "só o último login de cada usuário é guardado",
+    "subscriptions": "só o último pagamento e o último bloqueio de cada assinatura são guardados",
+}
+TIMESERIES_DEFAULT_DAYS = 30
+TIMESERIES_MAX_DAYS = 366
+
+# Bulk admin/VIP grants
+ADMIN_BULK_CHUNK_SIZE = 500
+ADMIN_BULK_MAX_ROWS = 10000
+
+# Bulk resident import
+RESIDENT_IMPORT_BATCH_SIZE = 200
+RESIDENT_IMPORT_MAX_ROWS = 50000
+RESIDENT_IMPORT_SPOOL_BYTES = 1024 * 1024
+
+# Event-loop lag watchdog (0 disables it)
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.environ.get('LOOP_WATCHDOG_THRESHOLD_MS', 100))
+LOOP_WATCHDOG_INTERVAL_MS = float(os.environ.get('LOOP_WATCHDOG_INTERVAL_MS', 20))
+loop_watchdog = EventLoopWatchdog(
+    interval=LOOP_WATCHDOG_INTERVAL_MS / 1000,
+    threshold=LOOP_WATCHDOG_THRESHOLD_MS / 1000
+) if LOOP_WATCHDOG_THRESHOLD_MS > 0 else None
+
+# last_login and other per-user telemetry, coalesced and flushed in unordered bulk writes
+telemetry_writer = TelemetryWriter(
+    lambda updates: repos.users.set_telemetry(updates),
+    flush_interval=float(os.environ.get('TELEMETRY_FLUSH_MS', 250)) / 1000,
+    max_batch=int(os.environ.get('TELEMETRY_BATCH_SIZE', 500)),
+    max_pending=int(os.environ.get('TELEMETRY_MAX_PENDING', 50000))
+)
+
+# Login and alert counts for the admin time series, summed per daily bucket and flushed like telemetry
+def add_rollup_count(queued: dict, fields: dict):
+    queued["count"] += fields["count"]
+
+rollup_writer = TelemetryWriter(
+    lambda buckets: repos.daily_rollups.increment_many(buckets),
+    name="rollups",
+    merge=add_rollup_count,
+    flush_interval=float(os.environ.get('TELEMETRY_FLUSH_MS', 250)) / 1000,
+    max_batch=int(os.environ.get('TELEMETRY_BATCH_SIZE', 500)),
+    max_pending=int(os.environ.get('TELEMETRY_MAX_PENDING', 50000))
+)
+
+# Active alert heartbeats, coalesced per alert; alerts silent for ALERT_HEARTBEAT_TIMEOUT_S are closed by the sweeper
+ALERT_HEARTBEAT_TIMEOUT_S = float(os.environ.get('ALERT_HEARTBEAT_TIMEOUT_S', 60))
+alert_heartbeats = TelemetryWriter(
+    lambda heartbeats: repos.alerts.record_heartbeats(heartbeats),
+    name="alert_heartbeats",
+    flush_interval=float(os.environ.get('ALERT_HEARTBEAT_FLUSH_MS', 5000)) / 1000,
+    max_batch=int(os.environ.get('TELEMETRY_BATCH_SIZE', 500)),
+    max_pending=int(os.environ.get('TELEMETRY_MAX_PENDING', 50000))
+)
+alert_sweeper = AlertSweeper(
+    lambda: repos.alerts,
+    alert_heartbeats,
+    timeout=ALERT_HEARTBEAT_TIMEOUT_S,
+    interval=float(os.environ.get('ALERT_SWEEP_INTERVAL_S', 15))
+)
+
+# Emergency notifications and push events for a new alert, dispatched from the transactional outbox
+push_events = PushEventBus()
+notification_outbox = OutboxDispatcher(
+    lambda: repos.notification_outbox,
+    lambda entry: deliver_emergency_notification(entry),
+    batch_size=int(os.environ.get('OUTBOX_BATCH_SIZE', 100)),
+    poll_interval=float(os.environ.get('OUTBOX_POLL_MS', 1000)) / 1000,
+    max_attempts=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+)
+# Web push, SMS and webhook delivery of those events (providers configured by the environment),
+# queued so provider latency never holds up the outbox
+notification_dispatcher = NotificationDispatcher(
+    providers_from_env(),
+    lambda user_ids: repos.users.get_notification_channels(user_ids),
+    workers=int(os.environ.get('NOTIFY_WORKERS', 4)),
+    max_queued=int(os.environ.get('NOTIFY_MAX_QUEUED', 10000))
+)
+push_events.subscribe(notification_dispatcher.on_event)
+
+# Profiles requested by admins with X-Profile: store
+stored_profiles = ProfileStore()
+
 # Models
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -118,6 +264,8 @@ class Alert(BaseModel):
     number: str
     location: Optional[dict] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Creating the alert is its first heartbeat (see create_alert); later ones come from the heartbeat route
+    last_heartbeat: Optional[datetime] = None
     is_active: bool = True
 
 class AlertCreate(BaseModel):
@@ -179,6 +327,13 @@ class HelpMessage(BaseModel):
 class HelpMessageCreate(BaseModel):
     message: str
 
+class NotificationAck(BaseModel):
+    alert_ids: List[str]
+
+class NotificationChannels(BaseModel):
+    web_push: Optional[dict] = None  # PushSubscription.toJSON() from the browser
+    sms: Optional[str] = None  # E.164, e.g. +5511999999999
+
 class HelpMessageResponse(BaseModel):
     id: str
     user_name: str
@@ -195,6 +350,16 @@ class AdminSetRequest(BaseModel):
     is_vip: bool = False
     vip_permanent: bool = True
 
+class AdminBulkSetItem(BaseModel):
+    email: EmailStr
+    is_admin: bool = False
+    is_vip: bool = False
+    vip_permanent: bool = True
+    vip_expires_at: Optional[datetime] = None  # Used when vip_permanent is False
+
+class AdminBulkSetRequest(BaseModel):
+    users: List[AdminBulkSetItem]
+
 class AdminStats(BaseModel):
     total_users: int
     total_subscriptions: int
@@ -213,6 +378,23 @@ class EmergencyNotification(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     is_silent_for_requester: bool = True  # Requester gets silent notification
 
+class InboxItem(BaseModel):
+    """A resident's copy of an emergency notification (notification_inbox)"""
+    user_id: str
+    alert_id: str
+    alert_type: str
+    requester_name: str
+    requester_address: str
+    created_at: datetime
+    delivered_at: Optional[datetime] = None  # First poll that returned it
+    acknowledged: bool = False  # acknowledged_at (and closed, when the alert ended) are added on acknowledgement
+
+class BootstrapResponse(BaseModel):
+    profile: UserResponse
+    subscription: SubscriptionStatus
+    alerts: List[AlertResponse]
+    emergency_notifications: List[dict]
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -220,6 +402,16 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    """verify_password on the bcrypt pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_hash_pool, timed_on_pool("verify", verify_password), plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """get_password_hash on the bcrypt pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_hash_pool, timed_on_pool("hash", get_password_hash), password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -239,7 +431,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await db.users.find_one({"id": user_id})
+    user = await repos.users.get_by_id(user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     return User(**user)
@@ -262,19 +454,16 @@ async def ensure_admin_exists():
     admin_email = "julio.csds@hotmail.com"
     
     # Check if admin user exists
-    admin_user = await db.users.find_one({"email": admin_email})
+    admin_user = await repos.users.get_by_email(admin_email)
     
     if admin_user:
         # Update existing user to be admin/VIP if not already
         if not admin_user.get("is_admin") or not admin_user.get("is_vip"):
-            await db.users.update_one(
-                {"email": admin_email},
-                {"$set": {
-                    "is_admin": True,
-                    "is_vip": True,
-                    "vip_expires_at": None  # Permanent VIP
-                }}
-            )
+            await repos.users.update_by_email(admin_email, {
+                "is_admin": True,
+                "is_vip": True,
+                "vip_expires_at": None  # Permanent VIP
+            })
             print(f"✅ Updated {admin_email} to permanent admin/VIP status")
     else:
         print(f"ℹ️  Admin user {admin_email} does not exist yet. Will be set when they register.")
@@ -286,6 +475,17 @@ async def get_current_admin(credentials: HTTPAuthorizationCredentials = Depends(
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return user
 
+async def is_admin_request(request) -> bool:
+    """Whether the request carries an admin's bearer token (for middleware, outside dependency injection)"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        user = await get_current_user(HTTPAuthorizationCredentials(scheme=scheme, credentials=token))
+    except HTTPException:
+        return False
+    return user.is_admin
+
 def prepare_for_mongo(data):
     """Convert datetime objects to ISO strings for MongoDB storage"""
     if isinstance(data, dict):
@@ -311,6 +511,323 @@ def parse_from_mongo(item):
                     pass
     return item
 
+def alert_responses(alerts: list) -> List[AlertResponse]:
+    """Build the AlertResponse list returned by GET /api/alerts from stored alert documents"""
+    response_alerts = []
+    for alert in alerts:
+        alert = parse_from_mongo(alert)
+        response_alerts.append(AlertResponse(
+            id=alert["id"],
+            type=alert["type"],
+            user_name=alert["user_name"],
+            state=alert.get("state", "SP"),
+            city=alert.get("city", "São Paulo"),
+            neighborhood=alert["neighborhood"],
+            street=alert["street"],
+            number=alert["number"],
+            timestamp=alert["timestamp"].strftime("%d/%m/%Y %H:%M"),
+            is_active=alert["is_active"]
+        ))
+    return response_alerts
+
+def admin_user_rows(users: list) -> List[dict]:
+    """Build the rows returned by GET /api/admin/users from stored user documents"""
+    response_users = []
+    for user in users:
+        user = parse_from_mongo(user)
+        full_address = f"{user['street']}, {user['number']}, {user['neighborhood']}, {user.get('city', 'São Paulo')} - {user.get('state', 'SP')}"
+        response_users.append({
+            "id": user["id"],
+            "name": user["name"],
+            "email": user["email"],
+            "address": full_address,
+            "neighborhood": user["neighborhood"],
+            "is_admin": user.get("is_admin", False),
+            "is_vip": user.get("is_vip", False),
+            "created_at": user["created_at"].strftime("%d/%m/%Y %H:%M")
+        })
+    return response_users
+
+async def ensure_indexes():
+    """Create the indexes used by the hot query paths"""
+    await repos.ensure_indexes()
+
+async def ensure_help_unread_counter():
+    """Seed the unread help message counter from the collection if it is missing"""
+    existing = await repos.counters.get(HELP_UNREAD_COUNTER_ID)
+    if existing is None:
+        pending = await repos.help_messages.count_by_status("pending")
+        await repos.counters.seed(HELP_UNREAD_COUNTER_ID, pending)
+
+async def increment_help_unread(amount: int):
+    """Adjust the unread help message counter by amount"""
+    await repos.counters.increment(HELP_UNREAD_COUNTER_ID, amount)
+
+async def get_help_unread_count() -> int:
+    """Read the unread help message counter (single point lookup)"""
+    value = await repos.counters.get(HELP_UNREAD_COUNTER_ID)
+    return max(value or 0, 0)
+
+def encode_page_cursor(created_at: str, item_id: str) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor"""
+    raw = f"{created_at}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_page_cursor(cursor: str):
+    """Decode a cursor produced by encode_page_cursor into (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, item_id = raw.split("|", 1)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return created_at, item_id
+
+def to_utc_iso(value: datetime) -> str:
+    """Format a datetime the way prepare_for_mongo stores it (UTC ISO string)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+def rollup_day(value) -> str:
+    """UTC day bucket (YYYY-MM-DD) for a datetime"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+async def record_rollup(metric: str, when: datetime, country: Optional[str], state: Optional[str], key: str = "", amount: int = 1):
+    """Increment the daily rollup bucket for metric.
+
+    Analytics must never fail the request that produced the event, so
+    errors are logged and swallowed.
+    """
+    day = rollup_day(when)
+    country = country or "BRA"
+    state = state or "SP"
+    try:
+        await repos.daily_rollups.increment(day, metric, country, state, key, amount)
+    except Exception as e:
+        logger.warning(f"Failed to record {metric} rollup: {e}")
+
+def record_rollup_behind(metric: str, when: datetime, country: Optional[str], state: Optional[str], key: str = "", amount: int = 1):
+    """record_rollup without the round trip: the increment is written with the next rollup_writer flush"""
+    rollup_writer.record((rollup_day(when), metric, country or "BRA", state or "SP", key), {"count": amount})
+
+def admin_grant_update(item: AdminBulkSetItem) -> dict:
+    """$set document for an admin/VIP grant, matching set_user_admin"""
+    update_data = {
+        "is_admin": item.is_admin,
+        "is_vip": item.is_vip,
+        "vip_expires_at": None  # Permanent VIP (or no VIP)
+    }
+    if item.is_vip and not item.vip_permanent and item.vip_expires_at:
+        expires_at = item.vip_expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        update_data["vip_expires_at"] = expires_at
+    return prepare_for_mongo(update_data)
+
+async def apply_admin_grants(rows: list) -> List[dict]:
+    """Apply admin/VIP grants in unordered bulk_write chunks.
+
+    rows holds (row_number, AdminBulkSetItem or error message) pairs and a
+    result is returned for every row, in input order.
+    """
+    results = {}
+    valid = []
+    for row, item in rows:
+        if isinstance(item, AdminBulkSetItem):
+            valid.append((row, item))
+        else:
+            results[row] = {"row": row, "email": None, "status": "invalid", "detail": item}
+    
+    for start in range(0, len(valid), ADMIN_BULK_CHUNK_SIZE):
+        chunk = valid[start:start + ADMIN_BULK_CHUNK_SIZE]
+        emails = list({item.email for _, item in chunk})
+        
+        # One lookup per chunk tells us which rows will not match any user
+        existing = await repos.users.existing_emails(emails)
+        
+        operations = []
+        operation_rows = []
+        for row, item in chunk:
+            if item.email not in existing:
+                results[row] = {"row": row, "email": item.email, "status": "not_found", "detail": "Usuário não encontrado"}
+                continue
+            operations.append((item.email, admin_grant_update(item)))
+            operation_rows.append((row, item))
+        
+        if not operations:
+            continue
+        
+        failed = await repos.users.bulk_update_by_email(operations)
+        
+        for index, (row, item) in enumerate(operation_rows):
+            if index in failed:
+                results[row] = {"row": row, "email": item.email, "status": "error", "detail": failed[index][1]}
+            else:
+                results[row] = {"row": row, "email": item.email, "status": "updated", "detail": None}
+    
+    return [results[row] for row in sorted(results)]
+
+def parse_csv_bool(value: Optional[str], default: bool) -> bool:
+    """Interpret a CSV cell as a boolean (true/1/yes/sim)"""
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "sim", "y", "s")
+
+def summarize_admin_grants(results: List[dict]) -> dict:
+    """Response payload for the bulk admin endpoints"""
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {
+        "success": counts.get("updated", 0) > 0 or not results,
+        "total": len(results),
+        "updated": counts.get("updated", 0),
+        "not_found": counts.get("not_found", 0),
+        "invalid": counts.get("invalid", 0),
+        "errors": counts.get("error", 0),
+        "results": results
+    }
+
+def parse_resident_row(raw: dict) -> UserCreate:
+    """Build a UserCreate from a resident import CSV row (resident_names separated by ;)"""
+    raw = {(key or "").strip(): (value or "").strip() for key, value in raw.items() if key}
+    resident_names = [name.strip() for name in raw.get("resident_names", "").split(";") if name.strip()]
+    return UserCreate(
+        name=raw.get("name", ""),
+        email=raw.get("email", ""),
+        password=raw.get("password", ""),
+        state=raw.get("state", ""),
+        city=raw.get("city", ""),
+        neighborhood=raw.get("neighborhood", ""),
+        street=raw.get("street", ""),
+        number=raw.get("number", ""),
+        resident_names=resident_names or [raw.get("name", "")],
+        country_code=raw.get("country_code") or "BRA"
+    )
+
+async def insert_resident_batch(batch: list) -> dict:
+    """insert_many a batch of (row, user_dict) pairs, letting the unique email index drop duplicates"""
+    duplicates = {}
+    failed = {}
+    failures = await repos.users.insert_many([user_dict for _, user_dict in batch])
+    for index, (code, message) in failures.items():
+        row = batch[index][0]
+        if code == 11000:
+            duplicates[row] = "Email já cadastrado"
+        else:
+            failed[row] = message
+    
+    inserted = [user_dict for row, user_dict in batch if row not in duplicates and row not in failed]
+    
+    # One rollup increment per (country, state) instead of one per user
+    groups = {}
+    for user_dict in inserted:
+        group = (user_dict.get("country_code"), user_dict.get("state"))
+        groups[group] = groups.get(group, 0) + 1
+    now = datetime.now(timezone.utc)
+    for (country, state), count in groups.items():
+        await record_rollup("registrations", now, country, state, amount=count)
+    
+    return {"inserted": len(inserted), "duplicates": duplicates, "failed": failed}
+
+async def import_residents(lines, batch_size: int = RESIDENT_IMPORT_BATCH_SIZE):
+    """Import residents from CSV lines, yielding a progress dict after every batch.
+
+    Hashing of batch N+1 on the bcrypt pool overlaps with the insert_many of
+    batch N. The last dict yielded has done=True and per-row problems.
+    """
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or "email" not in [name.strip() for name in reader.fieldnames]:
+        yield {"done": True, "error": "CSV deve conter a coluna email"}
+        return
+    
+    started = time.perf_counter()
+    progress = {"processed": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": 0}
+    problems = []
+    pending_insert = None
+    
+    async def finish_insert(task):
+        outcome = await task
+        progress["inserted"] += outcome["inserted"]
+        progress["duplicates"] += len(outcome["duplicates"])
+        progress["errors"] += len(outcome["failed"])
+        for row, detail in outcome["duplicates"].items():
+            problems.append({"row": row, "status": "duplicate", "detail": detail})
+        for row, detail in outcome["failed"].items():
+            problems.append({"row": row, "status": "error", "detail": detail})
+    
+    def snapshot(done: bool = False):
+        elapsed = time.perf_counter() - started
+        return {
+            **progress,
+            "elapsed_seconds": round(elapsed, 3),
+            "users_per_second": round(progress["inserted"] / elapsed, 1) if elapsed > 0 else 0.0,
+            "done": done
+        }
+    
+    rows = enumerate(reader, start=1)
+    limit_reached = False
+    while not limit_reached:
+        batch = []
+        for row_number, raw in rows:
+            if row_number > RESIDENT_IMPORT_MAX_ROWS:
+                problems.append({"row": row_number, "status": "invalid", "detail": f"Máximo de {RESIDENT_IMPORT_MAX_ROWS} linhas por arquivo"})
+                progress["invalid"] += 1
+                limit_reached = True
+                break
+            progress["processed"] += 1
+            try:
+                user_data = parse_resident_row(raw)
+                if not user_data.password:
+                    raise ValueError("Senha é obrigatória")
+            except (ValidationError, ValueError) as e:
+                detail = "; ".join(error["msg"] for error in e.errors()) if isinstance(e, ValidationError) else str(e)
+                problems.append({"row": row_number, "status": "invalid", "detail": detail})
+                progress["invalid"] += 1
+                continue
+            batch.append((row_number, user_data))
+            if len(batch) >= batch_size:
+                break
+        
+        if not batch:
+            break
+        
+        hashes = await asyncio.gather(*[get_password_hash_async(user_data.password) for _, user_data in batch])
+        
+        documents = []
+        for (row_number, user_data), hashed_password in zip(batch, hashes):
+            is_admin_email = user_data.email.lower() == "julio.csds@hotmail.com"
+            user = User(
+                name=user_data.name,
+                email=user_data.email,
+                state=user_data.state,
+                city=user_data.city,
+                neighborhood=user_data.neighborhood,
+                street=user_data.street,
+                number=user_data.number,
+                resident_names=user_data.resident_names,
+                country_code=user_data.country_code,
+                is_admin=is_admin_email,
+                is_vip=is_admin_email
+            )
+            user_dict = user.dict()
+            user_dict["password"] = hashed_password
+            documents.append((row_number, prepare_for_mongo(user_dict)))
+        
+        if pending_insert is not None:
+            await finish_insert(pending_insert)
+            yield snapshot()
+        pending_insert = asyncio.ensure_future(insert_resident_batch(documents))
+    
+    if pending_insert is not None:
+        await finish_insert(pending_insert)
+    
+    result = snapshot(done=True)
+    result["problems"] = sorted(problems, key=lambda problem: problem["row"])
+    yield result
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -320,12 +837,12 @@ async def root():
 @api_router.post("/register")
 async def register_user(user_data: UserCreate):
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await repos.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
     
     # Hash password
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     
     # Check if this is the admin email
     is_admin_email = user_data.email.lower() == "julio.csds@hotmail.com"
@@ -351,7 +868,11 @@ async def register_user(user_data: UserCreate):
     user_dict["password"] = hashed_password
     user_dict = prepare_for_mongo(user_dict)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await repos.users.insert(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
+    await record_rollup("registrations", user.created_at, user.country_code, user.state)
     
     if is_admin_email:
         print(f"✅ Admin user registered: {user_data.email}")
@@ -379,34 +900,31 @@ async def register_user(user_data: UserCreate):
 @api_router.post("/login")
 async def login_user(login_data: UserLogin):
     # Find user by email
-    user_doc = await db.users.find_one({"email": login_data.email})
+    user_doc = await repos.users.get_by_email(login_data.email)
     if not user_doc:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     # Verify password
-    if not verify_password(login_data.password, user_doc["password"]):
+    if not await verify_password_async(login_data.password, user_doc["password"]):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
-    # Check if this is admin email and ensure admin status
-    if login_data.email.lower() == "julio.csds@hotmail.com":
-        if not user_doc.get("is_admin") or not user_doc.get("is_vip"):
-            await db.users.update_one(
-                {"email": login_data.email},
-                {"$set": {
-                    "is_admin": True,
-                    "is_vip": True,
-                    "vip_expires_at": None
-                }}
-            )
-            user_doc["is_admin"] = True
-            user_doc["is_vip"] = True
-            user_doc["vip_expires_at"] = None
-    
-    # Update last_login timestamp
-    await db.users.update_one(
-        {"email": login_data.email},
-        {"$set": {"last_login": datetime.now(timezone.utc)}}
-    )
+    login_time = datetime.now(timezone.utc)
+    if login_data.email.lower() == "julio.csds@hotmail.com" and (not user_doc.get("is_admin") or not user_doc.get("is_vip")):
+        # Ensure admin status (acknowledged, together with last_login)
+        await repos.users.update_by_email(login_data.email, {
+            "is_admin": True,
+            "is_vip": True,
+            "vip_expires_at": None,
+            "last_login": login_time
+        })
+        user_doc["is_admin"] = True
+        user_doc["is_vip"] = True
+        user_doc["vip_expires_at"] = None
+    else:
+        # last_login is telemetry: written behind, coalesced with other logins
+        telemetry_writer.record(user_doc["id"], {"last_login": login_time})
+    
+    record_rollup_behind("logins", login_time, user_doc.get("country_code"), user_doc.get("state"))
     
     # Create access token
     access_token = create_access_token(data={"sub": user_doc["id"]})
@@ -436,10 +954,7 @@ async def create_subscription(
     current_user: User = Depends(get_current_user)
 ):
     # Check if user already has an active subscription
-    existing_sub = await db.subscriptions.find_one({
-        "user_id": current_user.id,
-        "status": {"$nin": ["cancelled", "expired"]}
-    })
+    existing_sub = await repos.subscriptions.get_open_for_user(current_user.id)
     
     if existing_sub:
         raise HTTPException(status_code=400, detail="Usuário já possui assinatura ativa")
@@ -464,7 +979,8 @@ async def create_subscription(
     subscription_dict = subscription.dict()
     subscription_dict = prepare_for_mongo(subscription_dict)
     
-    await db.subscriptions.insert_one(subscription_dict)
+    await repos.subscriptions.insert(subscription_dict)
+    await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "trial")
     
     # Generate payment response based on method
     payment_response = PaymentResponse(success=True, message="Assinatura criada com sucesso! Período gratuito de 30 dias iniciado.")
@@ -505,10 +1021,7 @@ async def get_subscription_status(current_user: User = Depends(get_current_user)
         )
     
     # Find user's subscription
-    subscription_doc = await db.subscriptions.find_one({
-        "user_id": current_user.id,
-        "status": {"$nin": ["cancelled", "expired"]}
-    })
+    subscription_doc = await repos.subscriptions.get_open_for_user(current_user.id)
     
     if not subscription_doc:
         return SubscriptionStatus(
@@ -542,10 +1055,9 @@ async def get_subscription_status(current_user: User = Depends(get_current_user)
             if now < grace_end:
                 days_remaining = (grace_end - now).days
                 # Update status to overdue
-                await db.subscriptions.update_one(
-                    {"id": subscription_doc["id"]},
-                    {"$set": {"status": "overdue"}}
-                )
+                modified = await repos.subscriptions.update(subscription_doc["id"], {"status": "overdue"})
+                if modified:
+                    await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "overdue")
                 return SubscriptionStatus(
                     has_subscription=True,
                     status="overdue",
@@ -559,10 +1071,8 @@ async def get_subscription_status(current_user: User = Depends(get_current_user)
             else:
                 # Grace period expired, block user
                 if subscription_doc["status"] != "blocked":
-                    await db.subscriptions.update_one(
-                        {"id": subscription_doc["id"]},
-                        {"$set": {"status": "blocked", "blocked_at": now.isoformat()}}
-                    )
+                    await repos.subscriptions.update(subscription_doc["id"], {"status": "blocked", "blocked_at": now.isoformat()})
+                    await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "blocked")
                 return SubscriptionStatus(
                     has_subscription=True,
                     status="blocked",
@@ -589,10 +1099,8 @@ async def get_subscription_status(current_user: User = Depends(get_current_user)
             grace_end = next_payment + timedelta(days=5)
             if now < grace_end:
                 days_remaining = (grace_end - now).days
-                await db.subscriptions.update_one(
-                    {"id": subscription_doc["id"]},
-                    {"$set": {"status": "overdue", "payment_due_date": grace_end.isoformat()}}
-                )
+                await repos.subscriptions.update(subscription_doc["id"], {"status": "overdue", "payment_due_date": grace_end.isoformat()})
+                await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "overdue")
                 return SubscriptionStatus(
                     has_subscription=True,
                     status="overdue",
@@ -604,10 +1112,8 @@ async def get_subscription_status(current_user: User = Depends(get_current_user)
                 )
             else:
                 # Block user
-                await db.subscriptions.update_one(
-                    {"id": subscription_doc["id"]},
-                    {"$set": {"status": "blocked", "blocked_at": now.isoformat()}}
-                )
+                await repos.subscriptions.update(subscription_doc["id"], {"status": "blocked", "blocked_at": now.isoformat()})
+                await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "blocked")
                 return SubscriptionStatus(
                     has_subscription=True,
                     status="blocked",
@@ -643,10 +1149,7 @@ async def confirm_payment(
     """Confirm payment and reactivate subscription"""
     
     # Find subscription
-    subscription_doc = await db.subscriptions.find_one({
-        "id": payment_data.subscription_id,
-        "user_id": current_user.id
-    })
+    subscription_doc = await repos.subscriptions.get_for_user(payment_data.subscription_id, current_user.id)
     
     if not subscription_doc:
         raise HTTPException(status_code=404, detail="Assinatura não encontrada")
@@ -655,16 +1158,14 @@ async def confirm_payment(
     next_payment = now + timedelta(days=30)  # Next billing cycle
     
     # Update subscription to active
-    await db.subscriptions.update_one(
-        {"id": payment_data.subscription_id},
-        {"$set": {
-            "status": "active",
-            "last_payment_date": now.isoformat(),
-            "next_payment": next_payment.isoformat(),
-            "is_trial": False,
-            "blocked_at": None
-        }}
-    )
+    await repos.subscriptions.update(payment_data.subscription_id, {
+        "status": "active",
+        "last_payment_date": now.isoformat(),
+        "next_payment": next_payment.isoformat(),
+        "is_trial": False,
+        "blocked_at": None
+    })
+    await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "active")
     
     return {"success": True, "message": "Pagamento confirmado! Assinatura reativada com sucesso."}
 
@@ -674,6 +1175,7 @@ async def create_alert(
     alert_data: AlertCreate,
     current_user: User = Depends(get_current_user)
 ):
+    started = time.perf_counter()
     alert = Alert(
         type=alert_data.type,
         user_id=current_user.id,
@@ -689,76 +1191,114 @@ async def create_alert(
         }
     )
     
+    alert.last_heartbeat = alert.timestamp
+    
     alert_dict = alert.dict()
     alert_dict = prepare_for_mongo(alert_dict)
     
-    await db.alerts.insert_one(alert_dict)
-    
-    # Find all users on the same street for emergency notifications
-    same_street_users = []
-    users_cursor = db.users.find({
-        "state": current_user.state,
-        "city": current_user.city,
-        "neighborhood": current_user.neighborhood,
-        "street": current_user.street,
-        "id": {"$ne": current_user.id}  # Exclude the requester
-    })
-    
-    async for user in users_cursor:
-        same_street_users.append(user["id"])
+    # Neighbors are notified by the outbox dispatcher once the alert is committed
+    outbox_entry = {
+        "id": alert.id,
+        "kind": "emergency_notification",
+        "alert_id": alert.id,
+        "payload": {
+            "alert_type": alert_data.type,
+            "requester_id": current_user.id,
+            "requester_name": current_user.name,
+            "requester_address": f"{current_user.street}, {current_user.number}, {current_user.neighborhood}, {current_user.city} - {current_user.state}",
+            "state": current_user.state,
+            "city": current_user.city,
+            "neighborhood": current_user.neighborhood,
+            "street": current_user.street
+        },
+        "status": "pending",
+        "attempts": 0,
+        "created_at": alert.timestamp,
+        "next_attempt_at": alert.timestamp
+    }
     
-    # Create emergency notification record
-    notification = EmergencyNotification(
-        alert_id=alert.id,
-        alert_type=alert_data.type,
-        requester_name=current_user.name,
-        requester_address=f"{current_user.street}, {current_user.number}, {current_user.neighborhood}, {current_user.city} - {current_user.state}",
-        target_users=same_street_users,
-        is_silent_for_requester=True
+    # The insert and the neighbor count are independent: overlap their round trips
+    _, neighbor_count = await asyncio.gather(
+        repos.alerts.insert_with_outbox(alert_dict, outbox_entry),
+        repos.users.count_street_neighbors(
+            current_user.state,
+            current_user.city,
+            current_user.neighborhood,
+            current_user.street,
+            current_user.id  # Exclude the requester
+        )
     )
-    
-    notification_dict = notification.dict()
-    notification_dict = prepare_for_mongo(notification_dict)
-    await db.emergency_notifications.insert_one(notification_dict)
+    # Only once the alert is stored, so the rollup never counts an alert that failed to insert
+    record_rollup_behind("alerts", alert.timestamp, current_user.country_code, current_user.state, alert.type)
+    notification_outbox.wake()
+    ALERT_CREATE_SECONDS.observe(time.perf_counter() - started)
     
     return {
         "message": f"Alerta de {alert_data.type} enviado com sucesso!",
         "alert_id": alert.id,
-        "notification_sent_to": len(same_street_users),
+        "notification_sent_to": neighbor_count,
         "silent_for_requester": True,
         "target_address": f"Rua {current_user.street}, {current_user.neighborhood}"
     }
 
+async def deliver_emergency_notification(entry: dict):
+    """Outbox handler: notify the alert's street. Idempotent, entries can be delivered more than once"""
+    payload = entry["payload"]
+    same_street_users = await repos.users.list_street_neighbor_ids(
+        payload["state"],
+        payload["city"],
+        payload["neighborhood"],
+        payload["street"],
+        payload["requester_id"]  # Exclude the requester
+    )
+    ALERT_FANOUT.observe(len(same_street_users))
+    
+    notification = EmergencyNotification(
+        alert_id=entry["alert_id"],
+        alert_type=payload["alert_type"],
+        requester_name=payload["requester_name"],
+        requester_address=payload["requester_address"],
+        target_users=same_street_users,
+        created_at=entry["created_at"],
+        is_silent_for_requester=True
+    )
+    # A redelivered entry finds its notification and inbox items already stored (unique keys)
+    await repos.emergency_notifications.insert_once(prepare_for_mongo(notification.dict()))
+    if same_street_users:
+        await repos.notification_inbox.add([
+            InboxItem(
+                user_id=user_id,
+                alert_id=entry["alert_id"],
+                alert_type=payload["alert_type"],
+                requester_name=payload["requester_name"],
+                requester_address=payload["requester_address"],
+                created_at=entry["created_at"]
+            ).dict()
+            for user_id in same_street_users
+        ])
+    
+    await push_events.publish({
+        "id": entry["id"],
+        "type": "emergency_alert",
+        "alert_id": entry["alert_id"],
+        "alert_type": payload["alert_type"],
+        "requester_name": payload["requester_name"],
+        "requester_address": payload["requester_address"],
+        "target_users": same_street_users
+    })
+
 @api_router.get("/alerts", response_model=List[AlertResponse])
 async def get_alerts(current_user: User = Depends(get_current_user)):
     # Get alerts from same street (more precise than neighborhood)
-    alerts_cursor = db.alerts.find({
-        "state": current_user.state,
-        "city": current_user.city,
-        "neighborhood": current_user.neighborhood,
-        "street": current_user.street,
-        "is_active": True
-    }).sort("timestamp", -1).limit(10)
-    
-    alerts = await alerts_cursor.to_list(length=None)
-    
-    response_alerts = []
-    for alert in alerts:
-        alert = parse_from_mongo(alert)
-        response_alerts.append(AlertResponse(
-            id=alert["id"],
-            type=alert["type"],
-            user_name=alert["user_name"],
-            state=alert.get("state", "SP"),
-            city=alert.get("city", "São Paulo"),
-            neighborhood=alert["neighborhood"],
-            street=alert["street"],
-            number=alert["number"],
-            timestamp=alert["timestamp"].strftime("%d/%m/%Y %H:%M"),
-            is_active=alert["is_active"]
-        ))
+    alerts = await repos.alerts.list_active_for_street(
+        current_user.state,
+        current_user.city,
+        current_user.neighborhood,
+        current_user.street,
+        limit=10
+    )
     
-    return response_alerts
+    return alert_responses(alerts)
 
 @api_router.put("/alerts/{alert_id}/stop")
 async def stop_alert(
@@ -766,16 +1306,32 @@ async def stop_alert(
     current_user: User = Depends(get_current_user)
 ):
     # Only allow the alert creator to stop it
-    result = await db.alerts.update_one(
-        {"id": alert_id, "user_id": current_user.id},
-        {"$set": {"is_active": False}}
-    )
+    modified = await repos.alerts.stop(alert_id, current_user.id)
     
-    if result.modified_count == 0:
+    if modified == 0:
         raise HTTPException(status_code=404, detail="Alerta não encontrado")
     
     return {"message": "Alerta interrompido com sucesso"}
 
+@api_router.post("/alerts/{alert_id}/heartbeat")
+async def alert_heartbeat(
+    alert_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    # One indexed read so the app learns when its alert was closed; the beat itself is written with the next flush
+    state = await repos.alerts.get_owned_state(alert_id, current_user.id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Alerta não encontrado")
+    if not state.get("is_active"):
+        detail = "Alerta encerrado por falta de sinal" if state.get("closed_reason") == "heartbeat_timeout" else "Alerta encerrado"
+        raise HTTPException(status_code=409, detail=detail)
+    
+    if not alert_heartbeats.record((alert_id, current_user.id), {
+        "last_heartbeat": datetime.now(timezone.utc).isoformat()
+    }):
+        raise HTTPException(status_code=503, detail="Sinal não registrado, tente novamente")
+    return {"message": "Sinal recebido", "is_active": True, "timeout_seconds": ALERT_HEARTBEAT_TIMEOUT_S}
+
 # User profile route
 @api_router.get("/profile", response_model=UserResponse)
 async def get_profile(current_user: User = Depends(get_current_user)):
@@ -794,6 +1350,21 @@ async def get_profile(current_user: User = Depends(get_current_user)):
         vip_expires_at=current_user.vip_expires_at.isoformat() if current_user.vip_expires_at else None
     )
 
+@api_router.put("/notification-channels")
+async def set_notification_channels(
+    channels: NotificationChannels,
+    current_user: User = Depends(get_current_user)
+):
+    """Where the user wants to receive street alerts besides the app; omitted channels are turned off"""
+    if channels.sms is not None and not re.fullmatch(r"\+\d{8,15}", channels.sms):
+        raise HTTPException(status_code=400, detail="Telefone inválido. Use o formato internacional, ex: +5511999999999")
+    if channels.web_push is not None and not channels.web_push.get("endpoint"):
+        raise HTTPException(status_code=400, detail="Inscrição de notificação inválida")
+    
+    enabled = {name: value for name, value in channels.dict().items() if value is not None}
+    await repos.users.update_by_email(current_user.email, {"notification_channels": enabled})
+    return {"message": "Canais de notificação atualizados", "channels": sorted(enabled)}
+
 # Help/Support routes
 @api_router.post("/help")
 async def send_help_message(
@@ -816,7 +1387,8 @@ async def send_help_message(
     help_dict = help_message.dict()
     help_dict = prepare_for_mongo(help_dict)
     
-    await db.help_messages.insert_one(help_dict)
+    await repos.help_messages.insert(help_dict)
+    await increment_help_unread(1)
     
     return {"success": True, "message": "Sua mensagem foi enviada com sucesso! Nossa equipe responderá em breve."}
 
@@ -829,23 +1401,18 @@ async def cancel_subscription(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Usuários VIP não possuem assinatura para cancelar")
     
     # Find user's subscription
-    subscription_doc = await db.subscriptions.find_one({
-        "user_id": current_user.id,
-        "status": {"$nin": ["cancelled", "expired"]}
-    })
+    subscription_doc = await repos.subscriptions.get_open_for_user(current_user.id)
     
     if not subscription_doc:
         raise HTTPException(status_code=404, detail="Nenhuma assinatura ativa encontrada")
     
     # Cancel subscription
     now = datetime.now(timezone.utc)
-    await db.subscriptions.update_one(
-        {"id": subscription_doc["id"]},
-        {"$set": {
-            "status": "cancelled",
-            "cancelled_at": now.isoformat()
-        }}
-    )
+    await repos.subscriptions.update(subscription_doc["id"], {
+        "status": "cancelled",
+        "cancelled_at": now.isoformat()
+    })
+    await record_rollup("subscriptions", now, current_user.country_code, current_user.state, "cancelled")
     
     return {"success": True, "message": "Assinatura cancelada com sucesso"}
 
@@ -858,26 +1425,19 @@ async def get_admin_stats(current_admin: User = Depends(get_current_admin)):
     # 1. Have filled all mandatory fields (name, email, country)
     # 2. Don't have test emails (@test.com) or generic names (like "teste")  
     # 3. Have logged in at least once (last_login exists)
-    real_users_filter = {
-        "name": {"$exists": True, "$ne": "", "$not": {"$regex": "^(test|teste|admin|usuario|user)$", "$options": "i"}},
-        "email": {"$exists": True, "$not": {"$regex": "@test\\.com$", "$options": "i"}},
-        "country_code": {"$exists": True, "$ne": ""},
-        "last_login": {"$exists": True, "$ne": None}
-    }
-    
-    total_users = await db.users.count_documents(real_users_filter)
+    total_users = await repos.users.count_real_users()
     
     # Count subscriptions by status
-    total_subs = await db.subscriptions.count_documents({})
-    active_subs = await db.subscriptions.count_documents({"status": "active"})
-    trial_subs = await db.subscriptions.count_documents({"status": "trial"})
-    blocked_subs = await db.subscriptions.count_documents({"status": "blocked"})
+    total_subs = await repos.subscriptions.count()
+    active_subs = await repos.subscriptions.count("active")
+    trial_subs = await repos.subscriptions.count("trial")
+    blocked_subs = await repos.subscriptions.count("blocked")
     
     # Count alerts
-    total_alerts = await db.alerts.count_documents({})
+    total_alerts = await repos.alerts.count()
     
-    # Count pending help messages
-    pending_help = await db.help_messages.count_documents({"status": "pending"})
+    # Pending help messages come from the incrementally maintained counter
+    pending_help = await get_help_unread_count()
     
     return AdminStats(
         total_users=total_users,
@@ -893,32 +1453,42 @@ async def get_admin_stats(current_admin: User = Depends(get_current_admin)):
 async def get_all_users(current_admin: User = Depends(get_current_admin)):
     """Get all users for admin management"""
     
-    users_cursor = db.users.find({}).sort("created_at", -1)
-    users = await users_cursor.to_list(length=None)
-    
-    response_users = []
-    for user in users:
-        user = parse_from_mongo(user)
-        full_address = f"{user['street']}, {user['number']}, {user['neighborhood']}, {user.get('city', 'São Paulo')} - {user.get('state', 'SP')}"
-        response_users.append({
-            "id": user["id"],
-            "name": user["name"],
-            "email": user["email"],
-            "address": full_address,
-            "neighborhood": user["neighborhood"],
-            "is_admin": user.get("is_admin", False),
-            "is_vip": user.get("is_vip", False),
-            "created_at": user["created_at"].strftime("%d/%m/%Y %H:%M")
-        })
+    users = await repos.users.list_all()
     
-    return response_users
+    return admin_user_rows(users)
 
 @api_router.get("/admin/help-messages")
-async def get_help_messages(current_admin: User = Depends(get_current_admin)):
-    """Get all help messages for admin review"""
+async def get_help_messages(
+    response: Response,
+    status: Optional[str] = Query(None, description="pending, read or resolved"),
+    since: Optional[datetime] = Query(None, description="Only messages created at or after this date"),
+    until: Optional[datetime] = Query(None, description="Only messages created before this date"),
+    limit: int = Query(HELP_MESSAGES_PAGE_SIZE, ge=1, le=HELP_MESSAGES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Get help messages for admin review, newest first, one page at a time.
+
+    The next page cursor is returned in the X-Next-Cursor header and the
+    unread (pending) count in X-Unread-Count.
+    """
+    
+    # Keyset pagination on (created_at, id), both descending
+    messages = await repos.help_messages.list_page(
+        status=status,
+        created_from=to_utc_iso(since) if since else None,
+        created_to=to_utc_iso(until) if until else None,
+        after=decode_page_cursor(cursor) if cursor else None,
+        limit=limit + 1
+    )
     
-    messages_cursor = db.help_messages.find({}).sort("created_at", -1)
-    messages = await messages_cursor.to_list(length=None)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    
+    if has_more:
+        last = messages[-1]
+        response.headers["X-Next-Cursor"] = encode_page_cursor(last["created_at"], last["id"])
+    response.headers["X-Unread-Count"] = str(await get_help_unread_count())
     
     response_messages = []
     for msg in messages:
@@ -936,6 +1506,11 @@ async def get_help_messages(current_admin: User = Depends(get_current_admin)):
     
     return response_messages
 
+@api_router.get("/admin/help-messages/unread-count")
+async def get_help_messages_unread_count(current_admin: User = Depends(get_current_admin)):
+    """Get the number of unread (pending) help messages"""
+    return {"unread_count": await get_help_unread_count()}
+
 @api_router.post("/admin/set-admin")
 async def set_user_admin(
     admin_data: AdminSetRequest,
@@ -944,7 +1519,7 @@ async def set_user_admin(
     """Set user as admin/VIP (admin only)"""
     
     # Find user by email
-    user_doc = await db.users.find_one({"email": admin_data.email})
+    user_doc = await repos.users.get_by_email(admin_data.email)
     if not user_doc:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
@@ -964,16 +1539,92 @@ async def set_user_admin(
     else:
         update_data["vip_expires_at"] = None
     
-    await db.users.update_one(
-        {"email": admin_data.email},
-        {"$set": update_data}
-    )
+    await repos.users.update_by_email(admin_data.email, update_data)
     
     action = "promovido a" if admin_data.is_admin else "removido de"
     vip_text = " e VIP" if admin_data.is_vip else ""
     
     return {"success": True, "message": f"Usuário {admin_data.email} {action} admin{vip_text} com sucesso"}
 
+@api_router.post("/admin/set-admin/bulk")
+async def set_users_admin_bulk(
+    bulk_data: AdminBulkSetRequest,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Set many users as admin/VIP at once (admin only)"""
+    
+    if len(bulk_data.users) > ADMIN_BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {ADMIN_BULK_MAX_ROWS} usuários por requisição")
+    
+    rows = list(enumerate(bulk_data.users, start=1))
+    results = await apply_admin_grants(rows)
+    
+    return summarize_admin_grants(results)
+
+@api_router.post("/admin/set-admin/bulk-csv")
+async def set_users_admin_bulk_csv(
+    file: UploadFile = File(...),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Set many users as admin/VIP from a CSV upload (admin only).
+
+    Columns: email, is_admin, is_vip, vip_permanent, vip_expires_at.
+    Only email is required.
+    """
+    
+    content = (await file.read()).decode("utf-8-sig")
+    reader = csv.DictReader(io.StringIO(content))
+    if not reader.fieldnames or "email" not in [name.strip() for name in reader.fieldnames]:
+        raise HTTPException(status_code=400, detail="CSV deve conter a coluna email")
+    
+    rows = []
+    for row_number, raw in enumerate(reader, start=1):
+        if row_number > ADMIN_BULK_MAX_ROWS:
+            raise HTTPException(status_code=400, detail=f"Máximo de {ADMIN_BULK_MAX_ROWS} usuários por arquivo")
+        raw = {(key or "").strip(): (value or "").strip() for key, value in raw.items()}
+        try:
+            item = AdminBulkSetItem(
+                email=raw.get("email", ""),
+                is_admin=parse_csv_bool(raw.get("is_admin"), False),
+                is_vip=parse_csv_bool(raw.get("is_vip"), False),
+                vip_permanent=parse_csv_bool(raw.get("vip_permanent"), True),
+                vip_expires_at=raw.get("vip_expires_at") or None
+            )
+        except ValidationError as e:
+            item = "; ".join(error["msg"] for error in e.errors())
+        rows.append((row_number, item))
+    
+    results = await apply_admin_grants(rows)
+    
+    return summarize_admin_grants(results)
+
+@api_router.post("/admin/import-residents")
+async def import_residents_csv(
+    file: UploadFile = File(...),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Bulk import residents of a condominium from a CSV upload (admin only).
+
+    Columns: name, email, password, state, city, neighborhood, street,
+    number, resident_names (separated by ;), country_code. The response is
+    streamed as one JSON object per line with progress after each batch.
+    """
+    
+    # The upload is closed once this handler returns, so hand the stream its own spooled copy
+    spool = tempfile.SpooledTemporaryFile(max_size=RESIDENT_IMPORT_SPOOL_BYTES)
+    await asyncio.get_running_loop().run_in_executor(None, shutil.copyfileobj, file.file, spool)
+    spool.seek(0)
+    lines = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    
+    async def progress_stream():
+        try:
+            async for progress in import_residents(lines):
+                yield json.dumps(progress, ensure_ascii=False) + "\n"
+        finally:
+            lines.close()
+    
+    return StreamingResponse(progress_stream(), media_type="application/x-ndjson")
+
 @api_router.put("/admin/help-messages/{message_id}/respond")
 async def respond_help_message(
     message_id: str,
@@ -987,58 +1638,231 @@ async def respond_help_message(
         raise HTTPException(status_code=400, detail="Resposta é obrigatória")
     
     now = datetime.now(timezone.utc)
-    result = await db.help_messages.update_one(
-        {"id": message_id},
-        {"$set": {
-            "admin_response": admin_response,
-            "status": "resolved",
-            "resolved_at": now.isoformat()
-        }}
-    )
+    # The previous status tells us whether the unread counter should move:
+    # only a pending message resolved for the first time decrements it
+    previous_status = await repos.help_messages.resolve(message_id, admin_response, now.isoformat())
     
-    if result.modified_count == 0:
+    if previous_status is None:
         raise HTTPException(status_code=404, detail="Mensagem não encontrada")
     
+    if previous_status == "pending":
+        await increment_help_unread(-1)
+    
     return {"success": True, "message": "Resposta enviada com sucesso"}
 
+@api_router.get("/admin/timeseries")
+async def get_admin_timeseries(
+    metric: str = Query(..., description="registrations, logins, alerts or subscriptions"),
+    start: Optional[date] = Query(None, description="First day (inclusive), defaults to 30 days ago"),
+    end: Optional[date] = Query(None, description="Last day (inclusive), defaults to today"),
+    group_by: str = Query("day", description="day, state or country"),
+    country: Optional[str] = Query(None),
+    state: Optional[str] = Query(None),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Daily counts from the pre-aggregated rollups (alerts are keyed by type, subscriptions by status)"""
+    
+    if metric not in ROLLUP_METRICS:
+        raise HTTPException(status_code=400, detail=f"Métrica inválida. Use: {', '.join(ROLLUP_METRICS)}")
+    if group_by not in ("day", "state", "country"):
+        raise HTTPException(status_code=400, detail="group_by deve ser day, state ou country")
+    
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=TIMESERIES_DEFAULT_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start deve ser anterior a end")
+    if (end - start).days >= TIMESERIES_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Intervalo máximo de {TIMESERIES_MAX_DAYS} dias")
+    
+    buckets = await repos.daily_rollups.find_range(metric, start.isoformat(), end.isoformat(), country, state)
+    
+    totals = {}
+    for bucket in buckets:
+        group = bucket[group_by] if group_by != "day" else None
+        point = (bucket["day"], bucket.get("key", ""), group)
+        totals[point] = totals.get(point, 0) + bucket.get("count", 0)
+    
+    series = []
+    for (day, key, group), count in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1], item[0][2] or "")):
+        point = {"day": day, "key": key, "count": count}
+        if group_by != "day":
+            point[group_by] = group
+        series.append(point)
+    
+    return {
+        "metric": metric,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "group_by": group_by,
+        "series": series
+    }
+
+@api_router.post("/admin/timeseries/rebuild")
+async def rebuild_admin_timeseries(
+    metrics: List[str] = Query(REBUILDABLE_ROLLUP_METRICS),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Rebuild rollups from raw data (not logins or subscriptions, see UNREBUILDABLE_ROLLUP_METRICS)"""
+    
+    for metric in metrics:
+        if metric in UNREBUILDABLE_ROLLUP_METRICS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{metric} não pode ser reconstruída: {UNREBUILDABLE_ROLLUP_METRICS[metric]}"
+            )
+    invalid = [metric for metric in metrics if metric not in REBUILDABLE_ROLLUP_METRICS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Métrica inválida: {', '.join(invalid)}")
+    
+    await repos.daily_rollups.rebuild(metrics)
+    
+    return {"success": True, "rebuilt": metrics}
+
+@api_router.get("/admin/debug/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    sort: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$"),
+    current_admin: User = Depends(get_current_admin)
+):
+    """Slowest MongoDB query shapes since startup, grouped by route and redacted filter shape"""
+    
+    return {
+        "enabled": client is not None,
+        "threshold_ms": slow_query_log.threshold_ms,
+        "explain_sample_rate": slow_query_log.explain_sample_rate,
+        "queries": slow_query_log.report(limit, sort)
+    }
+
+@api_router.get("/admin/debug/profiles/{profile_id}")
+async def get_stored_profile(
+    profile_id: str,
+    current_admin: User = Depends(get_current_admin)
+):
+    """Flame graph of a request profiled with X-Profile: store"""
+    
+    profile = stored_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return Response(content=profile["html"], media_type="text/html")
+
 # Emergency notification routes
 @api_router.get("/emergency-notifications")
 async def get_emergency_notifications(current_user: User = Depends(get_current_user)):
-    """Get active emergency notifications for the current user's street"""
+    """Unacknowledged emergency notifications of active alerts on the user's street"""
     
-    # Find active alerts from the same street
-    notifications_cursor = db.emergency_notifications.find({
-        "target_users": current_user.id
-    }).sort("created_at", -1).limit(5)
+    items = await repos.notification_inbox.list_unacknowledged(current_user.id, limit=INBOX_PAGE_SIZE)
+    if not items:
+        return []
     
-    notifications = await notifications_cursor.to_list(length=None)
+    # Check which of the alerts are still active in a single query
+    active_alert_ids = await repos.alerts.active_ids([item["alert_id"] for item in items])
     
     response_notifications = []
-    for notif in notifications:
-        notif = parse_from_mongo(notif)
-        
-        # Check if the alert is still active
-        alert_doc = await db.alerts.find_one({
-            "id": notif["alert_id"],
-            "is_active": True
-        })
-        
-        if alert_doc:
+    for item in items:
+        if item["alert_id"] in active_alert_ids:
             response_notifications.append({
-                "id": notif["alert_id"],
-                "type": notif["alert_type"],
-                "requester_name": notif["requester_name"],
-                "requester_address": notif["requester_address"],
-                "created_at": notif["created_at"].strftime("%d/%m/%Y %H:%M:%S"),
+                "id": item["alert_id"],
+                "type": item["alert_type"],
+                "requester_name": item["requester_name"],
+                "requester_address": item["requester_address"],
+                "created_at": item["created_at"].strftime("%d/%m/%Y %H:%M:%S"),
                 "should_alarm": True,
-                "is_emergency": True
+                "is_emergency": True,
+                "first_delivery": item.get("delivered_at") is None
             })
     
+    # Record first deliveries, and drop items of ended alerts from the inbox
+    delivered = [item["alert_id"] for item in items if item["alert_id"] in active_alert_ids and item.get("delivered_at") is None]
+    closed = [item["alert_id"] for item in items if item["alert_id"] not in active_alert_ids]
+    if delivered or closed:
+        await repos.notification_inbox.update_delivery(current_user.id, delivered, closed, datetime.now(timezone.utc))
+    
     return response_notifications
 
+@api_router.post("/emergency-notifications/ack")
+async def acknowledge_emergency_notifications(
+    ack: NotificationAck,
+    current_user: User = Depends(get_current_user)
+):
+    """Acknowledge notifications by alert id; they are not returned by later polls"""
+    if len(ack.alert_ids) > INBOX_ACK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {INBOX_ACK_MAX_IDS} notificações por confirmação")
+    if not ack.alert_ids:
+        return {"acknowledged": 0}
+    
+    acknowledged = await repos.notification_inbox.acknowledge(current_user.id, ack.alert_ids, datetime.now(timezone.utc))
+    return {"acknowledged": acknowledged}
+
+@api_router.get("/bootstrap", response_model=BootstrapResponse)
+async def get_bootstrap(current_user: User = Depends(get_current_user)):
+    """Everything the app loads on open, authenticated once and fetched concurrently"""
+    profile, subscription, alerts, notifications = await asyncio.gather(
+        get_profile(current_user),
+        get_subscription_status(current_user),
+        get_alerts(current_user),
+        get_emergency_notifications(current_user)
+    )
+    return BootstrapResponse(
+        profile=profile,
+        subscription=subscription,
+        alerts=alerts,
+        emergency_notifications=notifications
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+@app.middleware("http")
+async def profile_admin_request(request, call_next):
+    """Run the handler under a sampling profiler when an admin sends the X-Profile header"""
+    mode = request.headers.get(PROFILE_HEADER)
+    if mode is None:
+        return await call_next(request)
+    if mode not in PROFILE_MODES or not await is_admin_request(request):
+        return await call_next(request)
+    
+    profiler = start_profiler()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else request.url.path
+    if mode == "store":
+        body, _ = render_profile(profiler, "html")
+        response.headers["X-Profile-Id"] = stored_profiles.add(f"{request.method} {route_path}", body)
+        return response
+    body, media_type = render_profile(profiler, mode)
+    return Response(content=body, media_type=media_type, headers={"X-Profiled-Status": str(response.status_code)})
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Latency histogram per route template (not raw path, to keep label cardinality bounded)"""
+    started = time.perf_counter()
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    # Lets the slow query log attribute commands to the route (scope gets the route once matched)
+    scope_token = current_request_scope.set(request.scope)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        current_request_scope.reset(scope_token)
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status_code)
+        ).observe(time.perf_counter() - started)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1056,9 +1880,31 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize admin user on startup"""
+    """Initialize indexes, counters and admin user on startup"""
+    await ensure_indexes()
+    await ensure_help_unread_counter()
     await ensure_admin_exists()
+    if loop_watchdog is not None:
+        loop_watchdog.start()
+    if client is not None:
+        slow_query_log.start(client)
+    telemetry_writer.start()
+    rollup_writer.start()
+    alert_heartbeats.start()
+    alert_sweeper.start()
+    notification_dispatcher.start()
+    notification_outbox.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if loop_watchdog is not None:
+        await loop_watchdog.stop()
+    await slow_query_log.stop()
+    await telemetry_writer.stop()
+    await rollup_writer.stop()
+    await alert_sweeper.stop()
+    await alert_heartbeats.stop()
+    await notification_outbox.stop()
+    await notification_dispatcher.close()
+    if client is not None:
+        await close_mongo_client(client)
\ No newline at end of file
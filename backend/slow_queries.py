@@ -0,0 +1,229 @@
+"""
+Slow MongoDB operation log, without turning on the server-side profiler.
+
+SlowQueryLog is a PyMongo command listener. Every read or write command
+slower than the threshold is logged as one JSON line with the route that
+issued it, the filter shape (values redacted, operators kept), the duration
+and, for a sampled fraction, an explain('executionStats') summary with the
+documents examined. Entries are aggregated by (route, collection, command,
+shape) so GET /api/admin/debug/slow-queries can show the top offenders.
+
+The listener runs on driver threads, so explains are handed to a background
+task on the event loop.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# ASGI scope of the request being handled, set by the HTTP middleware. Motor copies the
+# context onto its executor threads, so the listener can see which route issued a command.
+current_request_scope = contextvars.ContextVar("current_request_scope", default=None)
+
+TRACKED_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify", "getMore"}
+# Fields the driver adds to a command that explain does not accept
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "apiVersion", "apiStrict", "apiDeprecationErrors"}
+MAX_SHAPES = 500
+
+
+def current_route() -> str:
+    scope = current_request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return f"{scope.get('method')} {route.path if route is not None else scope.get('path')}"
+
+
+def redact(value):
+    """Replace every value with "?" keeping keys and $operators, so shapes group and never leak data"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [redact(item) for item in value]
+    return "?"
+
+
+def command_shape(command_name: str, command: dict):
+    """The redacted part of a command that decides its query plan"""
+    if command_name == "find":
+        return {"filter": redact(command.get("filter", {})), "sort": command.get("sort")}
+    if command_name == "aggregate":
+        return {"pipeline": redact(command.get("pipeline", []))}
+    if command_name in ("count", "distinct", "findAndModify"):
+        return {"query": redact(command.get("query", {}))}
+    if command_name == "update":
+        return {"q": [redact(update.get("q", {})) for update in command.get("updates", [])][:1]}
+    if command_name == "delete":
+        return {"q": [redact(delete.get("q", {})) for delete in command.get("deletes", [])][:1]}
+    return {}
+
+
+def explain_summary(explain: dict) -> dict:
+    """Plan stages and executionStats totals from an explain document"""
+    stages = set()
+    totals = {"docs_examined": 0, "keys_examined": 0, "returned": 0}
+
+    def walk(node):
+        if isinstance(node, dict):
+            if isinstance(node.get("stage"), str):
+                stages.add(node["stage"])
+            stats = node.get("executionStats")
+            if isinstance(stats, dict):
+                totals["docs_examined"] += stats.get("totalDocsExamined", 0)
+                totals["keys_examined"] += stats.get("totalKeysExamined", 0)
+                totals["returned"] += stats.get("nReturned", 0)
+            for key, item in node.items():
+                if key != "rejectedPlans":
+                    walk(item)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain)
+    return {"stages": sorted(stages), **totals}
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float = 100, explain_sample_rate: float = 0.1):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._loop = None
+        self._explains = None
+        self._worker = None
+
+    def start(self, mongo_client):
+        """Start the explain worker on the running loop"""
+        self._client = mongo_client
+        self._loop = asyncio.get_running_loop()
+        self._explains = asyncio.Queue(maxsize=100)
+        self._worker = self._loop.create_task(self._explain_worker())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def started(self, event):
+        if event.command_name not in TRACKED_COMMANDS:
+            return
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+            shape = {}
+        else:
+            collection = command.get(event.command_name)
+            shape = command_shape(event.command_name, command)
+        with self._lock:
+            self._pending[event.request_id] = (current_route(), collection, shape, event.database_name, command)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        with self._lock:
+            pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        route, collection, shape, database, command = pending
+        key = json.dumps([route, collection, event.command_name, shape], sort_keys=True, default=str)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= MAX_SHAPES:
+                    # Forget the cheapest shape to make room
+                    del self.entries[min(self.entries, key=lambda k: self.entries[k]["total_ms"])]
+                entry = self.entries[key] = {
+                    "route": route,
+                    "collection": collection,
+                    "command": event.command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "last_seen": None,
+                    "explain": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = time.time()
+
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "route": route,
+            "collection": collection,
+            "command": event.command_name,
+            "shape": shape,
+            "duration_ms": round(duration_ms, 1),
+        }, ensure_ascii=False, default=str))
+
+        if (self._loop is not None and event.command_name != "getMore"
+                and random.random() < self.explain_sample_rate):
+            body = {name: value for name, value in command.items() if name not in DRIVER_FIELDS}
+            self._loop.call_soon_threadsafe(self._enqueue_explain, key, database, body)
+
+    def _enqueue_explain(self, key: str, database: str, body: dict):
+        try:
+            self._explains.put_nowait((key, database, body))
+        except asyncio.QueueFull:
+            pass
+
+    async def _explain_worker(self):
+        while True:
+            key, database, body = await self._explains.get()
+            try:
+                explain = await self._client[database].command({"explain": body, "verbosity": "executionStats"})
+            except Exception as e:
+                logger.warning(f"Could not explain slow query: {e}")
+                continue
+            summary = explain_summary(explain)
+            with self._lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry["explain"] = summary
+                    route, collection, command = entry["route"], entry["collection"], entry["command"]
+            if entry is not None:
+                logger.warning(json.dumps({
+                    "event": "slow_query_explain",
+                    "route": route,
+                    "collection": collection,
+                    "command": command,
+                    **summary,
+                }, ensure_ascii=False))
+
+    def report(self, limit: int, sort: str = "total_ms") -> list:
+        """Top entries by total_ms, max_ms or count"""
+        with self._lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        for entry in entries:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 1)
+            entry["total_ms"] = round(entry["total_ms"], 1)
+            entry["max_ms"] = round(entry["max_ms"], 1)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
@@ -0,0 +1,108 @@
+"""
+Write-behind queue for telemetry such as users' last_login or alert heartbeats.
+
+Updates are recorded in memory and coalesced per key (a user id, an alert
+id; by default the latest value of each field wins, merge can sum counters
+instead), then flushed as one unordered bulk
+write every flush interval, or sooner once a batch worth of keys is pending.
+Memory is bounded: when max_pending keys are already waiting, updates for
+new keys are dropped and counted instead of queued. Whatever is pending is
+flushed on shutdown.
+
+Nothing here is durable: a crash loses at most one flush interval of
+telemetry, which is the trade-off for taking these writes off the request
+path.
+"""
+import asyncio
+import logging
+import time
+from itertools import islice
+from typing import Awaitable, Callable, Dict, Hashable
+
+from metrics import TELEMETRY_FLUSH_SECONDS, TELEMETRY_FLUSH_SIZE, TELEMETRY_PENDING, TELEMETRY_UPDATES
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryWriter:
+    def __init__(self, apply: Callable[[Dict[Hashable, dict]], Awaitable], name: str = "users",
+                 flush_interval: float = 0.25, max_batch: int = 500, max_pending: int = 50000,
+                 merge: Callable[[dict, dict], None] = dict.update):
+        # apply receives {key: fields} and writes them in one round trip
+        self.apply = apply
+        # Metric label
+        self.name = name
+        # merge(queued, fields) folds a new update into the one already pending for its key
+        self.merge = merge
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending = {}
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        """Start the flush loop on the running loop"""
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write out whatever is still pending"""
+        if self._task is not None:
+            # Not cancelled: a flush in progress has already taken its batch out of pending
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def record(self, key: Hashable, fields: dict) -> bool:
+        """Queue fields for key; False if the update was dropped"""
+        queued = self.pending.get(key)
+        if queued is not None:
+            self.merge(queued, fields)
+            TELEMETRY_UPDATES.labels(self.name, "coalesced").inc()
+            return True
+        if len(self.pending) >= self.max_pending:
+            TELEMETRY_UPDATES.labels(self.name, "dropped").inc()
+            return False
+        self.pending[key] = dict(fields)
+        TELEMETRY_UPDATES.labels(self.name, "queued").inc()
+        TELEMETRY_PENDING.labels(self.name).set(len(self.pending))
+        if len(self.pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self, apply: Callable[[Dict[Hashable, dict]], Awaitable] = None) -> int:
+        """Write everything pending, max_batch keys per bulk write; returns how many updates failed.
+
+        apply overrides the writer's own for this flush (e.g. an acknowledged write).
+        """
+        apply = apply or self.apply
+        failed = 0
+        while self.pending:
+            batch = {key: self.pending.pop(key) for key in list(islice(self.pending, self.max_batch))}
+            TELEMETRY_PENDING.labels(self.name).set(len(self.pending))
+            started = time.perf_counter()
+            try:
+                await apply(batch)
+            except Exception as e:
+                failed += len(batch)
+                TELEMETRY_UPDATES.labels(self.name, "failed").inc(len(batch))
+                logger.warning(f"Write-behind flush of {len(batch)} {self.name} failed: {e}")
+                continue
+            TELEMETRY_FLUSH_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+            TELEMETRY_FLUSH_SIZE.labels(self.name).observe(len(batch))
+            TELEMETRY_UPDATES.labels(self.name, "written").inc(len(batch))
+        return failed
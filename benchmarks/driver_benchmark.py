@@ -0,0 +1,192 @@
+"""
+Compare the Motor and native PyMongo asyncio drivers on the polling endpoints.
+
+Each driver runs in its own subprocess against a local MongoDB: the app is
+imported with MONGO_DRIVER set, a street of residents is seeded through the
+API, and /api/alerts, /api/emergency-notifications and
+/api/subscription-status are hammered in-process through httpx's ASGI
+transport, so the numbers reflect driver + handler cost without network or
+uvicorn overhead. The "memory" driver runs the same flow on the in-memory
+repositories as a no-database baseline.
+
+Usage:
+    python benchmarks/driver_benchmark.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+POLLING_ENDPOINTS = ["alerts", "emergency-notifications", "subscription-status"]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def seed_street(http, residents, alerts):
+    """Register residents on one street, give them subscriptions and raise some alerts"""
+    tokens = []
+    street = f"Rua Benchmark {int(time.time())}"
+    for i in range(residents):
+        response = await http.post("/api/register", json={
+            "name": f"Morador {i}",
+            "email": f"bench_{street.split()[-1]}_{i}@exemplo.com",
+            "password": "benchmark123",
+            "state": "SP",
+            "city": "São Paulo",
+            "neighborhood": "Centro",
+            "street": street,
+            "number": str(i + 1),
+            "resident_names": [f"Morador {i}"]
+        })
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        tokens.append(token)
+        await http.post(
+            "/api/create-subscription",
+            json={"payment_method": "pix"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    for i in range(alerts):
+        await http.post(
+            "/api/alerts",
+            json={"type": "roubo"},
+            headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        )
+    return tokens
+
+
+async def measure(http, endpoint, tokens, total_requests, concurrency):
+    """Issue total_requests GETs to endpoint with bounded concurrency and collect latencies"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await http.get(
+                f"/api/{endpoint}",
+                headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total_requests)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": endpoint,
+        "requests": total_requests,
+        "errors": errors,
+        "requests_per_second": round(total_requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def run_worker(args):
+    """Benchmark a single driver (runs inside a subprocess)"""
+    if args.driver == "memory":
+        os.environ["DATA_BACKEND"] = "memory"
+    else:
+        os.environ["MONGO_DRIVER"] = args.driver
+    os.environ["DB_NAME"] = args.db_name
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    import httpx
+    import server
+
+    if server.client is not None:
+        await server.client.drop_database(args.db_name)
+
+    transport = httpx.ASGITransport(app=server.app)
+    # ASGITransport does not send lifespan events: run startup (indexes, the notification outbox) and shutdown ourselves
+    async with server.app.router.lifespan_context(server.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://benchmark") as http:
+        tokens = await seed_street(http, args.residents, args.alerts)
+        # Polls must find the alerts' notifications in the inbox
+        await server.notification_outbox.drain()
+        # Warm up connection pools and code paths before timing
+        for endpoint in POLLING_ENDPOINTS:
+            await measure(http, endpoint, tokens, min(100, args.requests), args.concurrency)
+        results = [
+            await measure(http, endpoint, tokens, args.requests, args.concurrency)
+            for endpoint in POLLING_ENDPOINTS
+        ]
+        # Before shutdown closes the client
+        if server.client is not None:
+            await server.client.drop_database(args.db_name)
+    print(json.dumps({"driver": args.driver, "results": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=None, help="Defaults to MONGO_URL from backend/.env")
+    parser.add_argument("--db-name", default="safezone_driver_benchmark")
+    parser.add_argument("--drivers", nargs="+", default=["motor", "pymongo"], help="motor, pymongo and/or memory")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--residents", type=int, default=50)
+    parser.add_argument("--alerts", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--driver", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.driver:
+        asyncio.run(run_worker(args))
+        return
+
+    passthrough = [
+        "--db-name", args.db_name,
+        "--requests", str(args.requests),
+        "--concurrency", str(args.concurrency),
+        "--residents", str(args.residents),
+        "--alerts", str(args.alerts),
+    ]
+    if args.mongo_url:
+        passthrough += ["--mongo-url", args.mongo_url]
+
+    reports = []
+    for driver in args.drivers:
+        completed = subprocess.run(
+            [sys.executable, __file__, "--driver", driver] + passthrough,
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"❌ {driver} failed:\n{completed.stderr}")
+            continue
+        reports.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'driver':<10}{'endpoint':<26}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for report in reports:
+        for result in report["results"]:
+            print(
+                f"{report['driver']:<10}{result['endpoint']:<26}{result['requests_per_second']:>10}"
+                f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}"
+            )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,565 @@
+"""
+Populate a local MongoDB with a realistic SafeZone dataset for benchmarks.
+
+Randomness is drawn with NumPy in whole-array operations; documents are
+then assembled chunk by chunk and written with insert_many in large
+batches. Distributions:
+
+  * street density is heavy-tailed (Pareto weights), so a few streets hold
+    hundreds of residents while most hold a handful;
+  * subscriptions cover the whole lifecycle: trial, overdue (from trial and
+    from active), blocked, active and cancelled, with dates consistent with
+    the billing rules in server.py;
+  * alerts are spread over --months, with an emergency notification per
+    alert targeting the requester's street neighbors, as create_alert does;
+    active alerts have a heartbeat from the last few seconds;
+  * each neighbor gets a notification_inbox item: those of active alerts
+    are unacknowledged (most already delivered), those of ended alerts are
+    acknowledged except for residents who have not opened the app since;
+    acknowledged items older than the inbox retention are left out, as the
+    TTL index would have removed them;
+  * help messages are pending, read or resolved.
+
+Documents have exactly the shape written by register_user/login_user,
+create_subscription (plus the updates of the status endpoints),
+create_alert and send_help_message: the key sets are checked against the
+Pydantic models before anything is written. Every user shares the password
+"safezone123" (hashing millions of passwords would take hours).
+
+After loading, indexes are created, the unread help counter is seeded and
+the daily rollups are rebuilt through the app's own repositories.
+
+Usage:
+    python benchmarks/generate_dataset.py --users 1000000 --months 6 --drop
+    python benchmarks/generate_dataset.py --check-only
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+PASSWORD = "safezone123"
+DAY_US = 24 * 3600 * 10**6
+# repositories.INBOX_RETENTION_SECONDS
+INBOX_RETENTION_US = 30 * DAY_US
+# Share of residents whose inbox items are still unacknowledged after their alert ended
+INBOX_UNREAD_RATE = 0.1
+
+STATES = {
+    "SP": ["São Paulo", "Campinas", "Santos", "Ribeirão Preto"],
+    "RJ": ["Rio de Janeiro", "Niterói", "Petrópolis"],
+    "MG": ["Belo Horizonte", "Uberlândia", "Juiz de Fora"],
+    "RS": ["Porto Alegre", "Caxias do Sul"],
+    "PR": ["Curitiba", "Londrina"],
+    "BA": ["Salvador", "Feira de Santana"],
+    "PE": ["Recife", "Olinda"],
+    "DF": ["Brasília"],
+}
+STATE_WEIGHTS = [0.35, 0.18, 0.14, 0.08, 0.08, 0.07, 0.06, 0.04]
+NEIGHBORHOODS = ["Centro", "Vila Nova", "Jardim América", "Boa Vista", "Santa Cecília", "Bela Vista",
+                 "Liberdade", "Copacabana", "Savassi", "Moinhos de Vento", "Batel", "Barra"]
+STREET_NAMES = ["Rua das Flores", "Av. Paulista", "Rua XV de Novembro", "Rua Sete de Setembro",
+                "Av. Brasil", "Rua da Paz", "Rua São João", "Rua Tiradentes", "Av. Atlântica",
+                "Rua Augusta", "Rua Bahia", "Rua Goiás"]
+FIRST_NAMES = np.array(["Maria", "José", "Ana", "João", "Francisca", "Antônio", "Juliana", "Carlos",
+                        "Fernanda", "Paulo", "Patrícia", "Lucas", "Aline", "Marcos", "Camila", "Pedro"])
+LAST_NAMES = np.array(["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves",
+                       "Pereira", "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho"])
+COUNTRIES = np.array(["BRA", "PRT", "ARG", "USA"])
+COUNTRY_WEIGHTS = [0.94, 0.03, 0.02, 0.01]
+PAYMENT_METHODS = np.array(["pix", "boleto", "credit-card", "swift-wire"])
+PAYMENT_WEIGHTS = [0.5, 0.2, 0.27, 0.03]
+ALERT_TYPES = np.array(["roubo", "invasão", "emergência"])
+ALERT_WEIGHTS = [0.45, 0.35, 0.2]
+HELP_MESSAGES = np.array([
+    "Não consigo ativar o alarme.", "Como altero meu endereço?", "Meu pagamento não foi confirmado.",
+    "Os vizinhos não recebem meus alertas.", "Quero cancelar minha assinatura.", "O aplicativo está lento.",
+])
+HELP_STATUSES = np.array(["pending", "read", "resolved"])
+HELP_STATUS_WEIGHTS = [0.3, 0.2, 0.5]
+
+
+def iso_strings(epoch_us: np.ndarray) -> np.ndarray:
+    """UTC ISO strings exactly as datetime.isoformat() writes them (no fraction when microseconds are 0)"""
+    text = np.datetime_as_string(epoch_us.astype("datetime64[us]"), unit="us")
+    text = np.char.add(text, "+00:00")
+    return np.where(epoch_us % 10**6 == 0, np.char.replace(text, ".000000+", "+"), text)
+
+
+def uuid4_strings(rng: np.random.Generator, count: int) -> list:
+    """Random version-4 UUID strings, like the models' default ids"""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    return [str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw]
+
+
+def to_datetime(epoch_us: int) -> datetime:
+    return datetime.fromtimestamp(epoch_us / 10**6, tz=timezone.utc)
+
+
+class City:
+    """Streets with heavy-tailed resident counts"""
+
+    def __init__(self, rng, users, mean_residents, pareto_shape, max_street_factor=40):
+        self.count = max(1, users // mean_residents)
+        states = list(STATES)
+        state_index = rng.choice(len(states), size=self.count, p=STATE_WEIGHTS)
+        self.state = np.array(states)[state_index]
+        self.city = np.array([STATES[state][rng.integers(len(STATES[state]))] for state in self.state])
+        self.neighborhood = np.array(NEIGHBORHOODS)[rng.integers(len(NEIGHBORHOODS), size=self.count)]
+        base_names = np.array(STREET_NAMES)[rng.integers(len(STREET_NAMES), size=self.count)]
+        # Suffix keeps every street distinct within its neighborhood
+        self.street = np.char.add(np.char.add(base_names, " "), np.arange(self.count).astype(str))
+        weights = rng.pareto(pareto_shape, size=self.count) + 1
+        # Cap the tail so the biggest street is a tower block, not a whole district
+        weights = np.minimum(weights, max_street_factor * weights.mean())
+        self.weights = weights / weights.sum()
+
+
+def generate_users(rng, city, count, now_us, months):
+    """Column arrays for every user"""
+    street = rng.choice(city.count, size=count, p=city.weights)
+    first = FIRST_NAMES[rng.integers(len(FIRST_NAMES), size=count)]
+    last = LAST_NAMES[rng.integers(len(LAST_NAMES), size=count)]
+    names = np.char.add(np.char.add(first, " "), last)
+    # Sign-ups spread over the last months*2, weighted towards recent growth
+    age_us = (rng.power(0.6, size=count) * months * 2 * 30 * DAY_US).astype(np.int64)
+    created_us = now_us - age_us
+    logged_in = rng.random(count) < 0.9
+    last_login_us = created_us + (rng.random(count) * (now_us - created_us)).astype(np.int64)
+    return {
+        "id": uuid4_strings(rng, count),
+        "street": street,
+        "name": names,
+        "email": np.char.add(np.char.add("morador", np.arange(count).astype(str)), "@exemplo.com"),
+        "number": rng.integers(1, 3000, size=count).astype(str),
+        "extra_residents": rng.integers(0, 4, size=count),
+        "country_code": COUNTRIES[rng.choice(len(COUNTRIES), size=count, p=COUNTRY_WEIGHTS)],
+        "is_vip": rng.random(count) < 0.01,
+        "vip_expires_us": np.where(rng.random(count) < 0.5, -1, now_us + rng.integers(1, 365, size=count) * DAY_US),
+        "created_us": created_us,
+        "created_at": iso_strings(created_us),
+        "logged_in": logged_in,
+        "last_login_us": last_login_us,
+    }
+
+
+def user_documents(users, city, start, stop, password_hash):
+    """register_user documents (with last_login as login_user writes it: a BSON date)"""
+    documents = []
+    for i in range(start, stop):
+        street = users["street"][i]
+        name = str(users["name"][i])
+        extra = [f"{FIRST_NAMES[(i + k) % len(FIRST_NAMES)]} {name.split()[-1]}" for k in range(users["extra_residents"][i])]
+        is_vip = bool(users["is_vip"][i])
+        vip_expires_us = int(users["vip_expires_us"][i])
+        documents.append({
+            "id": users["id"][i],
+            "name": name,
+            "email": str(users["email"][i]),
+            "state": str(city.state[street]),
+            "city": str(city.city[street]),
+            "neighborhood": str(city.neighborhood[street]),
+            "street": str(city.street[street]),
+            "number": str(users["number"][i]),
+            "resident_names": [name] + extra,
+            "country_code": str(users["country_code"][i]),
+            "is_admin": False,
+            "is_vip": is_vip,
+            "vip_expires_at": str(iso_strings(np.array([vip_expires_us]))[0]) if is_vip and vip_expires_us > 0 else None,
+            "created_at": str(users["created_at"][i]),
+            "last_login": to_datetime(int(users["last_login_us"][i])) if users["logged_in"][i] else None,
+            "password": password_hash,
+        })
+    return documents
+
+
+def generate_subscriptions(rng, users, now_us):
+    """Column arrays for one subscription per subscribed user, with a lifecycle consistent with the billing rules"""
+    subscribed = np.flatnonzero((rng.random(len(users["id"])) < 0.85) & ~users["is_vip"])
+    count = len(subscribed)
+    created = users["created_us"][subscribed] + rng.integers(0, 2 * DAY_US, size=count)
+    created = np.minimum(created, now_us - 1)
+    trial_end = created + 30 * DAY_US
+    payment_due = trial_end + 5 * DAY_US
+
+    status = np.full(count, "trial", dtype=object)
+    in_grace = (now_us >= trial_end) & (now_us < payment_due)
+    past_trial = now_us >= payment_due
+    outcome = rng.choice(4, size=count, p=[0.70, 0.05, 0.15, 0.10])  # active, overdue, blocked, cancelled
+    status[in_grace] = "overdue"  # trial -> overdue
+    status[past_trial & (outcome == 0)] = "active"
+    status[past_trial & (outcome == 1)] = "overdue"  # active -> overdue
+    status[past_trial & (outcome == 2)] = "blocked"
+    status[past_trial & (outcome == 3)] = "cancelled"
+
+    # Paying subscriptions: last payment inside the current (or, for overdue, previous) cycle
+    last_payment = np.where(status == "active", now_us - rng.integers(0, 30 * DAY_US, size=count),
+                            now_us - rng.integers(30 * DAY_US, 35 * DAY_US, size=count))
+    paid = (status == "active") | ((status == "overdue") & past_trial)
+    last_payment = np.maximum(last_payment, trial_end)
+    next_payment = np.where(paid, last_payment + 30 * DAY_US, trial_end)
+    due = np.where(paid & (status == "overdue"), next_payment + 5 * DAY_US, payment_due)
+    blocked_at = payment_due + rng.integers(0, 3 * DAY_US, size=count)
+    cancelled_at = created + (rng.random(count) * (now_us - created)).astype(np.int64)
+
+    return {
+        "user_index": subscribed,
+        "id": uuid4_strings(rng, count),
+        "payment_method": PAYMENT_METHODS[rng.choice(len(PAYMENT_METHODS), size=count, p=PAYMENT_WEIGHTS)],
+        "status": status,
+        "paid": paid,
+        "created_at": iso_strings(created),
+        "trial_end_date": iso_strings(trial_end),
+        "next_payment": iso_strings(next_payment),
+        "payment_due_date": iso_strings(due),
+        "grace_period_end": iso_strings(payment_due),
+        "last_payment_date": iso_strings(last_payment),
+        "blocked_at": iso_strings(np.minimum(blocked_at, now_us)),
+        "cancelled_at": iso_strings(cancelled_at),
+    }
+
+
+def subscription_documents(subs, users, start, stop):
+    """create_subscription documents with the fields the status endpoints later set"""
+    documents = []
+    for i in range(start, stop):
+        status = subs["status"][i]
+        paid = bool(subs["paid"][i])
+        document = {
+            "id": subs["id"][i],
+            "user_id": users["id"][subs["user_index"][i]],
+            "payment_method": str(subs["payment_method"][i]),
+            "status": status,
+            "start_date": str(subs["created_at"][i]),
+            "trial_end_date": str(subs["trial_end_date"][i]),
+            "next_payment": str(subs["next_payment"][i]),
+            "payment_due_date": str(subs["payment_due_date"][i]),
+            "grace_period_end": str(subs["grace_period_end"][i]),
+            "is_trial": not paid,
+            "amount": 30.0,
+            "billing_cycle": "monthly",
+            "created_at": str(subs["created_at"][i]),
+            "last_payment_date": str(subs["last_payment_date"][i]) if paid else None,
+            "blocked_at": str(subs["blocked_at"][i]) if status == "blocked" else None,
+        }
+        if status == "cancelled":
+            document["cancelled_at"] = str(subs["cancelled_at"][i])
+        documents.append(document)
+    return documents
+
+
+def generate_alerts(rng, users, count, now_us, months):
+    """Column arrays for alerts raised by random users over the last months"""
+    window = months * 30 * DAY_US
+    requester = rng.integers(0, len(users["id"]), size=count)
+    timestamp = now_us - (rng.random(count) * window).astype(np.int64)
+    timestamp = np.maximum(timestamp, users["created_us"][requester])
+    # Only alerts from the last hour can still be active
+    active = (now_us - timestamp < 3600 * 10**6) & (rng.random(count) < 0.5)
+    # Active alerts beat every 5 s; the others stopped beating up to 10 min after they were raised
+    last_heartbeat = np.where(
+        active,
+        now_us - rng.integers(0, 5 * 10**6, size=count),
+        timestamp + rng.integers(0, 600 * 10**6, size=count)
+    )
+    last_heartbeat = np.clip(last_heartbeat, timestamp, now_us)
+    return {
+        "id": uuid4_strings(rng, count),
+        "notification_id": uuid4_strings(rng, count),
+        "requester": requester,
+        "type": ALERT_TYPES[rng.choice(len(ALERT_TYPES), size=count, p=ALERT_WEIGHTS)],
+        "timestamp_us": timestamp,
+        "timestamp": iso_strings(timestamp),
+        "last_heartbeat_us": last_heartbeat,
+        "last_heartbeat": iso_strings(last_heartbeat),
+        "is_active": active,
+        "lat": -23.55 + rng.normal(0, 0.01, size=count),
+        "lng": -46.63 + rng.normal(0, 0.01, size=count),
+    }
+
+
+def alert_documents(alerts, users, city, street_members, start, stop, with_notifications, rng, now_us):
+    """create_alert documents plus the matching emergency notification and neighbors' inbox items"""
+    alert_docs, notification_docs, inbox_docs = [], [], []
+    for i in range(start, stop):
+        requester = alerts["requester"][i]
+        street = users["street"][requester]
+        name = str(users["name"][requester])
+        state, city_name = str(city.state[street]), str(city.city[street])
+        neighborhood, street_name = str(city.neighborhood[street]), str(city.street[street])
+        number = str(users["number"][requester])
+        alert_docs.append({
+            "id": alerts["id"][i],
+            "type": str(alerts["type"][i]),
+            "user_id": users["id"][requester],
+            "user_name": name,
+            "state": state,
+            "city": city_name,
+            "neighborhood": neighborhood,
+            "street": street_name,
+            "number": number,
+            "location": {"lat": float(alerts["lat"][i]), "lng": float(alerts["lng"][i])},
+            "timestamp": str(alerts["timestamp"][i]),
+            "last_heartbeat": str(alerts["last_heartbeat"][i]),
+            "is_active": bool(alerts["is_active"][i]),
+        })
+        if with_notifications:
+            targets = [users["id"][member] for member in street_members[street] if member != requester]
+            address = f"{street_name}, {number}, {neighborhood}, {city_name} - {state}"
+            notification_docs.append({
+                "alert_id": alerts["id"][i],
+                "alert_type": str(alerts["type"][i]),
+                "requester_name": name,
+                "requester_address": address,
+                "target_users": targets,
+                "created_at": str(alerts["timestamp"][i]),
+                "is_silent_for_requester": True,
+            })
+            inbox_docs.extend(inbox_documents(alerts, i, name, address, targets, rng, now_us))
+    return alert_docs, notification_docs, inbox_docs
+
+
+def inbox_documents(alerts, i, requester_name, requester_address, targets, rng, now_us):
+    """notification_inbox items of alert i, in the states polls and acknowledgements leave them in"""
+    created_us = int(alerts["timestamp_us"][i])
+    active = bool(alerts["is_active"][i])
+    # First poll within 10 s; ended alerts were acknowledged within a day of their last heartbeat
+    delivered_us = np.minimum(created_us + rng.integers(0, 10 * 10**6, size=len(targets)), now_us)
+    acknowledged_us = np.minimum(int(alerts["last_heartbeat_us"][i]) + rng.integers(0, DAY_US, size=len(targets)), now_us)
+    unread = rng.random(len(targets)) < (0.3 if active else INBOX_UNREAD_RATE)
+
+    created = to_datetime(created_us)
+    documents = []
+    for j, user_id in enumerate(targets):
+        document = {
+            "user_id": user_id,
+            "alert_id": alerts["id"][i],
+            "alert_type": str(alerts["type"][i]),
+            "requester_name": requester_name,
+            "requester_address": requester_address,
+            "created_at": created,
+            "delivered_at": None if unread[j] else to_datetime(int(delivered_us[j])),
+            "acknowledged": False,
+        }
+        if not active and not unread[j]:
+            if now_us - acknowledged_us[j] > INBOX_RETENTION_US:
+                continue
+            document["acknowledged"] = True
+            document["acknowledged_at"] = to_datetime(int(acknowledged_us[j]))
+            document["closed"] = True
+        documents.append(document)
+    return documents
+
+
+def help_documents(rng, users, city, count, now_us, months):
+    """send_help_message documents, some answered by an admin"""
+    author = rng.integers(0, len(users["id"]), size=count)
+    created = np.maximum(now_us - (rng.random(count) * months * 30 * DAY_US).astype(np.int64), users["created_us"][author])
+    resolved = np.minimum(created + rng.integers(3600 * 10**6, 3 * DAY_US, size=count), now_us)
+    status = HELP_STATUSES[rng.choice(len(HELP_STATUSES), size=count, p=HELP_STATUS_WEIGHTS)]
+    message = HELP_MESSAGES[rng.integers(len(HELP_MESSAGES), size=count)]
+    ids = uuid4_strings(rng, count)
+    created_iso, resolved_iso = iso_strings(created), iso_strings(resolved)
+
+    documents = []
+    for i in range(count):
+        user = author[i]
+        street = users["street"][user]
+        is_resolved = status[i] == "resolved"
+        documents.append({
+            "id": ids[i],
+            "user_id": users["id"][user],
+            "user_name": str(users["name"][user]),
+            "user_email": str(users["email"][user]),
+            "user_address": f"{city.street[street]}, {users['number'][user]}, {city.neighborhood[street]}, {city.city[street]} - {city.state[street]}",
+            "message": str(message[i]),
+            "status": str(status[i]),
+            "created_at": str(created_iso[i]),
+            "admin_response": "Obrigado pelo contato! Já verificamos." if is_resolved else None,
+            "resolved_at": str(resolved_iso[i]) if is_resolved else None,
+        })
+    return documents
+
+
+def check_shapes():
+    """Fail loudly if generated documents drift from what the API writes"""
+    import server
+
+    # The models are dumped with .dict() like the API does
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    rng = np.random.default_rng(0)
+    now_us = int(time.time() * 10**6)
+    city = City(rng, 200, 10, 1.2)
+    users = generate_users(rng, city, 200, now_us, 6)
+    subs = generate_subscriptions(rng, users, now_us)
+    alerts = generate_alerts(rng, users, 20, now_us, 6)
+    members = [np.flatnonzero(users["street"] == street) for street in range(city.count)]
+
+    user_doc = user_documents(users, city, 0, 1, "hash")[0]
+    sub_docs = subscription_documents(subs, users, 0, len(subs["id"]))
+    # Every sample alert, so inbox items in each state are checked
+    alert_docs, notification_docs, inbox_docs = alert_documents(alerts, users, city, members, 0, 20, True, rng, now_us)
+    help_doc = help_documents(rng, users, city, 1, now_us, 6)[0]
+
+    sample = dict(name="x", email="x@exemplo.com", state="SP", city="São Paulo", neighborhood="Centro",
+                  street="Rua", number="1", resident_names=["x"])
+    expected = {
+        "users": set(server.User(**sample).dict()) | {"password"},
+        "subscriptions": set(server.Subscription(user_id="x", payment_method="pix").dict()),
+        "alerts": set(server.Alert(type="roubo", user_id="x", user_name="x", state="SP", city="SP",
+                                   neighborhood="C", street="R", number="1").dict()),
+        "emergency_notifications": set(server.EmergencyNotification(alert_id="x", alert_type="roubo", requester_name="x",
+                                                                    requester_address="x", target_users=[]).dict()),
+        "notification_inbox": set(server.InboxItem(user_id="x", alert_id="x", alert_type="roubo", requester_name="x",
+                                                   requester_address="x", created_at=datetime.now(timezone.utc)).dict()),
+        "help_messages": set(server.HelpMessage(user_id="x", user_name="x", user_email="x", user_address="x",
+                                                message="x").dict()),
+    }
+    generated = {
+        "users": [user_doc],
+        "subscriptions": sub_docs,
+        "alerts": alert_docs,
+        "emergency_notifications": notification_docs,
+        "notification_inbox": inbox_docs,
+        "help_messages": [help_doc],
+    }
+    if len({document["acknowledged"] for document in inbox_docs}) != 2:
+        raise SystemExit("❌ the sample needs both acknowledged and unacknowledged inbox items")
+    for collection, documents in generated.items():
+        for document in documents:
+            keys = set(document)
+            # cancel_subscription adds cancelled_at on top of the model fields
+            if collection == "subscriptions" and document["status"] == "cancelled":
+                keys -= {"cancelled_at"}
+            # Acknowledging an item of an ended alert adds acknowledged_at and closed
+            if collection == "notification_inbox" and document["acknowledged"]:
+                keys -= {"acknowledged_at", "closed"}
+            if keys != expected[collection]:
+                raise SystemExit(f"❌ {collection} shape drifted: {sorted(keys ^ expected[collection])}")
+        server.parse_from_mongo(dict(documents[0]))
+    print("✅ Generated document shapes match the API models")
+
+
+def insert_batches(collection, documents, batch_size):
+    for start in range(0, len(documents), batch_size):
+        collection.insert_many(documents[start:start + batch_size], ordered=False)
+
+
+async def finalize():
+    """Create indexes, seed counters and rebuild rollups through the app's repositories"""
+    import server
+
+    await server.ensure_indexes()
+    await server.ensure_help_unread_counter()
+    # A freshly loaded database has no login history to lose, so logins are rebuilt too
+    await server.repos.daily_rollups.rebuild(list(server.ROLLUP_METRICS))
+    await server.close_mongo_client(server.client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=6, help="Months of alert and help history")
+    parser.add_argument("--mean-residents", type=int, default=25, help="Average residents per street")
+    parser.add_argument("--pareto-shape", type=float, default=1.2, help="Lower = heavier street-density tail")
+    parser.add_argument("--max-street-factor", type=float, default=40, help="Largest street, as a multiple of the mean")
+    parser.add_argument("--alerts-per-user-month", type=float, default=0.02)
+    parser.add_argument("--help-per-user", type=float, default=0.01)
+    parser.add_argument("--no-notifications", action="store_true", help="Skip emergency_notifications and notification_inbox")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Documents assembled at a time")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Documents per insert_many")
+    parser.add_argument("--mongo-url", default=None, help="Defaults to MONGO_URL from backend/.env")
+    parser.add_argument("--db-name", default=None, help="Defaults to DB_NAME from backend/.env")
+    parser.add_argument("--drop", action="store_true", help="Drop the database first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--check-only", action="store_true", help="Only validate document shapes")
+    args = parser.parse_args()
+
+    if args.check_only:
+        os.environ.setdefault("DATA_BACKEND", "memory")
+        check_shapes()
+        return
+
+    from dotenv import load_dotenv
+    from passlib.context import CryptContext
+    from pymongo import MongoClient
+
+    load_dotenv(BACKEND_DIR / ".env")
+    mongo_url = args.mongo_url or os.environ["MONGO_URL"]
+    db_name = args.db_name or os.environ["DB_NAME"]
+    os.environ["MONGO_URL"] = mongo_url
+    # finalize() reuses the app imported here
+    os.environ["DB_NAME"] = db_name
+    # Before anything is dropped or written
+    check_shapes()
+
+    rng = np.random.default_rng(args.seed)
+    now_us = int(time.time() * 10**6)
+    started = time.perf_counter()
+
+    client = MongoClient(mongo_url)
+    if args.drop:
+        client.drop_database(db_name)
+    db = client[db_name]
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+
+    city = City(rng, args.users, args.mean_residents, args.pareto_shape, args.max_street_factor)
+    users = generate_users(rng, city, args.users, now_us, args.months)
+    sizes = np.bincount(users["street"], minlength=city.count)
+    print(f"🏙️  {city.count} streets, residents per street: median {int(np.median(sizes))}, "
+          f"p99 {int(np.percentile(sizes, 99))}, max {sizes.max()}")
+
+    for start in range(0, args.users, args.chunk_size):
+        stop = min(start + args.chunk_size, args.users)
+        insert_batches(db.users, user_documents(users, city, start, stop, password_hash), args.batch_size)
+    print(f"👥 {args.users} users ({time.perf_counter() - started:.1f}s)")
+
+    subs = generate_subscriptions(rng, users, now_us)
+    for start in range(0, len(subs["id"]), args.chunk_size):
+        stop = min(start + args.chunk_size, len(subs["id"]))
+        insert_batches(db.subscriptions, subscription_documents(subs, users, start, stop), args.batch_size)
+    statuses, counts = np.unique(subs["status"].astype(str), return_counts=True)
+    print(f"💳 {len(subs['id'])} subscriptions: {dict(zip(statuses, counts.tolist()))}")
+
+    alert_count = int(args.users * args.alerts_per_user_month * args.months)
+    alerts = generate_alerts(rng, users, alert_count, now_us, args.months)
+    order = np.argsort(users["street"], kind="stable")
+    boundaries = np.cumsum(sizes)[:-1]
+    street_members = np.split(order, boundaries)
+    inbox_count = 0
+    for start in range(0, alert_count, args.chunk_size):
+        stop = min(start + args.chunk_size, alert_count)
+        alert_docs, notification_docs, inbox_docs = alert_documents(
+            alerts, users, city, street_members, start, stop, not args.no_notifications, rng, now_us
+        )
+        insert_batches(db.alerts, alert_docs, args.batch_size)
+        if notification_docs:
+            insert_batches(db.emergency_notifications, notification_docs, args.batch_size)
+        if inbox_docs:
+            insert_batches(db.notification_inbox, inbox_docs, args.batch_size)
+            inbox_count += len(inbox_docs)
+    print(f"🚨 {alert_count} alerts, {inbox_count} inbox items")
+
+    help_count = int(args.users * args.help_per_user)
+    if help_count:
+        insert_batches(db.help_messages, help_documents(rng, users, city, help_count, now_us, args.months), args.batch_size)
+    print(f"💬 {help_count} help messages")
+
+    client.close()
+    asyncio.run(finalize())
+    print(f"✅ Done in {time.perf_counter() - started:.1f}s (password for every user: {PASSWORD})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Simulate a city of residents polling the SafeZone API and estimate how many
+users a single worker can hold.
+
+The city is N streets x M residents. Every resident polls
+/api/emergency-notifications every 10 s and /api/subscription-status every
+30 min (both scaled by --time-scale to compress a run), and alert bursts
+make K residents of a random street raise alerts at once.
+
+Two phases are run:
+  1. the simulated city, reporting p50/p99 latency and throughput per
+     endpoint (and MongoDB commands per request when running in-process
+     against MongoDB);
+  2. a closed-loop saturation probe on the polling mix, whose throughput
+     gives the capacity estimate:
+         users/worker = saturated req/s x target utilization / req/s per user
+
+By default the app runs in-process through httpx's ASGI transport (one
+worker = this process), with the app's startup and shutdown hooks run
+around it so the background tasks (notification outbox, write-behind
+telemetry) are live as under uvicorn. Pass --url to drive a local uvicorn
+instead, e.g.
+    uvicorn server:app --app-dir backend --workers 1
+    python benchmarks/load_test.py --url http://127.0.0.1:8000
+
+Usage:
+    python benchmarks/load_test.py --streets 50 --residents 20 --duration 60 --time-scale 10
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from pymongo import monitoring
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+NOTIFICATION_INTERVAL = 10.0          # seconds, as in the frontend
+SUBSCRIPTION_INTERVAL = 30 * 60.0     # seconds, as in the frontend
+REQUESTS_PER_USER_PER_SECOND = 1 / NOTIFICATION_INTERVAL + 1 / SUBSCRIPTION_INTERVAL
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    pymongo CommandListener counting the commands the routes send to MongoDB.
+    Only commands issued while a request is being handled count (the scope
+    the server's middleware sets for the slow query log), so the background
+    tasks (outbox, heartbeat sweeper, write-behind flushes) and connection
+    housekeeping are not charged to the requests.
+    """
+
+    # Connection housekeeping, not round trips issued by a route
+    IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "buildInfo", "endSessions", "saslStart", "saslContinue"}
+
+    def __init__(self, request_scope):
+        self.request_scope = request_scope
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED_COMMANDS and self.request_scope.get() is not None:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class Stats:
+    """Latency samples per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, http, method, path, name, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, path, **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        if failed:
+            self.errors[name] += 1
+
+    def total(self):
+        return sum(len(samples) for samples in self.latencies.values())
+
+
+def build_app(args):
+    """Import the app in-process and, for MongoDB, attach a command counter"""
+    if args.backend == "memory":
+        os.environ["DATA_BACKEND"] = "memory"
+    os.environ["DB_NAME"] = args.db_name
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    counter = None
+    if args.backend == "mongo":
+        from slow_queries import current_request_scope
+
+        # Registered globally before the server creates its client, so the counter rides along
+        # with the server's own options, listeners and read preferences instead of replacing them
+        counter = CommandCounter(current_request_scope)
+        monitoring.register(counter)
+
+    import server
+
+    if server.client is None:
+        counter = None
+    return server, counter
+
+
+async def seed_in_process(server, streets, residents):
+    """Insert the city straight through the repositories (registering through the API would spend minutes in bcrypt)"""
+    if server.client is not None:
+        await server.client.drop_database(server.db.name)
+    await server.ensure_indexes()
+
+    password = server.get_password_hash("loadtest123")
+    tokens_by_street = []
+    for street_index in range(streets):
+        street_tokens = []
+        documents = []
+        subscriptions = []
+        for resident_index in range(residents):
+            user = server.User(
+                name=f"Morador {street_index}-{resident_index}",
+                email=f"load_{street_index}_{resident_index}@exemplo.com",
+                state="SP",
+                city="São Paulo",
+                neighborhood="Centro",
+                street=f"Rua Carga {street_index}",
+                number=str(resident_index + 1),
+                resident_names=[f"Morador {street_index}-{resident_index}"]
+            )
+            user_dict = server.prepare_for_mongo(user.dict())
+            user_dict["password"] = password
+            documents.append(user_dict)
+            subscriptions.append(server.prepare_for_mongo(server.Subscription(user_id=user.id, payment_method="pix").dict()))
+            street_tokens.append(server.create_access_token(data={"sub": user.id}, expires_delta=timedelta(days=1)))
+        await server.repos.users.insert_many(documents)
+        for subscription in subscriptions:
+            await server.repos.subscriptions.insert(subscription)
+        tokens_by_street.append(street_tokens)
+    return tokens_by_street
+
+
+async def seed_over_http(http, streets, residents, concurrency):
+    """Register the city through the API (used against a running uvicorn)"""
+    run_id = int(time.time())
+    semaphore = asyncio.Semaphore(concurrency)
+    tokens_by_street = [[None] * residents for _ in range(streets)]
+
+    async def register(street_index, resident_index):
+        async with semaphore:
+            response = await http.post("/api/register", json={
+                "name": f"Morador {street_index}-{resident_index}",
+                "email": f"load_{run_id}_{street_index}_{resident_index}@exemplo.com",
+                "password": "loadtest123",
+                "state": "SP",
+                "city": "São Paulo",
+                "neighborhood": "Centro",
+                "street": f"Rua Carga {run_id} {street_index}",
+                "number": str(resident_index + 1),
+                "resident_names": [f"Morador {street_index}-{resident_index}"]
+            })
+            response.raise_for_status()
+            token = response.json()["access_token"]
+            await http.post(
+                "/api/create-subscription",
+                json={"payment_method": "pix"},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            tokens_by_street[street_index][resident_index] = token
+
+    await asyncio.gather(*[
+        register(street_index, resident_index)
+        for street_index in range(streets)
+        for resident_index in range(residents)
+    ])
+    return tokens_by_street
+
+
+async def simulate_city(http, tokens_by_street, args, stats):
+    """Run every resident's polling loop plus the alert bursts until the duration elapses"""
+    deadline = time.perf_counter() + args.duration
+    notification_interval = NOTIFICATION_INTERVAL / args.time_scale
+    subscription_interval = SUBSCRIPTION_INTERVAL / args.time_scale
+
+    async def resident(token):
+        headers = {"Authorization": f"Bearer {token}"}
+        # Residents opened the app at random moments
+        next_notification = time.perf_counter() + random.uniform(0, notification_interval)
+        next_subscription = time.perf_counter() + random.uniform(0, subscription_interval)
+        while True:
+            wake = min(next_notification, next_subscription)
+            if wake >= deadline:
+                return
+            await asyncio.sleep(max(0.0, wake - time.perf_counter()))
+            if next_notification <= next_subscription:
+                await stats.call(http, "GET", "/api/emergency-notifications", "emergency-notifications", headers=headers)
+                next_notification += notification_interval
+            else:
+                await stats.call(http, "GET", "/api/subscription-status", "subscription-status", headers=headers)
+                next_subscription += subscription_interval
+
+    async def bursts():
+        if args.burst_interval <= 0:
+            return
+        while True:
+            wake = time.perf_counter() + random.expovariate(1 / args.burst_interval)
+            if wake >= deadline:
+                return
+            await asyncio.sleep(wake - time.perf_counter())
+            street_tokens = random.choice(tokens_by_street)
+            raising = random.sample(street_tokens, min(args.burst_size, len(street_tokens)))
+            await asyncio.gather(*[
+                stats.call(
+                    http, "POST", "/api/alerts", "alerts (POST)",
+                    json={"type": random.choice(["roubo", "invasão", "emergência"])},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+                for token in raising
+            ])
+
+    await asyncio.gather(
+        bursts(),
+        *[resident(token) for street_tokens in tokens_by_street for token in street_tokens]
+    )
+
+
+async def saturate(http, tokens_by_street, args):
+    """Closed-loop probe: concurrent clients issue the polling mix back to back"""
+    tokens = [token for street_tokens in tokens_by_street for token in street_tokens]
+    # One subscription check per 180 notification polls, as in the real mix
+    mix_every = int(SUBSCRIPTION_INTERVAL / NOTIFICATION_INTERVAL)
+    deadline = time.perf_counter() + args.saturation_seconds
+    completed = 0
+
+    async def client(index):
+        nonlocal completed
+        i = index
+        while time.perf_counter() < deadline:
+            path = "/api/subscription-status" if i % mix_every == 0 else "/api/emergency-notifications"
+            await http.get(path, headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+            completed += 1
+            i += args.saturation_concurrency
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(index) for index in range(args.saturation_concurrency)])
+    return completed / (time.perf_counter() - started)
+
+
+async def run(args):
+    import httpx
+
+    counter = None
+    if args.url:
+        transport = None
+        base_url = args.url.rstrip("/")
+        lifespan = contextlib.nullcontext()
+    else:
+        server, counter = build_app(args)
+        transport = httpx.ASGITransport(app=server.app)
+        base_url = "http://loadtest"
+        # ASGITransport does not send lifespan events: run startup/shutdown ourselves
+        lifespan = server.app.router.lifespan_context(server.app)
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with lifespan, httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=30) as http:
+        print(f"🏙️  Seeding {args.streets} streets x {args.residents} residents...")
+        if args.url:
+            tokens_by_street = await seed_over_http(http, args.streets, args.residents, args.connections)
+        else:
+            tokens_by_street = await seed_in_process(server, args.streets, args.residents)
+
+        users = args.streets * args.residents
+        print(f"⏱️  Simulating {users} residents for {args.duration}s (time scale x{args.time_scale})...")
+        stats = Stats()
+        commands_before = counter.count if counter else 0
+        started = time.perf_counter()
+        await simulate_city(http, tokens_by_street, args, stats)
+        elapsed = time.perf_counter() - started
+        commands = (counter.count - commands_before) if counter else None
+
+        print(f"\n{'endpoint':<28}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, samples in sorted(stats.latencies.items()):
+            print(f"{name:<28}{len(samples):>10}{stats.errors[name]:>8}"
+                  f"{statistics.median(samples):>10.2f}{percentile(samples, 99):>10.2f}")
+
+        total = stats.total()
+        print(f"\nThroughput: {total / elapsed:.1f} req/s over {elapsed:.1f}s")
+        if commands is not None and total:
+            print(f"MongoDB commands per request: {commands / total:.2f}")
+        elif not args.url:
+            print("MongoDB commands per request: n/a (in-memory backend)")
+
+        print(f"\n🔥 Saturation probe: {args.saturation_concurrency} clients for {args.saturation_seconds}s...")
+        saturated = await saturate(http, tokens_by_street, args)
+        capacity = saturated * args.target_utilization / REQUESTS_PER_USER_PER_SECOND
+        print(f"Saturated throughput: {saturated:.1f} req/s")
+        print(f"Each resident generates {REQUESTS_PER_USER_PER_SECOND:.4f} req/s")
+        print(f"👥 Estimated capacity: {capacity:,.0f} users per worker at {args.target_utilization:.0%} utilization")
+
+        # Before shutdown closes the client
+        if not args.url and server.client is not None:
+            await server.client.drop_database(args.db_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streets", type=int, default=20)
+    parser.add_argument("--residents", type=int, default=20, help="Residents per street")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of simulated city")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Divide polling intervals by this to compress time")
+    parser.add_argument("--burst-interval", type=float, default=10, help="Mean seconds between alert bursts (0 disables)")
+    parser.add_argument("--burst-size", type=int, default=3, help="Residents raising alerts per burst")
+    parser.add_argument("--saturation-seconds", type=float, default=10)
+    parser.add_argument("--saturation-concurrency", type=int, default=64)
+    parser.add_argument("--target-utilization", type=float, default=0.7)
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--url", help="Base URL of a running server; defaults to the in-process ASGI app")
+    parser.add_argument("--backend", choices=["mongo", "memory"], default="mongo", help="In-process data backend")
+    parser.add_argument("--db-name", default="safezone_load_test")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
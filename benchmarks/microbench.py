@@ -0,0 +1,277 @@
+"""
+Microbenchmarks for the per-request CPU work in server.py.
+
+Covers the helpers every request goes through: prepare_for_mongo,
+parse_from_mongo, create_access_token / jwt.decode, User(**doc) validation
+(get_current_user does it on every authenticated call) and building the
+AlertResponse / UserResponse lists returned by the polling and admin routes.
+
+Timings are machine dependent, so each case is stored relative to a fixed
+pure-Python calibration workload measured in the same run. The stored
+baseline (benchmarks/baselines/microbench.json) is therefore comparable
+across laptops and CI runners, and a case fails when its relative cost grows
+by more than --threshold. tests/test_microbench.py runs the check with the
+rest of the test suite.
+
+Usage:
+    python benchmarks/microbench.py                # compare against the baseline
+    python benchmarks/microbench.py --update       # record a new baseline
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import warnings
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "microbench.json"
+DEFAULT_THRESHOLD = 0.35
+LIST_SIZE = 50
+
+
+def load_server():
+    os.environ.setdefault("DATA_BACKEND", "memory")
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def calibration():
+    """Fixed interpreter-bound workload used as the unit of measurement"""
+    total = 0
+    for i in range(200):
+        item = {"id": str(i), "value": i * 3}
+        total += len(f"{item['id']}:{item['value']}")
+    return total
+
+
+def user_document(i=0):
+    now = datetime.now(timezone.utc)
+    return {
+        "id": f"user-{i}",
+        "name": "Maria Silva",
+        "email": f"maria{i}@exemplo.com",
+        "state": "SP",
+        "city": "São Paulo",
+        "neighborhood": "Centro",
+        "street": "Rua das Flores",
+        "number": str(i + 1),
+        "resident_names": ["Maria Silva", "João Silva"],
+        "country_code": "BRA",
+        "is_admin": False,
+        "is_vip": True,
+        "vip_expires_at": (now + timedelta(days=30)).isoformat(),
+        "created_at": now.isoformat(),
+        "last_login": now,
+        "password": "$2b$12$" + "x" * 53,
+    }
+
+
+def alert_document(i=0):
+    return {
+        "id": f"alert-{i}",
+        "type": "roubo",
+        "user_id": f"user-{i}",
+        "user_name": "Maria Silva",
+        "state": "SP",
+        "city": "São Paulo",
+        "neighborhood": "Centro",
+        "street": "Rua das Flores",
+        "number": str(i + 1),
+        "location": None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "is_active": True,
+    }
+
+
+def build_cases(server):
+    """name -> zero-argument callable doing one unit of work"""
+    user_doc = user_document()
+    token = server.create_access_token(data={"sub": user_doc["id"]})
+    user_model = server.User(**server.parse_from_mongo(dict(user_doc)))
+    subscription = server.Subscription(user_id=user_doc["id"], payment_method="pix")
+    alert_docs = [alert_document(i) for i in range(LIST_SIZE)]
+    user_docs = [user_document(i) for i in range(LIST_SIZE)]
+
+    def prepare_for_mongo():
+        server.prepare_for_mongo(subscription.dict())
+
+    def parse_from_mongo():
+        server.parse_from_mongo(dict(user_doc))
+
+    def create_access_token():
+        server.create_access_token(data={"sub": user_doc["id"]})
+
+    def decode_access_token():
+        server.jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM])
+
+    def validate_user():
+        server.User(**server.parse_from_mongo(dict(user_doc)))
+
+    def alert_response_list():
+        server.alert_responses([dict(doc) for doc in alert_docs])
+
+    def user_response_list():
+        # get_profile's response shape, for a page of users
+        [
+            server.UserResponse(
+                id=user["id"],
+                name=user["name"],
+                email=user["email"],
+                state=user.get("state", "SP"),
+                city=user.get("city", "São Paulo"),
+                neighborhood=user["neighborhood"],
+                street=user["street"],
+                number=user["number"],
+                resident_names=user["resident_names"],
+                is_admin=user.get("is_admin", False),
+                is_vip=user.get("is_vip", False),
+                vip_expires_at=user["vip_expires_at"].isoformat() if user.get("vip_expires_at") else None
+            )
+            for user in (server.parse_from_mongo(dict(doc)) for doc in user_docs)
+        ]
+
+    def admin_user_list():
+        server.admin_user_rows([dict(doc) for doc in user_docs])
+
+    def profile_response():
+        server.UserResponse(
+            id=user_model.id,
+            name=user_model.name,
+            email=user_model.email,
+            state=user_model.state,
+            city=user_model.city,
+            neighborhood=user_model.neighborhood,
+            street=user_model.street,
+            number=user_model.number,
+            resident_names=user_model.resident_names,
+            is_admin=user_model.is_admin,
+            is_vip=user_model.is_vip,
+            vip_expires_at=user_model.vip_expires_at.isoformat() if user_model.vip_expires_at else None
+        )
+
+    return {
+        "prepare_for_mongo": prepare_for_mongo,
+        "parse_from_mongo": parse_from_mongo,
+        "create_access_token": create_access_token,
+        "jwt_decode": decode_access_token,
+        "user_validation": validate_user,
+        f"alert_response_list_{LIST_SIZE}": alert_response_list,
+        f"user_response_list_{LIST_SIZE}": user_response_list,
+        f"admin_user_list_{LIST_SIZE}": admin_user_list,
+        "profile_response": profile_response,
+    }
+
+
+def time_per_call(func, repeats, min_time):
+    """Best-of-repeats seconds per call; the minimum filters out scheduler noise"""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeats, number=number)) / number
+
+
+def run(repeats=5, min_time=0.05, names=None):
+    """Measure every case (or only names); returns {"calibration_ns": ..., "cases": {name: {"ns": ..., "relative": ...}}}"""
+    server = load_server()
+    with warnings.catch_warnings():
+        # The routes still use Pydantic's .dict(), so the benchmark does too
+        warnings.simplefilter("ignore", DeprecationWarning)
+        cases = build_cases(server)
+        timings = {}
+        unit = time_per_call(calibration, repeats, min_time)
+        for name, func in cases.items():
+            if names is None or name in names:
+                timings[name] = time_per_call(func, repeats, min_time)
+        # Calibrate again afterwards so a warm-up or frequency shift during the run doesn't skew every ratio
+        unit = min(unit, time_per_call(calibration, repeats, min_time))
+        results = {
+            name: {"ns": round(seconds * 1e9), "relative": round(seconds / unit, 4)}
+            for name, seconds in timings.items()
+        }
+    return {"calibration_ns": round(unit * 1e9), "cases": results}
+
+
+def record_baseline(runs=3, **options):
+    """Median relative cost per case over several runs"""
+    samples = [run(**options) for _ in range(runs)]
+    baseline = samples[len(samples) // 2]
+    for name, result in baseline["cases"].items():
+        ordered = sorted(sample["cases"][name]["relative"] for sample in samples)
+        result["relative"] = ordered[len(ordered) // 2]
+    return baseline
+
+
+def load_baseline(path=BASELINE_PATH):
+    return json.loads(Path(path).read_text())
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Cases whose relative cost grew more than threshold, plus cases missing from the baseline"""
+    regressions = []
+    for name, result in results["cases"].items():
+        expected = baseline["cases"].get(name)
+        if expected is None:
+            regressions.append((name, result["relative"], None))
+        elif result["relative"] > expected["relative"] * (1 + threshold):
+            regressions.append((name, result["relative"], expected["relative"]))
+    return regressions
+
+
+def check(baseline, threshold=DEFAULT_THRESHOLD, retries=2, **options):
+    """
+    Measure against baseline and return (results, regressions). Cases that
+    look regressed are re-measured up to retries times, keeping the best run,
+    so a noisy neighbour on a shared runner doesn't fail the build while a
+    real slowdown still does.
+    """
+    results = run(**options)
+    for _ in range(retries):
+        suspects = [name for name, _, expected in find_regressions(results, baseline, threshold) if expected is not None]
+        if not suspects:
+            break
+        for name, result in run(names=suspects, **options)["cases"].items():
+            if result["relative"] < results["cases"][name]["relative"]:
+                results["cases"][name] = result
+    return results, find_regressions(results, baseline, threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="Write the measured numbers as the new baseline")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed relative slowdown (0.35 = 35%%)")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per timing repeat")
+    args = parser.parse_args()
+
+    options = {"repeats": args.repeats, "min_time": args.min_time}
+    if args.update:
+        results = record_baseline(**options)
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"✅ Baseline written to {args.baseline}")
+        baseline, regressions = results, []
+    else:
+        baseline = load_baseline(args.baseline)
+        results, regressions = check(baseline, args.threshold, **options)
+
+    print(f"calibration: {results['calibration_ns']} ns\n")
+    print(f"{'case':<28}{'ns/op':>12}{'relative':>12}{'baseline':>12}{'change':>10}")
+    for name, result in results["cases"].items():
+        expected = baseline["cases"].get(name, {}).get("relative")
+        change = f"{(result['relative'] / expected - 1) * 100:+.0f}%" if expected else "new"
+        print(f"{name:<28}{result['ns']:>12}{result['relative']:>12}{expected or '-':>12}{change:>10}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} case(s) regressed beyond {args.threshold:.0%} or have no baseline")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -632,6 +632,12 @@ function App() {
       // Play alarm sound if there are new emergency notifications
       if (response.data.length > 0) {
         playAlarmSound();
+        // Acknowledge them so the next poll does not ring the same alarm again
+        await axios.post(`${API}/emergency-notifications/ack`, {
+          alert_ids: response.data.map((notification) => notification.id)
+        }, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
       }
     } catch (error) {
       console.error('Failed to fetch emergency notifications:', error);
@@ -816,6 +822,7 @@ function App() {
       });
       
       const alert = {
+        id: response.data.alert_id,
         type,
         user_name: user.resident_names[0] || user.name,
         street: user.street,
@@ -827,9 +834,31 @@ function App() {
       setActiveAlert(alert);
       setCurrentScreen('alert');
       
-      // Start continuous alerts
-      const interval = setInterval(() => {
-        console.log(`Sending ${type} alert...`);
+      // Heartbeats keep the alert active; the server closes it once they stop
+      const interval = setInterval(async () => {
+        try {
+          await axios.post(`${API}/alerts/${alert.id}/heartbeat`, {}, {
+            headers: { Authorization: `Bearer ${token}` }
+          });
+        } catch (error) {
+          const status = error.response?.status;
+          if (status !== 404 && status !== 409) {
+            // Network hiccup or server busy: the next beat tries again
+            console.error('Error sending alert heartbeat:', error);
+            return;
+          }
+          // The alert is gone (closed by the heartbeat timeout or elsewhere): stop beating and tell the user
+          clearInterval(interval);
+          setAlertInterval(null);
+          setActiveAlert(null);
+          setCurrentScreen('main');
+          fetchAlerts();
+          toast({
+            title: "Alerta encerrado",
+            description: error.response?.data?.detail || "O alerta não está mais ativo",
+            variant: "destructive"
+          });
+        }
       }, 5000);
       setAlertInterval(interval);
       
@@ -848,11 +877,21 @@ function App() {
   };
 
   // Stop alert
-  const stopAlert = () => {
+  const stopAlert = async () => {
     if (alertInterval) {
       clearInterval(alertInterval);
       setAlertInterval(null);
     }
+    if (activeAlert?.id) {
+      try {
+        await axios.put(`${API}/alerts/${activeAlert.id}/stop`, {}, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+      } catch (error) {
+        // Already closed (e.g. by the heartbeat timeout)
+        console.error('Error stopping alert:', error);
+      }
+    }
     setActiveAlert(null);
     setCurrentScreen('main');
     fetchAlerts();
@@ -0,0 +1,127 @@
+import functools
+import inspect
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from pymongo import monitoring
+
+# Run the API against the in-memory repositories: no MongoDB needed
+os.environ.setdefault("DATA_BACKEND", "memory")
+os.environ.setdefault("DB_NAME", "safezone_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from slow_queries import current_request_scope  # noqa: E402
+from repositories import InMemoryRepositories, MongoRepositories, close_mongo_client, create_mongo_client  # noqa: E402
+
+ADMIN_EMAIL = "julio.csds@hotmail.com"
+
+# Set to run the API tests against a real MongoDB (a throwaway database per test)
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+# Connection housekeeping, not round trips issued by a route
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "buildInfo", "endSessions", "saslStart", "saslContinue"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Records database round trips. Against MongoDB it is a PyMongo command
+    listener; on the in-memory backend every outermost repository call
+    counts as one round trip, which is what the Mongo repositories issue.
+    commands only holds round trips made while handling a request, so
+    background work (the outbox dispatcher) does not count against a route;
+    command_documents holds every command.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.command_documents = []
+        self.servers = []
+        self._depth = 0
+
+    def reset(self):
+        self.commands = []
+        self.command_documents = []
+        self.servers = []
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            if current_request_scope.get() is not None:
+                self.commands.append(f"{event.command_name} {event.command.get(event.command_name)}")
+            self.command_documents.append(dict(event.command))
+            self.servers.append("%s:%s" % event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def instrument(self, repositories):
+        """Wrap the repositories' async methods so their calls are recorded"""
+        for attribute, repository in vars(repositories).items():
+            for name, method in inspect.getmembers(repository, inspect.iscoroutinefunction):
+                if not name.startswith("_") and name != "ensure_indexes":
+                    setattr(repository, name, self._counted(f"{attribute}.{name}", method))
+        return repositories
+
+    def _counted(self, label, method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            # Repository methods built on other repository methods are still one round trip
+            if self._depth == 0 and current_request_scope.get() is not None:
+                self.commands.append(label)
+            self._depth += 1
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                self._depth -= 1
+        return wrapper
+
+
+@pytest.fixture
+def db_commands():
+    return CommandCounter()
+
+
+@pytest.fixture
+def api(db_commands):
+    """TestClient over a fresh data store (in memory unless TEST_MONGO_URL is set)"""
+    if TEST_MONGO_URL:
+        mongo_client = create_mongo_client(TEST_MONGO_URL, event_listeners=[db_commands])
+        db_name = f"safezone_test_{uuid.uuid4().hex[:8]}"
+        server.repos = MongoRepositories(mongo_client[db_name])
+    else:
+        server.repos = db_commands.instrument(InMemoryRepositories())
+    with TestClient(server.app) as client:
+        yield client
+        if TEST_MONGO_URL:
+            client.portal.call(mongo_client.drop_database, db_name)
+            client.portal.call(close_mongo_client, mongo_client)
+
+
+def register(api, email, street="Rua das Flores", number="1", name="Maria Silva"):
+    """Register a resident and return auth headers"""
+    response = api.post("/api/register", json={
+        "name": name,
+        "email": email,
+        "password": "senha123",
+        "state": "SP",
+        "city": "São Paulo",
+        "neighborhood": "Centro",
+        "street": street,
+        "number": number,
+        "resident_names": [name]
+    })
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def deliver_notifications(api):
+    """Wait until the emergency notifications queued by create_alert are written and sent"""
+    api.portal.call(server.notification_outbox.drain)
+    api.portal.call(server.notification_dispatcher.drain)
@@ -0,0 +1,235 @@
+import pytest
+
+import server
+
+from .conftest import ADMIN_EMAIL, deliver_notifications, register
+
+
+def test_register_login_and_profile(api):
+    headers = register(api, "maria@exemplo.com")
+
+    duplicate = api.post("/api/register", json={
+        "name": "Outra", "email": "maria@exemplo.com", "password": "x", "state": "SP", "city": "São Paulo",
+        "neighborhood": "Centro", "street": "Rua das Flores", "number": "2", "resident_names": ["Outra"]
+    })
+    assert duplicate.status_code == 400
+
+    login = api.post("/api/login", json={"email": "maria@exemplo.com", "password": "senha123"})
+    assert login.status_code == 200
+    assert api.post("/api/login", json={"email": "maria@exemplo.com", "password": "errada"}).status_code == 401
+
+    profile = api.get("/api/profile", headers=headers).json()
+    assert profile["email"] == "maria@exemplo.com"
+    assert profile["street"] == "Rua das Flores"
+
+
+def test_alert_reaches_street_neighbors_only(api):
+    requester = register(api, "a@exemplo.com")
+    neighbor = register(api, "b@exemplo.com", number="2")
+    other_street = register(api, "c@exemplo.com", street="Rua Outra")
+
+    created = api.post("/api/alerts", json={"type": "roubo"}, headers=requester).json()
+    assert created["notification_sent_to"] == 1
+    deliver_notifications(api)
+
+    assert [alert["id"] for alert in api.get("/api/alerts", headers=neighbor).json()] == [created["alert_id"]]
+    assert api.get("/api/alerts", headers=other_street).json() == []
+    assert len(api.get("/api/emergency-notifications", headers=neighbor).json()) == 1
+    assert api.get("/api/emergency-notifications", headers=requester).json() == []
+
+    assert api.put(f"/api/alerts/{created['alert_id']}/stop", headers=requester).status_code == 200
+    assert api.get("/api/emergency-notifications", headers=neighbor).json() == []
+
+
+def test_acknowledged_notifications_stop_ringing(api):
+    requester = register(api, "a@exemplo.com")
+    neighbor = register(api, "b@exemplo.com", number="2")
+    first = api.post("/api/alerts", json={"type": "roubo"}, headers=requester).json()["alert_id"]
+    second = api.post("/api/alerts", json={"type": "invasão"}, headers=requester).json()["alert_id"]
+    deliver_notifications(api)
+
+    polled = api.get("/api/emergency-notifications", headers=neighbor).json()
+    assert [(item["id"], item["first_delivery"]) for item in polled] == [(second, True), (first, True)]
+    assert [item["first_delivery"] for item in api.get("/api/emergency-notifications", headers=neighbor).json()] == [False, False]
+
+    ack = api.post("/api/emergency-notifications/ack", json={"alert_ids": [first, "unknown"]}, headers=neighbor)
+    assert ack.json() == {"acknowledged": 1}
+    assert [item["id"] for item in api.get("/api/emergency-notifications", headers=neighbor).json()] == [second]
+    # Acknowledgements are per user
+    assert api.post("/api/emergency-notifications/ack", json={"alert_ids": [second]}, headers=requester).json() == {"acknowledged": 0}
+    assert api.post("/api/emergency-notifications/ack", json={"alert_ids": ["x"] * 101}, headers=neighbor).status_code == 400
+
+
+def test_bootstrap_matches_the_separate_endpoints(api):
+    requester = register(api, "a@exemplo.com")
+    neighbor = register(api, "b@exemplo.com", number="2")
+    api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=neighbor)
+    api.post("/api/alerts", json={"type": "roubo"}, headers=requester)
+    deliver_notifications(api)
+
+    bootstrap = api.get("/api/bootstrap", headers=neighbor).json()
+    assert bootstrap == {
+        "profile": api.get("/api/profile", headers=neighbor).json(),
+        "subscription": api.get("/api/subscription-status", headers=neighbor).json(),
+        "alerts": api.get("/api/alerts", headers=neighbor).json(),
+        # The bootstrap was the notification's first delivery
+        "emergency_notifications": [
+            {**notification, "first_delivery": True}
+            for notification in api.get("/api/emergency-notifications", headers=neighbor).json()
+        ],
+    }
+    assert len(bootstrap["emergency_notifications"]) == 1
+    assert bootstrap["subscription"]["status"] == "trial"
+
+
+def test_subscription_trial_and_cancel(api):
+    headers = register(api, "a@exemplo.com")
+
+    assert api.get("/api/subscription-status", headers=headers).json()["status"] == "none"
+    assert api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=headers).status_code == 200
+    assert api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=headers).status_code == 400
+
+    status = api.get("/api/subscription-status", headers=headers).json()
+    assert status["status"] == "trial"
+    assert status["is_blocked"] is False
+
+    assert api.post("/api/cancel-subscription", headers=headers).status_code == 200
+    assert api.get("/api/subscription-status", headers=headers).json()["status"] == "none"
+
+
+def test_help_messages_paginate_and_track_unread(api):
+    admin = register(api, ADMIN_EMAIL)
+    resident = register(api, "a@exemplo.com")
+    for i in range(5):
+        api.post("/api/help", json={"message": f"mensagem {i}"}, headers=resident)
+
+    seen = []
+    params = {"limit": 2}
+    while True:
+        page = api.get("/api/admin/help-messages", params=params, headers=admin)
+        assert page.headers["X-Unread-Count"] == "5"
+        seen += [message["message"] for message in page.json()]
+        if "X-Next-Cursor" not in page.headers:
+            break
+        params["cursor"] = page.headers["X-Next-Cursor"]
+    assert seen == [f"mensagem {i}" for i in reversed(range(5))]
+
+    first_id = api.get("/api/admin/help-messages", headers=admin).json()[0]["id"]
+    for _ in range(2):
+        response = api.put(f"/api/admin/help-messages/{first_id}/respond", json={"response": "ok"}, headers=admin)
+        assert response.status_code == 200
+    assert api.get("/api/admin/help-messages/unread-count", headers=admin).json() == {"unread_count": 4}
+    assert len(api.get("/api/admin/help-messages", params={"status": "resolved"}, headers=admin).json()) == 1
+    assert api.get("/api/admin/stats", headers=admin).json()["pending_help_messages"] == 4
+
+
+def test_bulk_admin_grants_report_per_row(api):
+    admin = register(api, ADMIN_EMAIL)
+    register(api, "a@exemplo.com")
+
+    result = api.post("/api/admin/set-admin/bulk", json={"users": [
+        {"email": "a@exemplo.com", "is_vip": True},
+        {"email": "ninguem@exemplo.com", "is_admin": True}
+    ]}, headers=admin).json()
+    assert [row["status"] for row in result["results"]] == ["updated", "not_found"]
+
+    csv_file = "email,is_admin,is_vip\na@exemplo.com,sim,sim\ninvalido,1,1\n"
+    result = api.post(
+        "/api/admin/set-admin/bulk-csv",
+        files={"file": ("admins.csv", csv_file, "text/csv")},
+        headers=admin
+    ).json()
+    assert [row["status"] for row in result["results"]] == ["updated", "invalid"]
+
+    users = {user["email"]: user for user in api.get("/api/admin/users", headers=admin).json()}
+    assert users["a@exemplo.com"]["is_admin"] is True
+
+
+def test_timeseries_rollups_survive_rebuild(api):
+    admin = register(api, ADMIN_EMAIL)
+    resident = register(api, "a@exemplo.com")
+    api.post("/api/alerts", json={"type": "roubo"}, headers=resident)
+    api.post("/api/alerts", json={"type": "invasão"}, headers=resident)
+
+    def alert_series():
+        api.portal.call(server.rollup_writer.flush)
+        return api.get("/api/admin/timeseries", params={"metric": "alerts"}, headers=admin).json()["series"]
+
+    live = alert_series()
+    assert sorted((point["key"], point["count"]) for point in live) == [("invasão", 1), ("roubo", 1)]
+
+    assert api.post("/api/admin/timeseries/rebuild", headers=admin).status_code == 200
+    assert alert_series() == live
+    # Raw data only keeps each user's last login
+    assert api.post("/api/admin/timeseries/rebuild", params={"metrics": "logins"}, headers=admin).status_code == 400
+
+
+def test_failed_alert_insert_is_not_counted(api, monkeypatch):
+    admin = register(api, ADMIN_EMAIL)
+    resident = register(api, "a@exemplo.com")
+
+    async def failing_insert(alert_dict, outbox_entry):
+        raise ConnectionError("primary unavailable")
+
+    monkeypatch.setattr(server.repos.alerts, "insert_with_outbox", failing_insert)
+    with pytest.raises(ConnectionError):
+        api.post("/api/alerts", json={"type": "roubo"}, headers=resident)
+    api.portal.call(server.rollup_writer.flush)
+    assert api.get("/api/admin/timeseries", params={"metric": "alerts"}, headers=admin).json()["series"] == []
+
+
+def test_rebuild_keeps_subscription_history(api):
+    admin = register(api, ADMIN_EMAIL)
+    resident = register(api, "a@exemplo.com")
+    api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=resident)
+    resident_id = api.get("/api/profile", headers=resident).json()["id"]
+    subscription_id = api.portal.call(server.repos.subscriptions.get_open_for_user, resident_id)["id"]
+    # Buckets of an earlier payment and block; the subscription itself only keeps the latest of each
+    for key in ("active", "blocked"):
+        api.portal.call(server.repos.daily_rollups.increment, "2026-01-15", "subscriptions", "BRA", "SP", key, 1)
+    for _ in range(2):
+        assert api.post("/api/confirm-payment", json={"subscription_id": subscription_id, "payment_method": "pix"},
+                        headers=resident).status_code == 200
+
+    def history():
+        return api.get("/api/admin/timeseries", params={"metric": "subscriptions", "start": "2026-01-01"},
+                       headers=admin).json()["series"]
+
+    before = history()
+    assert {(point["day"], point["key"]) for point in before} >= {("2026-01-15", "active"), ("2026-01-15", "blocked")}
+    assert api.post("/api/admin/timeseries/rebuild", headers=admin).status_code == 200
+    assert api.post("/api/admin/timeseries/rebuild", params={"metrics": "subscriptions"}, headers=admin).status_code == 400
+    assert history() == before
+
+
+def test_metrics_expose_route_latency_and_alert_fanout(api):
+    requester = register(api, "a@exemplo.com")
+    register(api, "b@exemplo.com", number="2")
+    api.post("/api/alerts", json={"type": "roubo"}, headers=requester)
+    api.get("/api/alerts/does-not-exist")
+
+    body = api.get("/metrics").text
+    assert 'safezone_http_request_duration_seconds_count{method="POST",route="/api/alerts",status="200"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert 'safezone_bcrypt_queue_seconds_count{operation="hash"}' in body
+    assert "safezone_alert_fanout_recipients_count" in body
+    assert "safezone_alert_create_seconds_count" in body
+
+
+def test_admins_can_profile_a_request_on_demand(api):
+    admin = register(api, ADMIN_EMAIL)
+    resident = register(api, "a@exemplo.com")
+
+    profiled = api.get("/api/admin/stats", headers={**admin, "X-Profile": "html"})
+    assert profiled.headers["content-type"].startswith("text/html")
+    assert profiled.headers["X-Profiled-Status"] == "200"
+
+    stored = api.get("/api/admin/users", headers={**admin, "X-Profile": "store"})
+    assert len(stored.json()) == 2
+    profile = api.get(f"/api/admin/debug/profiles/{stored.headers['X-Profile-Id']}", headers=admin)
+    assert profile.headers["content-type"].startswith("text/html")
+
+    # Ignored for everyone else
+    ignored = api.get("/api/profile", headers={**resident, "X-Profile": "html"})
+    assert ignored.json()["email"] == "a@exemplo.com"
+    assert "X-Profile-Id" not in api.get("/api/profile", headers={**resident, "X-Profile": "store"}).headers
@@ -0,0 +1,11 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import generate_dataset  # noqa: E402
+
+
+def test_generated_documents_match_the_api_models():
+    # A model change the generator does not follow must fail here, not in a benchmark run
+    generate_dataset.check_shapes()
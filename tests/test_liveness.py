@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import server
+from liveness import AlertSweeper
+from write_behind import TelemetryWriter
+
+from .conftest import register
+
+
+def active_alert_ids(api, headers):
+    return {alert["id"] for alert in api.get("/api/alerts", headers=headers).json() if alert["is_active"]}
+
+
+def test_silent_alerts_are_closed_and_heartbeats_keep_the_others_active(api):
+    requester = register(api, "a@exemplo.com")
+    silent = register(api, "b@exemplo.com", number="2")
+    neighbor = register(api, "c@exemplo.com", number="3")
+    alive_id = api.post("/api/alerts", json={"type": "roubo"}, headers=requester).json()["alert_id"]
+    silent_id = api.post("/api/alerts", json={"type": "invasão"}, headers=silent).json()["alert_id"]
+    sweeper = AlertSweeper(lambda: server.repos.alerts, server.alert_heartbeats, timeout=0.2)
+    time.sleep(0.3)
+
+    for _ in range(3):
+        assert api.post(f"/api/alerts/{alive_id}/heartbeat", headers=requester).status_code == 200
+    # A heartbeat for someone else's alert keeps nothing alive
+    assert api.post(f"/api/alerts/{silent_id}/heartbeat", headers=neighbor).status_code == 404
+    # Coalesced in memory: one pending write per alert
+    assert len(server.alert_heartbeats.pending) == 1
+
+    assert api.portal.call(sweeper.sweep) == 1
+    assert not server.alert_heartbeats.pending
+    assert active_alert_ids(api, neighbor) == {alive_id}
+
+    # Heartbeats for a closed alert do not reopen it, and tell the app it was closed
+    response = api.post(f"/api/alerts/{silent_id}/heartbeat", headers=silent)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Alerta encerrado por falta de sinal"
+    assert api.portal.call(sweeper.sweep) == 0
+    assert active_alert_ids(api, neighbor) == {alive_id}
+
+
+def test_sweep_waits_for_acknowledged_heartbeats_and_skips_when_they_fail():
+    calls = []
+
+    class Alerts:
+        fail = True
+
+        async def record_heartbeats(self, heartbeats, acknowledged=False):
+            calls.append(("record_heartbeats", acknowledged))
+            if self.fail:
+                raise ConnectionError("primary stepped down")
+
+        async def close_stale(self, cutoff, now):
+            calls.append(("close_stale", cutoff))
+            return 0
+
+    alerts = Alerts()
+
+    async def main():
+        heartbeats = TelemetryWriter(alerts.record_heartbeats, name="alert_heartbeats")
+        sweeper = AlertSweeper(lambda: alerts, heartbeats)
+        heartbeats.record(("a1", "u1"), {"last_heartbeat": "now"})
+        await sweeper.sweep()
+        alerts.fail = False
+        heartbeats.record(("a1", "u1"), {"last_heartbeat": "now"})
+        await sweeper.sweep()
+
+    asyncio.run(main())
+    # A failed flush must not be followed by closing alerts whose heartbeats were lost
+    assert [call[0] for call in calls] == ["record_heartbeats", "record_heartbeats", "close_stale"]
+    assert calls[0][1] is True and calls[1][1] is True
@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from loop_monitor import EventLoopWatchdog
+
+
+def test_watchdog_reports_blocking_route_and_stack():
+    async def blocking_handler(scope):
+        time.sleep(0.3)
+
+    async def main():
+        watchdog = EventLoopWatchdog(interval=0.01, threshold=0.1)
+        watchdog.start()
+        await asyncio.sleep(0.05)
+        await blocking_handler({"type": "http", "method": "GET", "path": "/api/admin/users"})
+        await asyncio.sleep(0.05)
+        await watchdog.stop()
+        return list(watchdog.stalls)
+
+    stalls = asyncio.run(main())
+    assert len(stalls) == 1
+    assert stalls[0]["route"] == "GET /api/admin/users"
+    assert stalls[0]["lag_ms"] >= 200
+    assert any("time.sleep(0.3)" in line for line in stalls[0]["stack"])
@@ -0,0 +1,19 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import microbench  # noqa: E402
+
+
+def test_hot_helpers_stay_within_baseline():
+    threshold = float(os.environ.get("MICROBENCH_THRESHOLD", microbench.DEFAULT_THRESHOLD))
+    baseline = microbench.load_baseline()
+    results, regressions = microbench.check(baseline, threshold, repeats=5, min_time=0.05)
+
+    assert set(results["cases"]) == set(baseline["cases"]), "run `python benchmarks/microbench.py --update`"
+    assert not regressions, "\n".join(
+        f"{name}: {relative} vs baseline {expected} (> {threshold:.0%} slower)"
+        for name, relative, expected in regressions
+    )
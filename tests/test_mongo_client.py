@@ -0,0 +1,65 @@
+import pytest
+
+from metrics import MongoPoolMetrics
+from repositories import client_options_from_env, create_mongo_client, stale_read_preference_from_env
+
+
+def test_client_options_come_from_environment():
+    options = client_options_from_env({
+        "MONGO_MAX_POOL_SIZE": "200",
+        "MONGO_MIN_POOL_SIZE": "20",
+        "MONGO_COMPRESSORS": "zstd,snappy",
+        "MONGO_TIMEOUT_MS": "2000",
+        "MONGO_SOCKET_TIMEOUT_MS": "",
+    })
+    assert options == {"maxPoolSize": 200, "minPoolSize": 20, "compressors": "zstd,snappy", "timeoutMS": 2000}
+    assert client_options_from_env({}) == {}
+
+    with pytest.raises(ValueError, match="MONGO_MAX_POOL_SIZE"):
+        client_options_from_env({"MONGO_MAX_POOL_SIZE": "many"})
+
+
+def test_compressors_fail_fast_instead_of_being_dropped(monkeypatch):
+    with pytest.raises(ValueError, match="unknown compressor 'lz4'"):
+        client_options_from_env({"MONGO_COMPRESSORS": "zstd,lz4"})
+
+    import repositories
+    monkeypatch.setitem(repositories.COMPRESSOR_MODULES, "zstd", "safezone_missing_zstandard")
+    with pytest.raises(ValueError, match="zstd needs the safezone_missing_zstandard module"):
+        client_options_from_env({"MONGO_COMPRESSORS": "zstd,snappy"})
+
+
+@pytest.mark.parametrize("driver", ["motor", "pymongo"])
+def test_both_drivers_accept_the_options_and_pool_listener(driver):
+    options = client_options_from_env({"MONGO_MAX_POOL_SIZE": "50", "MONGO_SERVER_SELECTION_TIMEOUT_MS": "500"})
+    client = create_mongo_client("mongodb://localhost:1", driver=driver, event_listeners=[MongoPoolMetrics()], **options)
+    assert client.options.pool_options.max_pool_size == 50
+    assert client.options.server_selection_timeout == 0.5
+
+
+def test_write_concern_tiers():
+    from repositories import MongoRepositories
+
+    client = create_mongo_client("mongodb://localhost:1")
+    repos = MongoRepositories(client["safezone_test"])
+    durable = {"w": "majority", "j": True}
+    assert repos.alerts.collection.write_concern.document == durable
+    assert repos.emergency_notifications.collection.write_concern.document == durable
+    assert repos.subscriptions.collection.write_concern.document == durable
+    assert repos.users.collection.write_concern.acknowledged
+    assert not repos.users.telemetry.write_concern.acknowledged
+
+
+def test_stale_reads_go_to_secondaries_with_bounded_staleness():
+    from repositories import MongoRepositories
+
+    preference = stale_read_preference_from_env({})
+    assert preference.document == {"mode": "secondaryPreferred", "maxStalenessSeconds": 90}
+    assert stale_read_preference_from_env({"MONGO_STALE_READS_MAX_STALENESS_S": "0"}).document == {"mode": "primary"}
+    with pytest.raises(ValueError, match="at least 90"):
+        stale_read_preference_from_env({"MONGO_STALE_READS_MAX_STALENESS_S": "30"})
+
+    repos = MongoRepositories(create_mongo_client("mongodb://localhost:1")["safezone_test"], stale_reads=preference)
+    for repository in [repos.users, repos.subscriptions, repos.alerts, repos.help_messages, repos.daily_rollups]:
+        assert repository.stale_reads.read_preference == preference
+        assert repository.collection.read_preference.mode == 0  # primary
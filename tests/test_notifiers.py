@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import server
+from notifiers import FakeProvider, NotificationDispatcher
+
+from .conftest import deliver_notifications, register
+
+
+def alert_event(target_users, event_id="alert-1"):
+    return {
+        "id": event_id, "type": "emergency_alert", "alert_id": event_id, "alert_type": "roubo",
+        "requester_name": "Maria", "requester_address": "Rua das Flores, 1", "target_users": target_users,
+    }
+
+
+def test_large_street_is_dispatched_within_a_second_under_concurrency_limits():
+    residents = [f"user-{i}" for i in range(1000)]
+    push = FakeProvider("push", latency=0.01, concurrency=50)
+    webhook = FakeProvider("webhook", latency=0.05, concurrency=4, max_batch=500)
+
+    async def no_channels(user_ids):
+        return {}
+
+    async def main():
+        dispatcher = NotificationDispatcher([push, webhook], no_channels)
+        started = time.perf_counter()
+        delivered = await dispatcher.dispatch(alert_event(residents))
+        return delivered, time.perf_counter() - started
+
+    delivered, elapsed = asyncio.run(main())
+    assert delivered == {"push": 1000, "webhook": 1000}
+    assert elapsed < 1
+    assert push.max_in_flight == 50
+    assert [len(recipients) for _, recipients in webhook.sent] == [500, 500]
+
+
+def test_failed_batches_are_retried_and_redelivered_events_skipped():
+    flaky = FakeProvider("flaky", fail_first=2, max_attempts=3, base_backoff=0.01)
+    down = FakeProvider("down", fail_first=10, max_attempts=2, base_backoff=0.01)
+
+    async def no_channels(user_ids):
+        return {}
+
+    async def main():
+        dispatcher = NotificationDispatcher([flaky, down], no_channels)
+        delivered = await dispatcher.dispatch(alert_event(["a"]))
+        # The outbox redelivers events at least once
+        await dispatcher.on_event(alert_event(["a"], "alert-2"))
+        await dispatcher.on_event(alert_event(["a"], "alert-2"))
+        return delivered
+
+    assert asyncio.run(main()) == {"flaky": 1, "down": 0}
+    assert flaky.sent == [("alert-1", ["a"]), ("alert-2", ["a"])]
+    assert down.calls == 4
+
+
+def test_event_failing_before_any_send_is_sent_on_redelivery():
+    sms = FakeProvider("sms", channel="sms")
+    lookups = []
+
+    async def channels(user_ids):
+        lookups.append(user_ids)
+        if len(lookups) == 1:
+            raise ConnectionError("database unavailable")
+        return {"a": {"sms": "+5511999999999"}}
+
+    async def main():
+        dispatcher = NotificationDispatcher([sms], channels)
+        try:
+            await dispatcher.on_event(alert_event(["a"]))
+        except ConnectionError:
+            pass
+        await dispatcher.on_event(alert_event(["a"]))
+
+    asyncio.run(main())
+    assert sms.sent == [("alert-1", ["a"])]
+
+
+def test_slow_providers_do_not_hold_up_the_outbox_handler():
+    slow = FakeProvider("slow", latency=0.3)
+
+    async def no_channels(user_ids):
+        return {}
+
+    async def main():
+        dispatcher = NotificationDispatcher([slow], no_channels)
+        dispatcher.start()
+        started = time.perf_counter()
+        await dispatcher.on_event(alert_event(["a"]))
+        handed_off = time.perf_counter() - started
+        await dispatcher.close()
+        return handed_off
+
+    assert asyncio.run(main()) < 0.1
+    # close() waits for queued events
+    assert slow.sent == [("alert-1", ["a"])]
+
+
+def test_alert_reaches_residents_on_the_channels_they_opted_into(api):
+    requester = register(api, "a@exemplo.com")
+    with_sms = register(api, "b@exemplo.com", number="2")
+    register(api, "c@exemplo.com", number="3")
+    assert api.put("/api/notification-channels", json={"sms": "11999"}, headers=with_sms).status_code == 400
+    assert api.put("/api/notification-channels", json={"sms": "+5511999999999"}, headers=with_sms).json()["channels"] == ["sms"]
+
+    sms = FakeProvider("sms", channel="sms")
+    configured, server.notification_dispatcher.providers = server.notification_dispatcher.providers, [sms]
+    try:
+        alert_id = api.post("/api/alerts", json={"type": "roubo"}, headers=requester).json()["alert_id"]
+        deliver_notifications(api)
+    finally:
+        server.notification_dispatcher.providers = configured
+
+    assert sms.sent == [(alert_id, [api.get("/api/profile", headers=with_sms).json()["id"]])]
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+from outbox import Deduplicator, OutboxDispatcher
+from repositories import InMemoryOutboxRepository
+
+from .conftest import deliver_notifications, register
+
+
+def entry(entry_id):
+    now = datetime.now(timezone.utc)
+    return {"id": entry_id, "status": "pending", "attempts": 0, "created_at": now, "next_attempt_at": now}
+
+
+def test_dispatcher_retries_with_backoff_then_gives_up():
+    outbox = InMemoryOutboxRepository()
+    for entry_id in ["ok", "flaky", "broken"]:
+        outbox.by_id[entry_id] = entry(entry_id)
+    calls = []
+
+    async def handle(item):
+        calls.append(item["id"])
+        if item["id"] == "broken" or (item["id"] == "flaky" and calls.count("flaky") == 1):
+            raise RuntimeError("provider down")
+
+    async def main():
+        dispatcher = OutboxDispatcher(lambda: outbox, handle, batch_size=2, max_attempts=3, base_backoff=0.01)
+        for _ in range(6):
+            await dispatcher.drain()
+            await asyncio.sleep(0.03)
+
+    asyncio.run(main())
+    assert calls.count("ok") == 1
+    assert calls.count("flaky") == 2
+    assert calls.count("broken") == 3
+    # Delivered entries leave the outbox; the one that kept failing stays, marked failed
+    assert list(outbox.by_id) == ["broken"]
+    assert outbox.by_id["broken"]["status"] == "failed"
+    assert outbox.by_id["broken"]["last_error"] == "provider down"
+
+
+def test_deduplicator_skips_redeliveries():
+    seen = Deduplicator(capacity=2)
+    assert seen.first_time("a") and seen.first_time("b")
+    assert not seen.first_time("a")
+    assert seen.first_time("c")
+    # "b" was the least recently seen and has been forgotten
+    assert seen.first_time("b")
+
+
+def test_alert_notification_is_dispatched_once_and_published(api):
+    requester = register(api, "a@exemplo.com")
+    neighbor = register(api, "b@exemplo.com", number="2")
+    requester_id = api.get("/api/profile", headers=requester).json()["id"]
+    events = []
+
+    async def subscriber(event):
+        events.append(event)
+
+    server.push_events.subscribe(subscriber)
+    try:
+        alert_id = api.post("/api/alerts", json={"type": "roubo"}, headers=requester).json()["alert_id"]
+        deliver_notifications(api)
+        # A redelivered entry (e.g. after a dispatcher crash) must not notify twice
+        server.repos.notification_outbox.by_id[alert_id] = {**entry(alert_id), "alert_id": alert_id, "payload": {
+            "alert_type": "roubo", "requester_id": requester_id, "requester_name": "Maria Silva",
+            "requester_address": "", "state": "SP", "city": "São Paulo", "neighborhood": "Centro",
+            "street": "Rua das Flores"
+        }}
+        deliver_notifications(api)
+    finally:
+        server.push_events.subscribers.remove(subscriber)
+
+    assert len(api.get("/api/emergency-notifications", headers=neighbor).json()) == 1
+    assert [event["id"] for event in events] == [alert_id, alert_id]
+    assert events[0]["target_users"] == [api.get("/api/profile", headers=neighbor).json()["id"]]
@@ -0,0 +1,146 @@
+import json
+
+import pytest
+
+import server
+
+from .conftest import ADMIN_EMAIL, deliver_notifications, register
+
+# Database round trips allowed per request, the token's user lookup included.
+# Raise a budget only together with the reason in the comment.
+BUDGETS = {
+    ("GET", "/api/"): 0,
+    ("POST", "/api/register"): 3,  # email check, insert, registrations rollup
+    ("POST", "/api/login"): 2,  # lookup, admin promotion (last_login and the logins rollup are written behind)
+    ("GET", "/api/profile"): 1,
+    ("POST", "/api/create-subscription"): 4,  # open subscription check, insert, subscriptions rollup
+    ("GET", "/api/subscription-status"): 2,
+    ("POST", "/api/confirm-payment"): 4,  # subscription lookup, update, rollup
+    ("POST", "/api/cancel-subscription"): 4,  # open subscription lookup, update, rollup
+    ("POST", "/api/alerts"): 5,  # alert + outbox inserts and commit (one transaction), neighbor count; rollup written behind
+    ("GET", "/api/alerts"): 2,
+    ("PUT", "/api/alerts/{alert_id}/stop"): 2,
+    ("POST", "/api/alerts/{alert_id}/heartbeat"): 2,  # user lookup, alert state; the beat is written by the next flush
+    ("GET", "/api/emergency-notifications"): 4,  # inbox, their active alerts, one bulk write of delivery states
+    ("POST", "/api/emergency-notifications/ack"): 2,
+    ("GET", "/api/bootstrap"): 6,  # one user lookup, then subscription, alerts, emergency-notifications' 3
+    ("PUT", "/api/notification-channels"): 2,
+    ("POST", "/api/help"): 3,  # insert, unread counter
+    ("GET", "/api/admin/stats"): 8,  # one count per statistic, unread counter
+    ("GET", "/api/admin/users"): 2,
+    ("GET", "/api/admin/help-messages"): 3,  # page, unread counter
+    ("GET", "/api/admin/help-messages/unread-count"): 2,
+    ("PUT", "/api/admin/help-messages/{message_id}/respond"): 3,  # resolve, unread counter
+    ("POST", "/api/admin/set-admin"): 3,
+    ("POST", "/api/admin/set-admin/bulk"): 3,  # existing emails, one bulk write per chunk
+    ("POST", "/api/admin/set-admin/bulk-csv"): 3,
+    ("POST", "/api/admin/import-residents"): 3,  # one insert_many per batch, one rollup per (country, state)
+    ("GET", "/api/admin/timeseries"): 2,
+    ("POST", "/api/admin/timeseries/rebuild"): 10,  # per default metric: one $merge per source, swap, distinct, delete, drop
+    ("GET", "/api/admin/debug/slow-queries"): 1,
+    ("GET", "/api/admin/debug/profiles/{profile_id}"): 1,
+}
+
+RESIDENT = {
+    "name": "Ana Souza", "password": "senha123", "state": "SP", "city": "São Paulo",
+    "neighborhood": "Centro", "street": "Rua das Flores", "resident_names": ["Ana Souza"]
+}
+
+
+@pytest.fixture
+def street(api):
+    """A street with an admin, two residents, a subscription, two active alerts, a help message and a stored profile"""
+    admin = register(api, ADMIN_EMAIL, number="10", name="Julio")
+    resident = register(api, "a@exemplo.com")
+    neighbor = register(api, "b@exemplo.com", number="2")
+    api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=resident)
+    alert_id = api.post("/api/alerts", json={"type": "roubo"}, headers=neighbor).json()["alert_id"]
+    api.post("/api/alerts", json={"type": "emergência"}, headers=admin)
+    deliver_notifications(api)
+    api.post("/api/help", json={"message": "Ajuda"}, headers=resident)
+    message_id = api.get("/api/admin/help-messages", headers=admin).json()[0]["id"]
+    profiled = api.get("/api/profile", headers={**admin, "X-Profile": "store"})
+    resident_id = api.get("/api/profile", headers=resident).json()["id"]
+    subscription = api.portal.call(server.repos.subscriptions.get_open_for_user, resident_id)
+    return {
+        "admin": admin, "resident": resident, "neighbor": neighbor,
+        "alert_id": alert_id, "message_id": message_id, "subscription_id": subscription["id"],
+        "profile_id": profiled.headers["X-Profile-Id"],
+    }
+
+
+REQUESTS = {
+    ("GET", "/api/"): lambda api, s: api.get("/api/"),
+    ("POST", "/api/register"): lambda api, s: api.post("/api/register", json={**RESIDENT, "email": "c@exemplo.com", "number": "3"}),
+    ("POST", "/api/login"): lambda api, s: api.post("/api/login", json={"email": ADMIN_EMAIL, "password": "senha123"}),
+    ("GET", "/api/profile"): lambda api, s: api.get("/api/profile", headers=s["resident"]),
+    ("POST", "/api/create-subscription"): lambda api, s: api.post(
+        "/api/create-subscription", json={"payment_method": "pix"}, headers=s["neighbor"]),
+    ("GET", "/api/subscription-status"): lambda api, s: api.get("/api/subscription-status", headers=s["resident"]),
+    ("POST", "/api/confirm-payment"): lambda api, s: api.post(
+        "/api/confirm-payment", json={"subscription_id": s["subscription_id"], "payment_method": "pix"}, headers=s["resident"]),
+    ("POST", "/api/cancel-subscription"): lambda api, s: api.post("/api/cancel-subscription", headers=s["resident"]),
+    ("POST", "/api/alerts"): lambda api, s: api.post("/api/alerts", json={"type": "invasão"}, headers=s["resident"]),
+    ("GET", "/api/alerts"): lambda api, s: api.get("/api/alerts", headers=s["resident"]),
+    ("PUT", "/api/alerts/{alert_id}/stop"): lambda api, s: api.put(f"/api/alerts/{s['alert_id']}/stop", headers=s["neighbor"]),
+    ("POST", "/api/alerts/{alert_id}/heartbeat"): lambda api, s: api.post(
+        f"/api/alerts/{s['alert_id']}/heartbeat", headers=s["neighbor"]),
+    ("GET", "/api/emergency-notifications"): lambda api, s: api.get("/api/emergency-notifications", headers=s["resident"]),
+    ("POST", "/api/emergency-notifications/ack"): lambda api, s: api.post(
+        "/api/emergency-notifications/ack", json={"alert_ids": [s["alert_id"]]}, headers=s["resident"]),
+    ("GET", "/api/bootstrap"): lambda api, s: api.get("/api/bootstrap", headers=s["resident"]),
+    ("PUT", "/api/notification-channels"): lambda api, s: api.put(
+        "/api/notification-channels", json={"sms": "+5511999999999"}, headers=s["resident"]),
+    ("POST", "/api/help"): lambda api, s: api.post("/api/help", json={"message": "Outra"}, headers=s["resident"]),
+    ("GET", "/api/admin/stats"): lambda api, s: api.get("/api/admin/stats", headers=s["admin"]),
+    ("GET", "/api/admin/users"): lambda api, s: api.get("/api/admin/users", headers=s["admin"]),
+    ("GET", "/api/admin/help-messages"): lambda api, s: api.get("/api/admin/help-messages", headers=s["admin"]),
+    ("GET", "/api/admin/help-messages/unread-count"): lambda api, s: api.get(
+        "/api/admin/help-messages/unread-count", headers=s["admin"]),
+    ("PUT", "/api/admin/help-messages/{message_id}/respond"): lambda api, s: api.put(
+        f"/api/admin/help-messages/{s['message_id']}/respond", json={"response": "ok"}, headers=s["admin"]),
+    ("POST", "/api/admin/set-admin"): lambda api, s: api.post(
+        "/api/admin/set-admin", json={"email": "a@exemplo.com", "is_admin": False, "is_vip": True}, headers=s["admin"]),
+    ("POST", "/api/admin/set-admin/bulk"): lambda api, s: api.post("/api/admin/set-admin/bulk", json={"users": [
+        {"email": "a@exemplo.com", "is_vip": True}, {"email": "b@exemplo.com", "is_vip": True},
+        {"email": "nobody@exemplo.com", "is_vip": True},
+    ]}, headers=s["admin"]),
+    ("POST", "/api/admin/set-admin/bulk-csv"): lambda api, s: api.post(
+        "/api/admin/set-admin/bulk-csv", headers=s["admin"],
+        files={"file": ("grants.csv", "email,is_vip\na@exemplo.com,true\nb@exemplo.com,true\n", "text/csv")}),
+    ("POST", "/api/admin/import-residents"): lambda api, s: api.post(
+        "/api/admin/import-residents", headers=s["admin"],
+        files={"file": ("residents.csv", "name,email,password,state,city,neighborhood,street,number\n"
+                        "Ana,d@exemplo.com,senha123,SP,São Paulo,Centro,Rua das Flores,4\n"
+                        "Rui,e@exemplo.com,senha123,SP,São Paulo,Centro,Rua das Flores,5\n", "text/csv")}),
+    ("GET", "/api/admin/timeseries"): lambda api, s: api.get(
+        "/api/admin/timeseries", params={"metric": "alerts"}, headers=s["admin"]),
+    ("POST", "/api/admin/timeseries/rebuild"): lambda api, s: api.post("/api/admin/timeseries/rebuild", headers=s["admin"]),
+    ("GET", "/api/admin/debug/slow-queries"): lambda api, s: api.get("/api/admin/debug/slow-queries", headers=s["admin"]),
+    ("GET", "/api/admin/debug/profiles/{profile_id}"): lambda api, s: api.get(
+        f"/api/admin/debug/profiles/{s['profile_id']}", headers=s["admin"]),
+}
+
+
+def test_every_route_has_a_budget():
+    routes = {
+        (method, route.path)
+        for route in server.app.routes if route.path.startswith("/api")
+        for method in route.methods
+    }
+    assert routes == set(BUDGETS), "declare a round-trip budget for new routes in BUDGETS"
+    assert set(REQUESTS) == set(BUDGETS)
+
+
+@pytest.mark.parametrize("route", list(BUDGETS), ids=[f"{method} {path}" for method, path in BUDGETS])
+def test_route_stays_within_round_trip_budget(api, db_commands, street, route):
+    db_commands.reset()
+    response = REQUESTS[route](api, street)
+    assert response.status_code == 200, response.text
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        assert json.loads(response.text.splitlines()[-1])["inserted"] == 2
+
+    assert len(db_commands.commands) <= BUDGETS[route], (
+        f"{route[0]} {route[1]} made {len(db_commands.commands)} round trips "
+        f"(budget {BUDGETS[route]}): {db_commands.commands}"
+    )
@@ -0,0 +1,161 @@
+import functools
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import server
+
+from .conftest import ADMIN_EMAIL, TEST_MONGO_URL, deliver_notifications, register
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import generate_dataset  # noqa: E402
+
+# explain() needs a real server: run with TEST_MONGO_URL=mongodb://localhost:27017
+pytestmark = pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL is not set")
+
+SEED_USERS = 5000
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Stages that answer a query from an index, the _id fast path or collection metadata
+INDEXED_STAGES = {
+    "IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_IDHACK", "COUNT_SCAN", "DISTINCT_SCAN", "RECORD_STORE_FAST_COUNT"
+}
+# Documents a plan may fetch and then discard on top of what it returns
+DOCS_EXAMINED_SLACK = 5
+# Fields the driver adds to a command that explain does not accept
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "apiVersion", "apiStrict", "apiDeprecationErrors"}
+# Query shapes allowed to scan, with the reason
+EXEMPT = {
+    ("aggregate", "users"): "count_real_users filters test accounts out by regex, for the admin dashboard only",
+}
+
+
+def seed(api):
+    """Load a synthetic city so the planner's choices and docs examined are meaningful"""
+    rng = np.random.default_rng(7)
+    now_us = int(time.time() * 10**6)
+    city = generate_dataset.City(rng, SEED_USERS, 25, 1.2)
+    users = generate_dataset.generate_users(rng, city, SEED_USERS, now_us, 3)
+    subscriptions = generate_dataset.generate_subscriptions(rng, users, now_us)
+    alerts = generate_dataset.generate_alerts(rng, users, SEED_USERS // 5, now_us, 3)
+    sizes = np.bincount(users["street"], minlength=city.count)
+    members = np.split(np.argsort(users["street"], kind="stable"), np.cumsum(sizes)[:-1])
+    alert_docs, notification_docs, inbox_docs = generate_dataset.alert_documents(
+        alerts, users, city, members, 0, len(alerts["id"]), True, rng, now_us
+    )
+
+    db = server.repos.db
+    for collection, documents in {
+        "users": generate_dataset.user_documents(users, city, 0, SEED_USERS, "seeded"),
+        "subscriptions": generate_dataset.subscription_documents(subscriptions, users, 0, len(subscriptions["id"])),
+        "alerts": alert_docs,
+        "emergency_notifications": notification_docs,
+        "notification_inbox": inbox_docs,
+        "help_messages": generate_dataset.help_documents(rng, users, city, SEED_USERS // 10, now_us, 3),
+    }.items():
+        api.portal.call(functools.partial(db[collection].insert_many, documents, ordered=False))
+
+    # The busiest street, where scans hurt most
+    busiest = int(np.argmax(sizes))
+    return {
+        "state": str(city.state[busiest]),
+        "city": str(city.city[busiest]),
+        "neighborhood": str(city.neighborhood[busiest]),
+        "street": str(city.street[busiest]),
+    }
+
+
+def run_hot_paths(api, address):
+    """Exercise the routes whose queries must stay indexed"""
+    headers = []
+    for i in range(2):
+        response = api.post("/api/register", json={
+            **address, "name": f"Morador {i}", "email": f"plan{i}@exemplo.com", "password": "senha123",
+            "number": str(i + 1), "resident_names": [f"Morador {i}"]
+        })
+        assert response.status_code == 200, response.text
+        headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+    resident, neighbor = headers
+    admin = register(api, ADMIN_EMAIL)
+
+    api.post("/api/login", json={"email": "plan0@exemplo.com", "password": "senha123"})
+    api.get("/api/profile", headers=resident)
+    api.post("/api/create-subscription", json={"payment_method": "pix"}, headers=resident)
+    api.get("/api/subscription-status", headers=resident)
+    alert_id = api.post("/api/alerts", json={"type": "roubo"}, headers=neighbor).json()["alert_id"]
+    deliver_notifications(api)
+    api.get("/api/alerts", headers=resident)
+    api.get("/api/emergency-notifications", headers=resident)
+    api.post("/api/emergency-notifications/ack", json={"alert_ids": [alert_id]}, headers=resident)
+    api.put(f"/api/alerts/{alert_id}/stop", headers=neighbor)
+    api.post("/api/help", json={"message": "Ajuda"}, headers=resident)
+
+    api.get("/api/admin/stats", headers=admin)
+    for params in [{}, {"status": "pending"}, {"status": "resolved", "since": "2020-01-01T00:00:00Z"}]:
+        page = api.get("/api/admin/help-messages", params={**params, "limit": 20}, headers=admin)
+        assert page.status_code == 200, page.text
+        if "X-Next-Cursor" in page.headers:
+            api.get("/api/admin/help-messages", params={**params, "limit": 20, "cursor": page.headers["X-Next-Cursor"]}, headers=admin)
+    message_id = api.get("/api/admin/help-messages", params={"status": "pending"}, headers=admin).json()[0]["id"]
+    api.put(f"/api/admin/help-messages/{message_id}/respond", json={"response": "ok"}, headers=admin)
+    api.post("/api/admin/set-admin", json={"email": "plan1@exemplo.com", "is_admin": False, "is_vip": True}, headers=admin)
+    api.get("/api/admin/timeseries", params={"metric": "alerts"}, headers=admin)
+
+
+def walk_plan(node, stages, stats):
+    """Collect stage names and executionStats from every level of an explain document"""
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            stages.add(node["stage"])
+        if isinstance(node.get("executionStats"), dict):
+            stats.append(node["executionStats"])
+        for key, value in node.items():
+            if key != "rejectedPlans":
+                walk_plan(value, stages, stats)
+    elif isinstance(node, list):
+        for value in node:
+            walk_plan(value, stages, stats)
+
+
+def plan_problems(api, command):
+    body = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+    explain = api.portal.call(server.repos.db.command, {"explain": body, "verbosity": "executionStats"})
+    stages, stats = set(), []
+    walk_plan(explain, stages, stats)
+
+    problems = []
+    if "COLLSCAN" in stages or not stages & INDEXED_STAGES:
+        problems.append(f"plan {sorted(stages)}")
+    for execution in stats:
+        allowed = max(execution.get("nReturned", 0), 1) + DOCS_EXAMINED_SLACK
+        if execution.get("totalDocsExamined", 0) > allowed:
+            problems.append(f"examined {execution['totalDocsExamined']} documents to return {execution.get('nReturned', 0)}")
+    return problems
+
+
+def test_hot_queries_use_indexes(api, db_commands):
+    address = seed(api)
+    db_commands.reset()
+    run_hot_paths(api, address)
+
+    shapes = set()
+    failures = []
+    for command in db_commands.command_documents:
+        name = next(iter(command))
+        if name not in EXPLAINABLE_COMMANDS:
+            continue
+        shape = (name, command[name])
+        shapes.add(shape)
+        if shape in EXEMPT:
+            continue
+        for problem in plan_problems(api, command):
+            failures.append(f"{name} {command[name]}: {problem}\n    {command.get('filter') or command.get('pipeline') or command.get('updates') or command.get('query')}")
+
+    # The shapes this check exists for must actually have been explained
+    for shape in [("find", "users"), ("find", "alerts"), ("find", "subscriptions"),
+                  ("find", "notification_inbox"), ("find", "help_messages"), ("aggregate", "subscriptions")]:
+        assert shape in shapes, f"{shape} was not exercised"
+    assert not failures, "\n".join(failures)
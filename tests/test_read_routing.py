@@ -0,0 +1,41 @@
+import pytest
+from pymongo.read_preferences import SecondaryPreferred
+
+import server
+from repositories import MongoRepositories
+
+from .conftest import ADMIN_EMAIL, TEST_MONGO_URL, register
+
+# Needs a replica set with secondaries, e.g. a local three-member set:
+# TEST_MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+pytestmark = pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL is not set")
+
+# Route -> reads it may serve from a secondary, as (command, collection)
+STALE_ROUTES = {
+    "/api/admin/users": {("find", "users")},
+    "/api/admin/stats": {("aggregate", "users"), ("count", "subscriptions"), ("aggregate", "subscriptions"),
+                         ("count", "alerts")},
+    "/api/admin/help-messages": {("find", "help_messages")},
+    "/api/admin/timeseries?metric=alerts": {("find", "daily_rollups")},
+    "/api/alerts": {("find", "alerts")},
+}
+
+
+def test_stale_tolerant_reads_leave_the_primary(api, db_commands):
+    hello = api.portal.call(server.repos.db.command, "hello")
+    if not hello.get("setName") or not hello.get("hosts", [])[1:]:
+        pytest.skip("TEST_MONGO_URL is not a replica set with secondaries")
+    server.repos = MongoRepositories(server.repos.db, stale_reads=SecondaryPreferred(max_staleness=90))
+    admin = register(api, ADMIN_EMAIL)
+
+    for route, stale in STALE_ROUTES.items():
+        db_commands.reset()
+        assert api.get(route, headers=admin).status_code == 200
+        for document, address in zip(db_commands.command_documents, db_commands.servers):
+            name = next(iter(document))
+            shape = (name, document[name])
+            if shape in stale:
+                assert address != hello["primary"], f"{route}: {shape} was read from the primary"
+            elif name in ("find", "aggregate", "count"):
+                # The token's user lookup and everything else stays on the primary
+                assert address == hello["primary"], f"{route}: {shape} was read from {address}"
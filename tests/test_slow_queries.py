@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from slow_queries import SlowQueryLog, current_request_scope
+
+
+def run_command(log, request_id, command, duration_ms):
+    name = next(iter(command))
+    log.started(SimpleNamespace(command_name=name, command=command, request_id=request_id, database_name="safezone"))
+    log.succeeded(SimpleNamespace(command_name=name, request_id=request_id, duration_micros=int(duration_ms * 1000)))
+
+
+def test_slow_commands_are_grouped_by_route_and_redacted_shape():
+    log = SlowQueryLog(threshold_ms=50, explain_sample_rate=0)
+    token = current_request_scope.set({"type": "http", "method": "GET", "path": "/api/admin/stats"})
+    try:
+        for i, email in enumerate(["a@exemplo.com", "b@exemplo.com"]):
+            run_command(log, i, {"find": "users", "filter": {"email": email, "is_vip": {"$in": [True]}}}, 120)
+        run_command(log, 3, {"find": "users", "filter": {"id": "x"}}, 1)
+    finally:
+        current_request_scope.reset(token)
+
+    [entry] = log.report(10)
+    assert entry["route"] == "GET /api/admin/stats"
+    assert entry["shape"]["filter"] == {"email": "?", "is_vip": {"$in": "?"}}
+    assert entry["count"] == 2
+    assert entry["avg_ms"] == 120.0
+    assert "exemplo" not in str(entry)
@@ -0,0 +1,73 @@
+import asyncio
+
+import server
+from write_behind import TelemetryWriter
+
+from .conftest import register
+
+
+def test_writer_coalesces_batches_and_bounds_memory():
+    batches = []
+
+    async def apply(updates):
+        batches.append(updates)
+
+    async def main():
+        writer = TelemetryWriter(apply, flush_interval=10, max_batch=2, max_pending=3)
+        writer.start()
+        writer.record("u1", {"last_login": 1})
+        writer.record("u1", {"last_login": 2})
+        assert batches == []
+        # A full batch flushes without waiting for the interval
+        writer.record("u2", {"last_login": 1})
+        await asyncio.sleep(0.01)
+        assert batches == [{"u1": {"last_login": 2}, "u2": {"last_login": 1}}]
+
+        for user_id in ["u3", "u4", "u5"]:
+            writer.pending[user_id] = {"last_login": 1}
+        assert writer.record("u6", {"last_login": 1}) is False
+        assert writer.record("u3", {"last_login": 3}) is True
+        # Shutdown flushes what is left, max_batch users per write
+        await writer.stop()
+
+    asyncio.run(main())
+    assert batches[1:] == [{"u3": {"last_login": 3}, "u4": {"last_login": 1}}, {"u5": {"last_login": 1}}]
+
+
+def test_stop_during_a_slow_flush_loses_nothing():
+    written = {}
+
+    async def slow_apply(updates):
+        await asyncio.sleep(0.1)
+        written.update(updates)
+
+    async def main():
+        writer = TelemetryWriter(slow_apply, flush_interval=10, max_batch=2)
+        writer.start()
+        for user_id in ["u1", "u2", "u3"]:
+            writer.record(user_id, {"last_login": 1})
+        # The full batch is being written when shutdown starts
+        await asyncio.sleep(0.01)
+        assert len(writer.pending) == 1
+        await writer.stop()
+
+    asyncio.run(main())
+    assert set(written) == {"u1", "u2", "u3"}
+
+
+def test_login_updates_last_login_once_flushed(api):
+    register(api, "maria@exemplo.com")
+    assert api.post("/api/login", json={"email": "maria@exemplo.com", "password": "senha123"}).status_code == 200
+    api.portal.call(server.telemetry_writer.flush)
+    assert api.portal.call(server.repos.users.get_by_email, "maria@exemplo.com")["last_login"] is not None
+
+
+def test_logins_rollup_is_summed_per_bucket_and_written_behind(api):
+    register(api, "maria@exemplo.com")
+    for _ in range(3):
+        api.post("/api/login", json={"email": "maria@exemplo.com", "password": "senha123"})
+    assert len(server.rollup_writer.pending) == 1
+    api.portal.call(server.rollup_writer.flush)
+    day = server.rollup_day(server.datetime.now(server.timezone.utc))
+    buckets = api.portal.call(server.repos.daily_rollups.find_range, "logins", day, day)
+    assert [bucket["count"] for bucket in buckets] == [3]